@@ -1,13 +1,26 @@
 # booking_api/admin.py
 
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 # Импортируем НОВЫЕ модели
 from .models import (
     Organization, Employee, Service, Client,
-    Appointment, EmployeeSchedule, ScheduleException, TimeBlocker
+    Appointment, AppointmentArchive, EmployeeSchedule, ScheduleException, TimeBlocker,
+    ReminderOffset,
 )
-from datetime import timedelta
+from .forms import CopyWeekTemplateForm, RecurringBlockerForm, ScheduleExceptionRangeForm
+from .schedules import apply_schedule_exception, copy_week_template, stamp_recurring_blocker
+from .week_grid import build_week_grid
+from datetime import datetime, timedelta
 
 
 # --- Вспомогательные функции для отображения ЧЧ:ММ ---
@@ -20,8 +33,35 @@ def format_minutes_to_time(minutes):
     return f"{h:02d}:{m:02d}"
 
 
+# --- Фильтр по мастеру без запроса на каждый вариант ---
+class EmployeeListFilter(admin.RelatedFieldListFilter):
+    """
+    Стандартный фильтр по FK строит варианты через str(employee), а Employee.__str__
+    читает организацию — запрос на каждого мастера. Здесь организация загружается сразу.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin) or ('name',)
+        employees = Employee.objects.select_related('organization').order_by(*ordering)
+        return [(employee.pk, str(employee)) for employee in employees]
+
+
+class EmployeeSelectRelatedMixin:
+    """Выпадающие списки мастеров в формах: str(employee) без запроса организации по строке."""
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.related_model is Employee and 'queryset' not in kwargs:
+            kwargs['queryset'] = Employee.objects.select_related('organization')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.related_model is Employee and 'queryset' not in kwargs:
+            kwargs['queryset'] = Employee.objects.select_related('organization')
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
+
 # --- 1. Встраивание Шаблона Расписания (EmployeeSchedule) в Мастера ---
-class EmployeeScheduleInline(admin.TabularInline):
+class EmployeeScheduleInline(EmployeeSelectRelatedMixin, admin.TabularInline):
     model = EmployeeSchedule
     extra = 0  # Не показывать пустые формы по умолчанию
     min_num = 0
@@ -36,34 +76,195 @@ class EmployeeScheduleInline(admin.TabularInline):
 
 # --- Настройка отображения моделей в админ-панели ---
 
+# --- Встраивание настроек напоминаний клиентам в Организацию ---
+class ReminderOffsetInline(admin.TabularInline):
+    model = ReminderOffset
+    extra = 0
+    verbose_name = "Напоминание клиенту"
+    verbose_name_plural = "Напоминания клиентам (если пусто — по умолчанию из настроек)"
+    fields = ('offset',)
+
+
 @admin.register(Organization)
 class OrganizationAdmin(admin.ModelAdmin):
-    list_display = ('name', 'segment_name', 'address')
+    list_display = ('name', 'segment_name', 'address', 'employees_count', 'services_count')
     search_fields = ('name',)
+    inlines = [ReminderOffsetInline]
+
+    @staticmethod
+    def _count_subquery(model):
+        # Отдельный подзапрос на счетчик: два JOIN в одном запросе перемножили бы строки мастеров и услуг
+        counts = model.objects.filter(organization=OuterRef('pk')).order_by().values('organization').annotate(
+            total=Count('pk')).values('total')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    def get_queryset(self, request):
+        # Счетчики — подзапросами агрегации в том же SELECT, а не запросом на строку
+        return super().get_queryset(request).annotate(
+            employees_total=self._count_subquery(Employee),
+            services_total=self._count_subquery(Service),
+        )
+
+    def employees_count(self, obj):
+        return obj.employees_total
+
+    employees_count.short_description = 'Мастеров'
+    employees_count.admin_order_field = 'employees_total'
+
+    def services_count(self, obj):
+        return obj.services_total
+
+    services_count.short_description = 'Услуг'
+    services_count.admin_order_field = 'services_total'
 
 
 # --- Employee (ОБНОВЛЕНО: ДОБАВЛЕН ИНЛАЙН) ---
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'organization', 'telegram_chat_id')
-    list_filter = ('organization',)
+    list_display = ('name', 'organization', 'telegram_chat_id', 'notification_mode', 'services_count')
+    list_filter = ('organization', 'notification_mode')
     search_fields = ('name', 'telegram_chat_id')
     fieldsets = (
         (None, {
             'fields': ('organization', 'name')
         }),
         ('Интеграция', {
-            'fields': ('telegram_chat_id',),
-            'description': 'Chat ID используется для отправки мгновенных уведомлений о новых записях.'
+            'fields': ('telegram_chat_id', 'notification_mode', 'digest_time'),
+            'description': 'Chat ID используется для отправки уведомлений о новых записях: '
+                           'сразу, пачкой за короткое окно или ежедневной сводкой в указанное время.'
         }),
     )
     # ИНТЕГРАЦИЯ ШАБЛОНА
     inlines = [EmployeeScheduleInline]
+    actions = ['show_week_grid_action', 'copy_week_template_action', 'apply_exception_action', 'stamp_blocker_action']
+
+    def get_queryset(self, request):
+        # Employee.__str__ читает организацию: и в списке, и в выдаче автодополнения других админок
+        return super().get_queryset(request).select_related('organization').annotate(
+            services_total=Count('services', distinct=True),
+        )
+
+    def services_count(self, obj):
+        return obj.services_total
+
+    services_count.short_description = 'Услуг'
+    services_count.admin_order_field = 'services_total'
+
+    # --- Неделя мастеров: работа, блокировки и записи на одной сетке (booking_api.week_grid) ---
+    def get_urls(self):
+        return [
+            path('week/', self.admin_site.admin_view(self.week_grid_view), name='booking_api_employee_week'),
+        ] + super().get_urls()
+
+    def week_grid_view(self, request):
+        """
+        ?employee=1,2 — выбранные мастера, ?organization=ID — все мастера организации;
+        ?week=YYYY-MM-DD — любая дата недели (по умолчанию текущая).
+        """
+        # admin_view проверяет только is_staff; сетка показывает расписания и клиентов записей
+        if not self.has_view_permission(request) or \
+                not self.admin_site._registry[Appointment].has_view_permission(request):
+            raise PermissionDenied
+        try:
+            day = datetime.strptime(request.GET['week'], '%Y-%m-%d').date() if request.GET.get('week') \
+                else timezone.localdate()
+            employee_ids = [int(value) for value in request.GET.get('employee', '').split(',') if value]
+            organization_id = int(request.GET['organization']) if request.GET.get('organization') else None
+        except ValueError:
+            self.message_user(request, "Неверные параметры недели.", messages.ERROR)
+            return HttpResponseRedirect(reverse('admin:booking_api_employee_changelist'))
+        week_start = day - timedelta(days=day.weekday())
+
+        employees = Employee.objects.select_related('organization').order_by('organization__name', 'name')
+        if employee_ids:
+            employees = employees.filter(pk__in=employee_ids)
+        if organization_id:
+            employees = employees.filter(organization_id=organization_id)
+        if not employee_ids and not organization_id:
+            employees = employees.none()
+
+        query = request.GET.copy()
+        links = {}
+        for name, target in (('previous', week_start - timedelta(days=7)), ('next', week_start + timedelta(days=7)),
+                             ('current', timezone.localdate())):
+            query['week'] = target.isoformat()
+            links[name] = f"?{query.urlencode()}"
+
+        return TemplateResponse(request, 'admin/booking_api/employee/week_grid.html', {
+            **self.admin_site.each_context(request),
+            'title': f"Неделя {week_start.strftime('%d.%m.%Y')} — {(week_start + timedelta(days=6)).strftime('%d.%m.%Y')}",
+            'opts': self.model._meta,
+            'grid': build_week_grid(list(employees), week_start),
+            'organizations': Organization.objects.order_by('name'),
+            'organization_id': organization_id,
+            'week_start': week_start,
+            'links': links,
+        })
+
+    def show_week_grid_action(self, request, queryset):
+        ids = ",".join(str(pk) for pk in queryset.values_list('pk', flat=True))
+        return HttpResponseRedirect(f"{reverse('admin:booking_api_employee_week')}?employee={ids}")
+
+    show_week_grid_action.short_description = "Показать неделю выбранных мастеров"
+
+    # --- Массовые действия с расписанием (booking_api.schedules): одна транзакция на пакет ---
+    def _bulk_schedule_action(self, request, queryset, form_class, title, operation):
+        """Промежуточная страница с формой; после отправки формы выполняет operation(employee_ids, data)."""
+        if 'apply' in request.POST:
+            form = form_class(request.POST)
+            if form.is_valid():
+                employee_ids = list(queryset.values_list('pk', flat=True))
+                try:
+                    self.message_user(request, operation(employee_ids, form.cleaned_data), messages.SUCCESS)
+                except ValidationError as e:
+                    self.message_user(request, "; ".join(e.messages), messages.ERROR)
+                except IntegrityError:
+                    self.message_user(request, "Расписание этих мастеров одновременно изменяется. Повторите попытку.",
+                                      messages.ERROR)
+                return None
+        else:
+            form = form_class()
+
+        return TemplateResponse(request, 'admin/booking_api/employee/schedule_bulk_action.html', {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+            'employees': queryset,
+            'action': request.POST.get('action'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    def copy_week_template_action(self, request, queryset):
+        def operation(employee_ids, data):
+            created, updated, deleted = copy_week_template(data['source_employee'], employee_ids, data['replace'])
+            return f"Шаблон скопирован: создано {created}, изменено {updated}, удалено {deleted} дней."
+        return self._bulk_schedule_action(request, queryset, CopyWeekTemplateForm,
+                                          "Копирование шаблона недели", operation)
+
+    copy_week_template_action.short_description = "Скопировать шаблон недели выбранным мастерам"
+
+    def apply_exception_action(self, request, queryset):
+        def operation(employee_ids, data):
+            created, updated = apply_schedule_exception(employee_ids, **data)
+            return f"Исключения: создано {created}, перезаписано {updated}."
+        return self._bulk_schedule_action(request, queryset, ScheduleExceptionRangeForm,
+                                          "Исключение в расписании на период", operation)
+
+    apply_exception_action.short_description = "Выходной / другие часы на период"
+
+    def stamp_blocker_action(self, request, queryset):
+        def operation(employee_ids, data):
+            return f"Создано блокировок: {stamp_recurring_blocker(employee_ids, **data)}."
+        return self._bulk_schedule_action(request, queryset, RecurringBlockerForm,
+                                          "Повторяющаяся блокировка", operation)
+
+    stamp_blocker_action.short_description = "Повторяющаяся блокировка времени на период"
 
 
 # --- Service (Каталог Услуг) ---
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
+class ServiceAdmin(EmployeeSelectRelatedMixin, admin.ModelAdmin):
     list_display = (
         'name',
         'organization',
@@ -78,6 +279,7 @@ class ServiceAdmin(admin.ModelAdmin):
     list_filter = ('organization', 'is_active', 'category')
     search_fields = ('name', 'description')
     filter_horizontal = ('employees',)
+    list_select_related = ('organization',)
 
     fieldsets = (
         (None, {
@@ -97,6 +299,12 @@ class ServiceAdmin(admin.ModelAdmin):
 
     total_duration_display.short_description = 'Общая Длительность'
 
+    def get_queryset(self, request):
+        # Мастера всех услуг страницы — одним дополнительным запросом (только имена)
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('employees', queryset=Employee.objects.only('id', 'name').order_by('name'))
+        )
+
     def get_employees_list(self, obj):
         return ", ".join([e.name for e in obj.employees.all()])
 
@@ -105,13 +313,22 @@ class ServiceAdmin(admin.ModelAdmin):
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'phone_number')
-    search_fields = ('name', 'phone_number')
+    list_display = ('name', 'phone_number', 'phone_e164', 'appointments_count')
+    search_fields = ('name', 'phone_number', 'phone_e164')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(appointments_total=Count('appointment'))
+
+    def appointments_count(self, obj):
+        return obj.appointments_total
+
+    appointments_count.short_description = 'Записей'
+    appointments_count.admin_order_field = 'appointments_total'
 
 
 # --- Appointment (Записи) ---
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(EmployeeSelectRelatedMixin, admin.ModelAdmin):
     list_display = (
         'client',
         'employee',
@@ -123,9 +340,13 @@ class AppointmentAdmin(admin.ModelAdmin):
         'actual_duration_display',
         'client_chat_id'
     )
-    list_filter = ('organization', 'status', 'employee')
+    list_filter = ('organization', 'status', ('employee', EmployeeListFilter))
     search_fields = ('client__name', 'employee__name', 'service__name')
     date_hierarchy = 'start_time'
+    # Колонки client/employee/service и actual_price/actual_duration (читают service) — без запроса на строку
+    list_select_related = ('organization', 'client', 'employee__organization', 'service')
+    # Клиентов и записей много: выбор через поиск вместо выпадающего списка на всю таблицу
+    autocomplete_fields = ('client', 'employee', 'service')
 
     actions = ['delete_selected']
     fieldsets = (
@@ -156,6 +377,22 @@ class AppointmentAdmin(admin.ModelAdmin):
     actual_price_display.short_description = 'Фактическая Цена'
 
 
+@admin.register(AppointmentArchive)
+class AppointmentArchiveAdmin(admin.ModelAdmin):
+    """Архив только для просмотра: записи сюда переносит booking_api.archive."""
+    list_display = ('id', 'client', 'employee', 'service', 'start_time', 'status', 'archived_at')
+    list_filter = ('organization', 'status')
+    search_fields = ('client__name', 'employee__name', 'service__name')
+    date_hierarchy = 'start_time'
+    list_select_related = ('client', 'employee__organization', 'service')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # --- EmployeeSchedule (Базовый Шаблон) ---
 # Эта модель теперь не регистрируется с @admin.register, так как она встроена (Inline),
 # но для возможности прямого просмотра или если вы захотите ее оставить,
@@ -163,7 +400,9 @@ class AppointmentAdmin(admin.ModelAdmin):
 @admin.register(EmployeeSchedule)
 class EmployeeScheduleAdmin(admin.ModelAdmin):
     list_display = ('employee', 'day_of_week', 'start_minutes_display', 'end_minutes_display')
-    list_filter = ('employee', 'day_of_week')
+    list_filter = (('employee', EmployeeListFilter), 'day_of_week')
+    list_select_related = ('employee__organization',)
+    autocomplete_fields = ('employee',)
 
     def start_minutes_display(self, obj):
         return format_minutes_to_time(obj.start_minutes)
@@ -184,9 +423,11 @@ class EmployeeScheduleAdmin(admin.ModelAdmin):
 @admin.register(ScheduleException)
 class ScheduleExceptionAdmin(admin.ModelAdmin):
     list_display = ('employee', 'date', 'is_day_off', 'new_hours_display')
-    list_filter = ('employee', 'date')
+    list_filter = (('employee', EmployeeListFilter), 'date')
     date_hierarchy = 'date'
     search_fields = ('employee__name',)
+    list_select_related = ('employee__organization',)
+    autocomplete_fields = ('employee',)
 
     fieldsets = (
         (None, {
@@ -221,9 +462,11 @@ class ScheduleExceptionAdmin(admin.ModelAdmin):
 @admin.register(TimeBlocker)
 class TimeBlockerAdmin(admin.ModelAdmin):
     list_display = ('employee', 'date', 'start_time_display', 'end_time_display', 'reason')
-    list_filter = ('employee', 'date')
+    list_filter = (('employee', EmployeeListFilter), 'date')
     date_hierarchy = 'date'
     search_fields = ('employee__name', 'reason')
+    list_select_related = ('employee__organization',)
+    autocomplete_fields = ('employee',)
 
     fieldsets = (
         (None, {
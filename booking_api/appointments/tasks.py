@@ -1,25 +1,79 @@
 from celery import shared_task
-from django.core.management import call_command
 import logging
 
+from booking_api.reminders import sweep_client_reminders, send_scheduled_client_reminder
+from booking_api.notifications import flush_pending_master_notifications, send_master_digests
+from booking_api.archive import archive_appointments
+
 # Настройка логирования для задач Celery
 logger = logging.getLogger(__name__)
 
 
+@shared_task
+def send_client_reminder(appointment_id, offset_seconds, expected_start_ts):
+    """
+    Celery Task: Отправляет напоминание по одной записи.
+
+    Ставится при бронировании, по задаче на каждое смещение организации,
+    с ETA = start_time - offset (см. booking_api.signals). Если запись перенесли или отменили, задача отзывается,
+    а если отзыв не дошел — сама задача увидит расхождение и ничего не отправит.
+    """
+    return send_scheduled_client_reminder(appointment_id, offset_seconds, expected_start_ts)
+
+
 @shared_task
 def send_appointment_reminders():
     """
-    Celery Task: Запускает Django Management Command 'send_reminders'.
+    Celery Task: Сверочный обход напоминаний.
 
-    Эта функция будет вызываться по расписанию Celery Beat (например, каждый час).
-    Она изолирует Celery от деталей реализации команды.
+    Основная доставка идет через send_client_reminder, поэтому задачу достаточно
+    запускать по расписанию Celery Beat редко (например, раз в час): она подбирает
+    только напоминания, потерянные запланированными задачами.
     """
     logger.info("-> Запуск задачи send_appointment_reminders...")
     try:
-        # call_command — это встроенный в Django способ вызова любой management command
-        # по её имени ('send_reminders' в данном случае).
-        call_command('send_reminders')
-        logger.info("-> Задача send_appointment_reminders завершена успешно.")
+        sent = sweep_client_reminders()
+        logger.info(f"-> Задача send_appointment_reminders завершена успешно. Отправлено: {sent}.")
+    except Exception as e:
+        logger.error(f"-> Ошибка при сверке напоминаний: {e}")
+
+
+@shared_task
+def flush_master_notifications(employee_id, since_id=None):
+    """
+    Celery Task: Отправляет мастеру (режим DEBOUNCE) одним сообщением все записи,
+    накопившиеся за окно MASTER_NOTIFY_DEBOUNCE_SECONDS, начиная с записи since_id.
+    """
+    return flush_pending_master_notifications(employee_id, since_id)
+
+
+@shared_task
+def send_daily_master_digests():
+    """
+    Celery Task: Ежедневные сводки расписания мастерам (режим DAILY).
+
+    Запускается Celery Beat часто (например, каждые 5 минут): каждому мастеру сводка
+    уходит один раз, как только наступает его digest_time.
+    """
+    logger.info("-> Запуск задачи send_daily_master_digests...")
+    try:
+        sent = send_master_digests()
+        logger.info(f"-> Сводок отправлено: {sent}.")
+    except Exception as e:
+        logger.error(f"-> Ошибка при отправке сводок мастерам: {e}")
+
+
+@shared_task
+def archive_old_appointments():
+    """
+    Celery Task: Переносит старые завершенные и отмененные записи в AppointmentArchive.
+
+    Запускается Celery Beat раз в сутки (ночью): рабочая таблица записей остается
+    ограниченной по размеру, история доступна через ?include_archived=1.
+    """
+    logger.info("-> Запуск задачи archive_old_appointments...")
+    try:
+        moved = archive_appointments()
+        logger.info(f"-> Перенесено в архив записей: {moved}.")
     except Exception as e:
-        # Логирование ошибок, если команда не смогла запуститься или упала
-        logger.error(f"-> Ошибка при запуске send_reminders: {e}")
+        logger.error(f"-> Ошибка при архивации записей: {e}")
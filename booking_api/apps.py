@@ -0,0 +1,13 @@
+# booking_api/apps.py
+
+from django.apps import AppConfig
+
+
+class BookingApiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'booking_api'
+    verbose_name = "Бронирование"
+
+    def ready(self):
+        # Регистрация обработчиков сигналов моделей
+        from . import signals  # noqa: F401
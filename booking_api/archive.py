@@ -0,0 +1,75 @@
+# booking_api/archive.py
+
+import contextvars
+import logging
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, AppointmentArchive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_STATUSES = ('COMPLETED', 'CANCELLED')
+
+# Пока идет перенос, удаление записи из Appointment — не отмена и не удаление:
+# сигналы не уменьшают DailyStats и не трогают напоминания (см. booking_api.signals)
+_archiving = contextvars.ContextVar('appointment_archiving', default=False)
+
+
+def is_archiving():
+    return _archiving.get()
+
+
+@contextmanager
+def archiving():
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def archive_cutoff(now=None):
+    """Записи, начавшиеся раньше этого момента, считаются холодными."""
+    days = getattr(settings, 'APPOINTMENT_ARCHIVE_AFTER_DAYS', 180)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_appointments(now=None, batch_size=None, max_batches=None):
+    """
+    Переносит завершенные и отмененные записи старше archive_cutoff() в AppointmentArchive.
+
+    Каждая пачка (APPOINTMENT_ARCHIVE_BATCH_SIZE строк, по умолчанию 1000) — отдельная короткая
+    транзакция: вставка в архив и удаление из Appointment либо проходят вместе, либо не проходят,
+    а блокировки не держатся на время всего переноса. Выборка идет по индексу (status, start_time).
+    Возвращает число перенесенных записей.
+    """
+    cutoff = archive_cutoff(now)
+    batch_size = batch_size or getattr(settings, 'APPOINTMENT_ARCHIVE_BATCH_SIZE', 1000)
+    moved = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic(), archiving():
+            rows = list(
+                Appointment.objects.select_for_update(skip_locked=True)
+                .filter(status__in=ARCHIVED_STATUSES, start_time__lt=cutoff)
+                .order_by('start_time', 'id')
+                .values(*AppointmentArchive.COPIED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            AppointmentArchive.objects.bulk_create(
+                [AppointmentArchive(**row) for row in rows], ignore_conflicts=True
+            )
+            Appointment.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+
+        moved += len(rows)
+        batches += 1
+        logger.info(f"Архив записей: перенесено {len(rows)} (всего {moved}), граница {cutoff.isoformat()}.")
+
+    return moved
@@ -0,0 +1,88 @@
+# booking_api/catalog.py
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .models import Employee, Service
+from .renderers import fast_dumps
+
+DEFAULT_CATEGORY = 'Без категории'
+
+
+def telegram_catalog_version_key(organization_id):
+    return f"telegram_catalog_version:{organization_id}"
+
+
+def telegram_catalog_cache_key(organization_id, version):
+    return f"telegram_catalog:{organization_id}:{version}"
+
+
+def _new_catalog_version():
+    # Не счетчик с 1: после вытеснения ключа версии из кэша старый каталог не должен снова совпасть
+    return time.time_ns()
+
+
+def get_telegram_catalog_version(organization_id):
+    key = telegram_catalog_version_key(organization_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_catalog_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def build_telegram_catalog(organization_id):
+    """
+    Каталог активных услуг организации, сгруппированный по категориям.
+    Один запрос на услуги и один prefetch на мастеров — независимо от числа услуг.
+    """
+    services = Service.objects.filter(
+        organization_id=organization_id, is_active=True
+    ).order_by('category', 'name').prefetch_related(
+        Prefetch('employees', queryset=Employee.objects.only('id').order_by('id'))
+    )
+
+    categorized_data = {}
+    for service in services:
+        category = service.category or DEFAULT_CATEGORY
+        categorized_data.setdefault(category, []).append({
+            'id': service.id,
+            'name': service.name,
+            'category': category,
+            'price': float(service.base_price),
+            'duration_minutes': service.base_duration,
+            'total_time_minutes': service.total_duration,
+            'employee_ids': [employee.id for employee in service.employees.all()],  # Список доступных мастеров
+        })
+    return categorized_data
+
+
+def get_telegram_catalog_payload(organization_id):
+    """
+    Возвращает (JSON в bytes, ETag) каталога. Готовый JSON хранится в кэше под ключом
+    с версией каталога организации; сигналы (booking_api.signals) после коммита меняют версию.
+    Версия читается до сборки каталога: если изменение закоммитили, пока каталог собирался,
+    устаревший JSON запишется под старой версией и больше не будет прочитан.
+    """
+    key = telegram_catalog_cache_key(organization_id, get_telegram_catalog_version(organization_id))
+    payload = cache.get(key)
+    if payload is None:
+        body = fast_dumps(build_telegram_catalog(organization_id))
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        payload = (body, etag)
+        cache.set(key, payload, getattr(settings, 'TELEGRAM_CATALOG_CACHE_SECONDS', 24 * 60 * 60))
+    return payload
+
+
+def invalidate_telegram_catalog(*organization_ids):
+    for organization_id in set(organization_ids):
+        key = telegram_catalog_version_key(organization_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Версии еще нет (или ее вытеснили): любая новая не совпадет с ключами старых каталогов
+            cache.set(key, _new_catalog_version(), None)
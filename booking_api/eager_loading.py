@@ -0,0 +1,102 @@
+# booking_api/eager_loading.py
+
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def _walk_serializer(serializer, model, prefix, in_prefetch, select_related, prefetch_related):
+    """Обходит поля сериализатора и раскладывает пути связей по select_related / prefetch_related."""
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if field.source == '*':
+            if isinstance(nested, serializers.BaseSerializer):
+                _walk_serializer(nested, model, prefix, in_prefetch, select_related, prefetch_related)
+            continue
+
+        current_model = model
+        path = prefix
+        many = in_prefetch
+        relation = None
+        for attr in field.source.split('.'):
+            try:
+                relation = current_model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                # Свойство или метод модели: дальше по связям не идем
+                relation = None
+                break
+            if not relation.is_relation:
+                relation = None
+                break
+            path = f"{path}__{attr}" if path else attr
+            many = many or relation.many_to_many or relation.one_to_many
+            current_model = relation.related_model
+
+        if not path or path == prefix:
+            continue
+
+        # PrimaryKeyRelatedField по FK читает только <field>_id — запрос не нужен
+        is_pk_only = (
+            isinstance(field, serializers.RelatedField)
+            and field.use_pk_only_optimization()
+            and '.' not in field.source
+            and relation is not None and not (relation.many_to_many or relation.one_to_many)
+        )
+        if is_pk_only:
+            continue
+
+        (prefetch_related if many else select_related).add(path)
+
+        if isinstance(nested, serializers.BaseSerializer) and current_model is not None:
+            _walk_serializer(nested, current_model, path, many, select_related, prefetch_related)
+
+
+@lru_cache(maxsize=None)
+def build_eager_loading_plan(serializer_class, model):
+    """
+    Строит план загрузки связей по source-путям полей сериализатора:
+    'organization.name' → select_related('organization'), вложенный employees (many=True)
+    → prefetch_related('employees'), связи внутри prefetch тоже идут в prefetch_related.
+
+    Возвращает (select_related, prefetch_related) — отсортированные кортежи путей.
+    """
+    select_related, prefetch_related = set(), set()
+    _walk_serializer(serializer_class(), model, '', False, select_related, prefetch_related)
+    # Путь, уже покрытый более длинным select_related, отдельно не нужен
+    select_related = {
+        path for path in select_related
+        if not any(other.startswith(path + '__') for other in select_related)
+    }
+    return tuple(sorted(select_related)), tuple(sorted(prefetch_related))
+
+
+def apply_eager_loading(queryset, serializer_class, extra=None):
+    """Применяет к queryset план из build_eager_loading_plan и дополнительные пути extra."""
+    select_related, prefetch_related = build_eager_loading_plan(serializer_class, queryset.model)
+    extra = extra or {}
+    select_related = set(select_related) | set(extra.get('select_related', ()))
+    prefetch_related = set(prefetch_related) | set(extra.get('prefetch_related', ()))
+    if select_related:
+        queryset = queryset.select_related(*sorted(select_related))
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*sorted(prefetch_related))
+    return queryset
+
+
+class EagerLoadingMixin:
+    """
+    Миксин ViewSet: автоматически добавляет select_related / prefetch_related
+    по полям сериализатора текущего действия, чтобы список не делал запрос на строку.
+
+    eager_loading — пути, которые по source не видны (например, связь, которую читает
+    свойство модели): {'select_related': [...], 'prefetch_related': [...]}.
+    """
+    eager_loading = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return apply_eager_loading(queryset, self.get_serializer_class(), self.eager_loading)
@@ -0,0 +1,49 @@
+# booking_api/forms.py
+
+from django import forms
+
+from .models import Employee, EmployeeSchedule
+
+
+class ScheduleRangeForm(forms.Form):
+    date_from = forms.DateField(label="С даты", widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(label="По дату (включительно)", widget=forms.DateInput(attrs={'type': 'date'}))
+    weekdays = forms.TypedMultipleChoiceField(
+        label="Только дни недели",
+        choices=EmployeeSchedule.WEEKDAY_CHOICES,
+        coerce=int,
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text="Если ничего не выбрано — все дни периода.",
+    )
+
+    def clean_weekdays(self):
+        return self.cleaned_data['weekdays'] or None
+
+
+class CopyWeekTemplateForm(forms.Form):
+    source_employee = forms.ModelChoiceField(
+        label="Скопировать шаблон мастера",
+        queryset=Employee.objects.select_related('organization').order_by('name'),
+    )
+    replace = forms.BooleanField(
+        label="Удалить дни, которых нет в шаблоне",
+        required=False,
+        initial=True,
+    )
+
+
+class ScheduleExceptionRangeForm(ScheduleRangeForm):
+    has_new_hours = forms.BooleanField(
+        label="Переопределить часы работы",
+        required=False,
+        help_text="Если выключено, все дни периода — выходные.",
+    )
+    new_start_minutes = forms.IntegerField(label="Новое начало (минуты от 00:00)", required=False)
+    new_end_minutes = forms.IntegerField(label="Новый конец (минуты от 00:00)", required=False)
+
+
+class RecurringBlockerForm(ScheduleRangeForm):
+    start_minutes = forms.IntegerField(label="Начало блокировки (минуты от 00:00)")
+    end_minutes = forms.IntegerField(label="Конец блокировки (минуты от 00:00)")
+    reason = forms.CharField(label="Причина", max_length=255, required=False)
@@ -0,0 +1,83 @@
+# booking_api/intervals.py
+
+# Чистые функции над интервалами в минутах от 00:00 ([(start, end), ...]), без обращений к БД.
+# Используются и Employee.get_working_intervals (по одному дню), и отчетом загрузки
+# (booking_api.utilization), который заранее загружает расписания всех мастеров.
+
+
+def base_working_intervals(schedule, exception):
+    """
+    Рабочие интервалы дня до вычета блокировок.
+
+    schedule — EmployeeSchedule на день недели (или None), exception — ScheduleException
+    на дату (или None). Исключение важнее шаблона: выходной или новые часы.
+    """
+    if exception is not None:
+        if not exception.has_new_hours:
+            return []
+        return [(exception.new_start_minutes, exception.new_end_minutes)]
+    if schedule is None:
+        return []
+    return [(schedule.start_minutes, schedule.end_minutes)]
+
+
+def subtract_blockers(base_intervals, blockers):
+    """Вычитает блокировки (TimeBlocker, отсортированные по start_minutes) из рабочих интервалов."""
+    final_intervals = []
+    for start, end in base_intervals:
+        current_start = start
+
+        for blocker in blockers:
+            block_start = blocker.start_minutes
+            block_end = blocker.end_minutes
+
+            # Если рабочий интервал начинается ДО блокировки, добавляем свободное время
+            if current_start < block_start:
+                final_intervals.append((current_start, min(end, block_start)))
+
+            # Сдвигаем текущую точку отсчета за конец блокировки
+            current_start = max(current_start, block_end)
+
+        # Добавляем оставшееся время после всех блокировок
+        if current_start < end:
+            final_intervals.append((current_start, end))
+
+    return final_intervals
+
+
+def working_intervals(schedule, exception, blockers):
+    """Рабочие интервалы дня: base_working_intervals за вычетом блокировок."""
+    return subtract_blockers(base_working_intervals(schedule, exception), blockers)
+
+
+def merge_intervals(intervals):
+    """Сортирует и склеивает пересекающиеся и соседние интервалы."""
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def total_minutes(intervals):
+    return sum(end - start for start, end in intervals if end > start)
+
+
+def overlap_minutes(first, second):
+    """Длина пересечения двух склеенных (merge_intervals) наборов — один проход двумя указателями."""
+    i = j = total = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if end > start:
+            total += end - start
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return total
@@ -0,0 +1,21 @@
+# booking_api/management/commands/archive_appointments.py
+
+from django.core.management.base import BaseCommand
+
+from booking_api.archive import archive_appointments, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит завершенные и отмененные записи старше APPOINTMENT_ARCHIVE_AFTER_DAYS '
+        'в архив (AppointmentArchive) пачками в отдельных транзакциях.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Записей в пачке (по умолчанию APPOINTMENT_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--max-batches', type=int, help='Остановиться после N пачек (по умолчанию — пока есть что переносить)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Граница архивации: {archive_cutoff().isoformat()}.")
+        moved = archive_appointments(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        self.stdout.write(f"Перенесено в архив: {moved}.")
@@ -0,0 +1,129 @@
+# booking_api/management/commands/benchmark_read_endpoints.py
+
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from booking_api.models import Appointment, Employee, Service
+from booking_api.throttling import DEFAULT_THROTTLE_RATES
+from booking_api.views import AppointmentViewSet, ServiceViewSet
+
+
+class LegacyTelegramCatalogView(APIView):
+    """
+    Базовая линия для замера: telegram_catalog до кэша — каталог собирается на каждый запрос
+    и отдается через Response и JSONRenderer DRF.
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = []
+
+    def get(self, request):
+        organization_id = request.query_params.get('org_id')
+        if not organization_id:
+            return Response({"error": "Требуется org_id."}, status=status.HTTP_400_BAD_REQUEST)
+
+        active_services = Service.objects.filter(
+            is_active=True, organization_id=organization_id
+        ).prefetch_related('employees').order_by('category', 'name')
+
+        categorized_data = {}
+        for service in active_services:
+            category = service.category or 'Без категории'
+            categorized_data.setdefault(category, []).append({
+                'id': service.id,
+                'name': service.name,
+                'category': category,
+                'price': float(service.base_price),
+                'duration_minutes': service.base_duration,
+                'total_time_minutes': service.total_duration,
+                'employee_ids': [employee.id for employee in service.employees.all()],
+            })
+        return Response(categorized_data, status=status.HTTP_200_OK)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает запросы в секунду для available_slots, telegram_catalog и списка записей '
+        'до (DRF JSONRenderer, ModelSerializer, каталог без кэша) и после (BOOKING_FAST_READ_PATH, кэш каталога). '
+        'Только чтение: использует данные текущей базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, default=1, help='ID организации')
+        parser.add_argument('--employee', type=int, help='ID мастера для available_slots (по умолчанию первый)')
+        parser.add_argument('--service', type=int, help='ID услуги для available_slots (по умолчанию первая)')
+        parser.add_argument('--date', default=date.today().isoformat(), help='Дата для available_slots')
+        parser.add_argument('--page-size', type=int, default=100, help='Размер страницы списка записей')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый замер')
+
+    def handle(self, *args, **options):
+        organization_id = options['organization']
+        employee = Employee.objects.filter(pk=options['employee']) if options['employee'] else \
+            Employee.objects.filter(organization_id=organization_id)
+        service = Service.objects.filter(pk=options['service']) if options['service'] else \
+            Service.objects.filter(organization_id=organization_id, employees__in=employee)
+        employee, service = employee.order_by('pk').first(), service.order_by('pk').first()
+        if employee is None or service is None:
+            raise CommandError('Не найдены мастер и услуга для замера available_slots.')
+
+        factory = APIRequestFactory()
+        # Пользователь только для проверки прав (список записей требует авторизации), в базу не пишется
+        user = get_user_model()(username='benchmark')
+        rows = Appointment.objects.filter(organization_id=organization_id).count()
+        self.stdout.write(f"Организация {organization_id}: записей {rows}, страница {options['page_size']}, "
+                          f"запросов на замер {options['requests']}\n")
+
+        slots_view = AppointmentViewSet.as_view({'get': 'list_available_slots'})
+        list_view = AppointmentViewSet.as_view({'get': 'list'})
+        # (название, представление «до», представление «после», путь, параметры)
+        cases = [
+            ('available_slots', slots_view, slots_view, '/api/v1/appointments/available_slots/',
+             {'employee_id': employee.pk, 'service_id': service.pk, 'date': options['date']}),
+            # «До» — прежний путь без кэша через Response, «после» — кэшированный JSON с ETag
+            ('telegram_catalog', LegacyTelegramCatalogView.as_view(),
+             ServiceViewSet.as_view({'get': 'telegram_catalog'}),
+             '/api/v1/services/telegram_catalog/', {'org_id': organization_id}),
+            ('appointments', list_view, list_view, '/api/v1/appointments/',
+             {'organization_id': organization_id, 'page_size': options['page_size']}),
+        ]
+
+        def caller(view, path, params):
+            def call():
+                request = factory.get(path, params)
+                force_authenticate(request, user=user)
+                response = view(request)
+                if hasattr(response, 'render'):
+                    response.render()
+                return response
+            return call
+
+        # Замер пропускной способности, а не лимитов: throttling на время замера отключен
+        no_throttling = {scope: None for scope in DEFAULT_THROTTLE_RATES}
+        for name, before_view, after_view, path, params in cases:
+            with override_settings(BOOKING_FAST_READ_PATH=False, BOOKING_THROTTLE_RATES=no_throttling):
+                before = self.measure(caller(before_view, path, params), options['requests'])
+            with override_settings(BOOKING_FAST_READ_PATH=True, BOOKING_THROTTLE_RATES=no_throttling):
+                call = caller(after_view, path, params)
+                call()  # прогрев кэша
+                after = self.measure(call, options['requests'])
+
+            self.stdout.write(
+                f"{name:<18} до: {before:8.1f} запр/с   после: {after:8.1f} запр/с   x{after / before:.2f}"
+            )
+
+    @staticmethod
+    def measure(call, requests):
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = call()
+            if response.status_code != 200:
+                raise CommandError(f"Ответ {response.status_code}: {getattr(response, 'content', b'')[:200]!r}")
+        return requests / (time.perf_counter() - started)
@@ -0,0 +1,34 @@
+# booking_api/management/commands/normalize_client_phones.py
+
+from django.core.management.base import BaseCommand
+
+from booking_api.models import Client
+from booking_api.phones import normalize_phone_number
+
+
+class Command(BaseCommand):
+    help = 'Заполняет канонический номер (E.164) у клиентов, сохраненных до его появления.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        changed = []
+        updated = 0
+        invalid = 0
+
+        for client in Client.objects.only('id', 'phone_number', 'phone_e164').iterator(chunk_size=chunk_size):
+            canonical = normalize_phone_number(client.phone_number) or ''
+            if not canonical:
+                invalid += 1
+            if client.phone_e164 != canonical:
+                client.phone_e164 = canonical
+                changed.append(client)
+            if len(changed) >= chunk_size:
+                updated += Client.objects.bulk_update(changed, ['phone_e164'])
+                changed = []
+        if changed:
+            updated += Client.objects.bulk_update(changed, ['phone_e164'])
+
+        self.stdout.write(f"Обновлено клиентов: {updated}. Номеров, которые не удалось разобрать: {invalid}.")
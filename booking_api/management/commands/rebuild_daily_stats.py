@@ -0,0 +1,35 @@
+# booking_api/management/commands/rebuild_daily_stats.py
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking_api.stats import rebuild_daily_stats
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Неверная дата {value!r}. Ожидается YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает дневную статистику (DailyStats) из записей. Нужен после первого развертывания, '
+        'массовых изменений в обход сигналов (QuerySet.update, загрузка данных) или для сверки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help='ID организации (по умолчанию все)')
+        parser.add_argument('--date-from', help='Начало периода, YYYY-MM-DD (по умолчанию без ограничения)')
+        parser.add_argument('--date-to', help='Конец периода включительно, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        date_from = _parse_date(options['date_from']) if options['date_from'] else None
+        date_to = _parse_date(options['date_to']) if options['date_to'] else None
+        if date_from and date_to and date_from > date_to:
+            raise CommandError('--date-from позже --date-to.')
+
+        rows = rebuild_daily_stats(options['organization'], date_from, date_to)
+        self.stdout.write(f"Строк дневной статистики: {rows}.")
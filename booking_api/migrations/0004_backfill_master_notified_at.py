@@ -0,0 +1,36 @@
+# booking_api/migrations/0004_backfill_master_notified_at.py
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_master_notified_at(apps, schema_editor):
+    """
+    Отмечает уже существующие записи как отправленные мастеру: иначе первая отложенная
+    сводка (режим DEBOUNCE) или запрос по master_notified_at IS NULL подняли бы всю историю.
+
+    Поле добавлялось в схему вне отслеживаемых миграций, поэтому в состоянии миграций его нет:
+    обновляем SQL-запросом и только если колонка уже есть в базе.
+    """
+    connection = schema_editor.connection
+    table = apps.get_model('booking_api', 'Appointment')._meta.db_table
+    with connection.cursor() as cursor:
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+        if 'master_notified_at' not in columns:
+            return
+        cursor.execute(
+            f"UPDATE {schema_editor.quote_name(table)} SET master_notified_at = %s "
+            f"WHERE master_notified_at IS NULL",
+            [timezone.now()],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0003_service_employees'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_master_notified_at, migrations.RunPython.noop),
+    ]
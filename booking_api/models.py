@@ -1,10 +1,14 @@
 # booking_api/models.py
 
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from datetime import timedelta
 
+from .intervals import base_working_intervals, subtract_blockers
+from .phones import normalize_phone_number
+
 
 import logging
 logger = logging.getLogger('booking_debug')
@@ -26,6 +30,15 @@ class Organization(models.Model):
 
 # --- Модель 2: Сотрудник/Мастер (С МЕТОДОМ РАСЧЕТА РАСПИСАНИЯ) ---
 class Employee(models.Model):
+    NOTIFY_INSTANT = 'INSTANT'
+    NOTIFY_DEBOUNCE = 'DEBOUNCE'
+    NOTIFY_DAILY = 'DAILY'
+    NOTIFICATION_MODE_CHOICES = [
+        (NOTIFY_INSTANT, 'Сразу о каждой записи'),
+        (NOTIFY_DEBOUNCE, 'Группировать записи за короткое окно'),
+        (NOTIFY_DAILY, 'Ежедневная сводка расписания'),
+    ]
+
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, verbose_name="Организация")
     name = models.CharField(max_length=255, verbose_name="Имя Сотрудника/Мастера")
     telegram_chat_id = models.CharField(
@@ -36,6 +49,24 @@ class Employee(models.Model):
         verbose_name="Telegram Chat ID для уведомлений"
     )
 
+    notification_mode = models.CharField(
+        max_length=10,
+        choices=NOTIFICATION_MODE_CHOICES,
+        default=NOTIFY_INSTANT,
+        verbose_name="Режим уведомлений о записях"
+    )
+    digest_time = models.TimeField(
+        blank=True,
+        null=True,
+        verbose_name="Время ежедневной сводки",
+        help_text="Используется в режиме «Ежедневная сводка расписания»."
+    )
+    last_digest_date = models.DateField(
+        blank=True,
+        null=True,
+        verbose_name="Дата расписания в последней сводке"
+    )
+
     class Meta:
         verbose_name = "Сотрудник/Мастер"
         verbose_name_plural = "Сотрудники/Мастера"
@@ -43,6 +74,11 @@ class Employee(models.Model):
     def __str__(self):
         return f"{self.name} ({self.organization.name})"
 
+    def clean(self):
+        # Без времени сводки мастер в режиме DAILY не узнал бы о записях (мгновенные уведомления отключены)
+        if self.notification_mode == self.NOTIFY_DAILY and self.digest_time is None:
+            raise ValidationError({'digest_time': "Укажите время ежедневной сводки."})
+
     def get_working_intervals(self, date):
         """
         Возвращает список рабочих интервалов (в минутах от 00:00)
@@ -51,51 +87,21 @@ class Employee(models.Model):
         Возвращаемый формат: [(start_minutes_1, end_minutes_1), (start_minutes_2, end_minutes_2), ...]
         """
 
-        # 1. Проверка Исключений (ScheduleException - Высший приоритет)
-        try:
-            exception = self.exceptions.get(date=date)
-
-            # Если это полный выходной
-            if not exception.has_new_hours:
-                return []
-
-            # Если это неполный день (переопределение)
-            base_intervals = [
-                (exception.new_start_minutes, exception.new_end_minutes)
-            ]
-
-        except ScheduleException.DoesNotExist:
-            # 2. Получение Шаблона (EmployeeSchedule - Приоритет по умолчанию)
+        # 1. Исключение (ScheduleException) важнее шаблона (EmployeeSchedule);
+        # сама логика — в чистых функциях booking_api.intervals, общих с отчетом загрузки
+        exception = self.exceptions.filter(date=date).first()
+        schedule = None
+        if exception is None:
             day_of_week = date.weekday()  # Понедельник=0, Воскресенье=6
-            try:
-                schedule = self.employeeschedule_set.get(day_of_week=day_of_week)
-                base_intervals = [
-                    (schedule.start_minutes, schedule.end_minutes)
-                ]
-            except self.employeeschedule_set.model.DoesNotExist:
-                return []
-
-        # 3. Учет Блокировок (TimeBlocker - Вычитание)
-        blockers = self.blocked_times.filter(date=date).order_by('start_minutes')
-
-        final_intervals = []
-        for start, end in base_intervals:
-            current_start = start
-
-            for blocker in blockers:
-                block_start = blocker.start_minutes
-                block_end = blocker.end_minutes
+            schedule = self.employeeschedule_set.filter(day_of_week=day_of_week).first()
 
-                # Если рабочий интервал начинается ДО блокировки, добавляем свободное время
-                if current_start < block_start:
-                    final_intervals.append((current_start, min(end, block_start)))
+        base_intervals = base_working_intervals(schedule, exception)
+        if not base_intervals:
+            return []
 
-                # Сдвигаем текущую точку отсчета за конец блокировки
-                current_start = max(current_start, block_end)
-
-            # Добавляем оставшееся время после всех блокировок
-            if current_start < end:
-                final_intervals.append((current_start, end))
+        # 2. Учет Блокировок (TimeBlocker - Вычитание)
+        blockers = self.blocked_times.filter(date=date).order_by('start_minutes')
+        final_intervals = subtract_blockers(base_intervals, blockers)
 
         # Важно: Здесь (или в отдельном сервисе) должна быть логика вычитания
         # уже существующих записей (Appointment) из final_intervals.
@@ -159,6 +165,15 @@ class Service(models.Model):
 class Client(models.Model):
     name = models.CharField(max_length=255, verbose_name="Имя Клиента")
     phone_number = models.CharField(max_length=20, unique=True, verbose_name="Телефон")
+    # Канонический номер (E.164) для поиска записей клиента; заполняется в save()
+    phone_e164 = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name="Телефон (E.164)"
+    )
 
     class Meta:
         verbose_name = "Клиент"
@@ -167,6 +182,26 @@ class Client(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.phone_e164 = normalize_phone_number(self.phone_number) or ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone_number' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'phone_e164'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def get_or_create_by_phone(cls, phone_number, name):
+        """
+        Ищет клиента по каноническому номеру, чтобы «+7 900...» и «8900...» не давали
+        двух клиентов. Новый клиент сохраняется с номером в формате E.164.
+        """
+        canonical = normalize_phone_number(phone_number)
+        if canonical:
+            client = cls.objects.filter(phone_e164=canonical).first()
+            if client is not None:
+                return client, False
+        return cls.objects.get_or_create(phone_number=canonical or phone_number, defaults={'name': name})
+
 
 # --- Модель 5: Запись/Бронирование ---
 class Appointment(models.Model):
@@ -203,16 +238,17 @@ class Appointment(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name="Статус")
     address = models.CharField(max_length=255, default="", verbose_name="Адрес оказания услуги")
 
-    is_client_reminder_sent = models.BooleanField(
-        default=False,
-        verbose_name="Напоминание клиенту отправлено"
-    )
     client_chat_id = models.CharField(
         max_length=20,
         null=True,
         blank=True,
         verbose_name="Telegram Chat ID клиента"
     )
+    master_notified_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Мастер уведомлен о записи"
+    )
 
     class Meta:
         verbose_name = "Запись/Бронирование"
@@ -220,6 +256,12 @@ class Appointment(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['employee', 'start_time'], name='unique_employee_time')
         ]
+        indexes = [
+            # Выборка предстоящих записей по статусу (напоминания, сверочные обходы)
+            models.Index(fields=['status', 'start_time']),
+            # Курсорная пагинация списка записей по (start_time, id)
+            models.Index(fields=['start_time', 'id'], name='appointment_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"Запись {self.organization.name} на {self.start_time.strftime('%Y-%m-%d %H:%M')}"
@@ -353,4 +395,181 @@ class TimeBlocker(models.Model):
             models.Index(fields=['employee', 'date']),
         ]
     def __str__(self):
-        return f"Блокировка {self.employee.name} на {self.date}"
\ No newline at end of file
+        return f"Блокировка {self.employee.name} на {self.date}"
+
+# --- Модель 9: Отметка прогресса фоновых обходов (high-water mark) ---
+class SweepWatermark(models.Model):
+    """
+    Хранит момент, до которого периодический обход (например, рассылка напоминаний)
+    уже обработал данные. Следующий запуск продолжает с этой отметки,
+    поэтому опоздание Celery beat не приводит к пропуску записей.
+    """
+    key = models.CharField(max_length=100, unique=True, verbose_name="Ключ обхода")
+    value = models.DateTimeField(verbose_name="Обработано до")
+
+    class Meta:
+        verbose_name = "Отметка обхода"
+        verbose_name_plural = "Отметки обходов"
+
+    def __str__(self):
+        return f"{self.key}: {self.value.isoformat()}"
+
+
+# --- Модель 10: Смещение напоминания клиенту (настройка организации) ---
+class ReminderOffset(models.Model):
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='reminder_offsets',
+        verbose_name="Организация"
+    )
+    offset = models.DurationField(
+        verbose_name="За сколько до начала напомнить",
+        help_text="Например, «1 00:00:00» — за сутки, «02:00:00» — за 2 часа."
+    )
+
+    class Meta:
+        verbose_name = "Напоминание клиенту"
+        verbose_name_plural = "Напоминания клиентам"
+        unique_together = ('organization', 'offset')
+        ordering = ('-offset',)
+
+    def __str__(self):
+        return f"{self.organization.name}: за {self.offset}"
+
+
+# --- Модель 11: Журнал доставки напоминаний (по записи и смещению) ---
+class ReminderDelivery(models.Model):
+    """
+    Строка создается до отправки («захват»), поэтому уникальное ограничение
+    (appointment, offset, start_time) гарантирует, что одно напоминание отправит только один воркер.
+    start_time — время начала записи, о котором напоминали: после переноса записи
+    напоминание о новом времени — другая строка журнала.
+    sent_at остается пустым, пока отправка не подтверждена.
+    """
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name='reminder_deliveries',
+        verbose_name="Запись"
+    )
+    offset = models.DurationField(verbose_name="Смещение напоминания")
+    start_time = models.DateTimeField(verbose_name="Время начала записи")
+    claim_token = models.CharField(max_length=32, verbose_name="Токен захвата")
+    claimed_at = models.DateTimeField(verbose_name="Захвачено")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        verbose_name = "Доставка напоминания"
+        verbose_name_plural = "Доставки напоминаний"
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'offset', 'start_time'], name='unique_reminder_delivery')
+        ]
+        indexes = [
+            models.Index(fields=['claim_token']),
+        ]
+
+    def __str__(self):
+        return f"Напоминание по записи {self.appointment_id} за {self.offset}"
+
+
+# --- Модель 12: Дневная сводка для аналитики (организация × мастер × услуга × дата) ---
+class DailyStats(models.Model):
+    """
+    Накопительные итоги по записям за день. Обновляются сигналами записи (booking_api.stats)
+    приращениями через F(), поэтому аналитика читает готовые суммы, а не агрегирует записи.
+    Пересобрать из записей: manage.py rebuild_daily_stats.
+
+    Строки удаленного мастера сливаются в строку без мастера (employee=NULL) —
+    см. merge_employee_daily_stats; для NULL уникальность задает отдельное условное ограничение.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, verbose_name="Организация")
+    employee = models.ForeignKey(
+        Employee,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Сотрудник/Мастер"
+    )
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, verbose_name="Услуга")
+    date = models.DateField(verbose_name="Дата (по началу записи, местное время)")
+
+    appointments_count = models.IntegerField(default=0, verbose_name="Записей (без отмененных)")
+    completed_count = models.IntegerField(default=0, verbose_name="Завершено")
+    cancelled_count = models.IntegerField(default=0, verbose_name="Отменено")
+    revenue = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name="Выручка (фактическая цена, без отмененных)"
+    )
+    booked_minutes = models.IntegerField(default=0, verbose_name="Занято минут (без отмененных)")
+
+    class Meta:
+        verbose_name = "Дневная статистика"
+        verbose_name_plural = "Дневная статистика"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organization', 'employee', 'service', 'date'],
+                name='unique_daily_stats'
+            ),
+            # NULL не равен NULL: без этого ограничения строк «без мастера» на день могло бы быть несколько
+            models.UniqueConstraint(
+                fields=['organization', 'service', 'date'],
+                condition=models.Q(employee__isnull=True),
+                name='unique_daily_stats_without_employee'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['organization', 'date']),
+        ]
+
+    def __str__(self):
+        return f"Статистика {self.organization_id} за {self.date}"
+
+
+# --- Модель 13: Архив записей (холодные данные) ---
+class AppointmentArchive(models.Model):
+    """
+    Завершенные и отмененные записи старше APPOINTMENT_ARCHIVE_AFTER_DAYS, перенесенные
+    из Appointment (booking_api.archive), чтобы рабочая таблица не росла годами.
+    id совпадает с id исходной записи: курсоры и ссылки остаются действительными,
+    а списки могут объединять обе таблицы (?include_archived=1).
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name="ID записи")
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='+')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='+')
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    service = models.ForeignKey(Service, on_delete=models.PROTECT, related_name='+', verbose_name="Услуга")
+
+    start_time = models.DateTimeField(verbose_name="Время начала")
+    end_time = models.DateTimeField(verbose_name="Время окончания")
+    custom_duration = models.IntegerField(blank=True, null=True, verbose_name="Фактическая длительность (мин)")
+    custom_price = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True, verbose_name="Фактическая цена"
+    )
+    status = models.CharField(max_length=10, choices=Appointment.STATUS_CHOICES, verbose_name="Статус")
+    address = models.CharField(max_length=255, default="", verbose_name="Адрес оказания услуги")
+    client_chat_id = models.CharField(max_length=20, null=True, blank=True, verbose_name="Telegram Chat ID клиента")
+    master_notified_at = models.DateTimeField(null=True, blank=True, verbose_name="Мастер уведомлен о записи")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Перенесено в архив")
+
+    # Поля, переносимые из Appointment как есть
+    COPIED_FIELDS = (
+        'id', 'organization_id', 'client_id', 'employee_id', 'service_id', 'start_time', 'end_time',
+        'custom_duration', 'custom_price', 'status', 'address', 'client_chat_id', 'master_notified_at',
+    )
+
+    class Meta:
+        verbose_name = "Запись (архив)"
+        verbose_name_plural = "Записи (архив)"
+        indexes = [
+            models.Index(fields=['start_time', 'id'], name='appointment_archive_keyset_idx'),
+            models.Index(fields=['organization', 'start_time']),
+        ]
+
+    def __str__(self):
+        return f"Архивная запись {self.pk} на {self.start_time.strftime('%Y-%m-%d %H:%M')}"
+
+    actual_duration = Appointment.actual_duration
+    actual_price = Appointment.actual_price
@@ -1,9 +1,14 @@
 # booking_api/notifications.py
 
 from django.core.mail import send_mail
+from django.core.cache import cache
 from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
+from datetime import datetime, time, timedelta
+from itertools import groupby
 import logging
+from .models import Appointment, Employee
 from .telegram_utils import send_telegram_notification  # НОВЫЙ ИМПОРТ
 
 logger = logging.getLogger(__name__)
@@ -12,41 +17,18 @@ logger = logging.getLogger(__name__)
 def send_appointment_confirmation(appointment):
     """
     Отправляет подтверждение записи клиенту (email/SMS - по вашему старому коду)
-    И отправляет мгновенное уведомление мастеру (Telegram - новое требование).
+    И уведомляет мастера (Telegram) — сразу, пачкой или в ежедневной сводке,
+    в зависимости от Employee.notification_mode.
     """
 
-    # Получение локализованного времени начала и окончания
+    # Получение локализованного времени начала
     start_time_local = timezone.localtime(appointment.start_time)
-    end_time_local = timezone.localtime(appointment.end_time)
 
     # -------------------------------------------------------------
-    # 1. МГНОВЕННОЕ УВЕДОМЛЕНИЕ МАСТЕРУ (TELEGRAM)
+    # 1. УВЕДОМЛЕНИЕ МАСТЕРУ (TELEGRAM) — с учетом режима мастера
     # -------------------------------------------------------------
-    master = appointment.employee
-
-    print(
-        f"--- DEBUG NOTIFY: Проверка мастера {master.id}. Chat ID: {master.telegram_chat_id}")  # <-- Должно быть в логе Django
-
-    if master and master.telegram_chat_id:
-        # Используем @property actual_duration и actual_price из модели Appointment
-        print("--- DEBUG NOTIFY: Попытка отправки Telegram-уведомления...") # <-- Должно быть в логе Django
-
-        notification_message = (
-            f"🔔 *НОВАЯ ЗАПИСЬ!* ({appointment.organization.name}) 🔔\n\n"
-            f"📅 Дата и Время: {start_time_local.strftime('%Y-%m-%d в %H:%M')}\n"
-            f"⏳ Завершение: {end_time_local.strftime('%H:%M')} (Всего: {appointment.actual_duration} мин)\n"
-            f"🛠 Услуга: {appointment.service.name}\n"
-            f"💵 Цена: {appointment.actual_price:,.2f} руб.\n\n"
-            f"👤 Клиент: {appointment.client.name}\n"
-            f"📞 Телефон: {appointment.client.phone_number}\n"
-            f"📍 Адрес: {appointment.address or 'Не указан'}"
-        )
-
-        # Вызываем функцию отправки
-        send_telegram_notification(master.telegram_chat_id, notification_message)
+    notify_master_about_booking(appointment)
 
-    else:
-        print(f"--- DEBUG NOTIFY: Мастер {master.id} не имеет Chat ID. Пропускаю.")  # <-- Должно быть в логе Django
     # -------------------------------------------------------------
     # 2. УВЕДОМЛЕНИЕ КЛИЕНТУ (EMAIL/SMS) - Адаптация вашего старого кода
     # -------------------------------------------------------------
@@ -61,7 +43,7 @@ def send_appointment_confirmation(appointment):
         f'Ваша запись успешно создана.\n'
         f'Организация: {appointment.organization.name}\n'
         f'Услуга: {appointment.service.name}\n'
-        f'Мастер: {master.name if master else "Не назначен"}\n'
+        f'Мастер: {appointment.employee.name if appointment.employee else "Не назначен"}\n'
         f'Время: {time_str}\n'
         f'Общая длительность: {appointment.actual_duration} мин\n'
         f'Фактическая цена: {appointment.actual_price:,.2f} руб\n\n'
@@ -88,4 +70,184 @@ def send_appointment_confirmation(appointment):
         )
         logger.info(f"Подтверждение отправлено клиенту: {appointment.client.phone_number}")
     except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления клиенту: {e}")
\ No newline at end of file
+        logger.error(f"Ошибка при отправке уведомления клиенту: {e}")
+
+
+# -------------------------------------------------------------
+# УВЕДОМЛЕНИЯ МАСТЕРУ: мгновенные, с группировкой и ежедневная сводка
+# -------------------------------------------------------------
+
+def _format_booking_line(appointment):
+    """Одна строка записи для сводки мастеру."""
+    start_time_local = timezone.localtime(appointment.start_time)
+    end_time_local = timezone.localtime(appointment.end_time)
+    return (
+        f"🕒 {start_time_local.strftime('%d.%m %H:%M')}–{end_time_local.strftime('%H:%M')} "
+        f"{appointment.service.name} — {appointment.client.name} ({appointment.client.phone_number})"
+    )
+
+
+def _send_instant_master_notification(appointment):
+    """Мгновенное уведомление мастеру о новой записи (одно сообщение на запись)."""
+    master = appointment.employee
+    start_time_local = timezone.localtime(appointment.start_time)
+    end_time_local = timezone.localtime(appointment.end_time)
+
+    # Используем @property actual_duration и actual_price из модели Appointment
+    notification_message = (
+        f"🔔 *НОВАЯ ЗАПИСЬ!* ({appointment.organization.name}) 🔔\n\n"
+        f"📅 Дата и Время: {start_time_local.strftime('%Y-%m-%d в %H:%M')}\n"
+        f"⏳ Завершение: {end_time_local.strftime('%H:%M')} (Всего: {appointment.actual_duration} мин)\n"
+        f"🛠 Услуга: {appointment.service.name}\n"
+        f"💵 Цена: {appointment.actual_price:,.2f} руб.\n\n"
+        f"👤 Клиент: {appointment.client.name}\n"
+        f"📞 Телефон: {appointment.client.phone_number}\n"
+        f"📍 Адрес: {appointment.address or 'Не указан'}"
+    )
+
+    if send_telegram_notification(master.telegram_chat_id, notification_message):
+        Appointment.objects.filter(pk=appointment.pk).update(master_notified_at=timezone.now())
+
+
+def notify_master_about_booking(appointment):
+    """
+    Уведомляет мастера о новой записи в соответствии с его режимом:
+    - INSTANT: сразу одним сообщением;
+    - DEBOUNCE: первая запись в окне MASTER_NOTIFY_DEBOUNCE_SECONDS ставит отложенную задачу,
+      которая отправит одним сообщением все записи, накопившиеся за окно (начиная с этой записи);
+    - DAILY: запись попадет в ежедневную сводку. Если сводка на этот день уже отправлена,
+      мастер получает мгновенное уведомление, чтобы не пропустить позднюю запись.
+    """
+    master = appointment.employee
+
+    if not master or not master.telegram_chat_id:
+        logger.info(f"Мастер записи ID {appointment.id} не имеет Chat ID. Уведомление пропущено.")
+        return
+
+    if master.notification_mode == Employee.NOTIFY_DEBOUNCE:
+        from .appointments.tasks import flush_master_notifications
+
+        window = getattr(settings, 'MASTER_NOTIFY_DEBOUNCE_SECONDS', 300)
+        # cache.add атомарен: задачу ставит только первая запись в окне
+        if cache.add(f"master-notify-debounce-{master.id}", 1, timeout=window):
+            try:
+                flush_master_notifications.apply_async(args=[master.id, appointment.pk], countdown=window)
+            except Exception as e:
+                cache.delete(f"master-notify-debounce-{master.id}")
+                logger.error(f"Не удалось поставить задачу уведомления мастеру {master.id}: {e}. Отправляю сразу.")
+                _send_instant_master_notification(appointment)
+        return
+
+    if master.notification_mode == Employee.NOTIFY_DAILY:
+        appointment_date = timezone.localtime(appointment.start_time).date()
+        if master.last_digest_date and appointment_date <= master.last_digest_date:
+            _send_instant_master_notification(appointment)
+        return
+
+    _send_instant_master_notification(appointment)
+
+
+def flush_pending_master_notifications(employee_id, since_id=None):
+    """
+    Отправляет мастеру одним сообщением еще не отправленные ему предстоящие записи,
+    созданные за окно (режим DEBOUNCE): since_id — первая запись окна, поставившая задачу,
+    поэтому выборка ограничена записями окна, а не всеми записями мастера без отметки.
+    Возвращает количество записей в сообщении.
+    """
+    master = Employee.objects.filter(pk=employee_id).first()
+    if master is None or not master.telegram_chat_id:
+        return 0
+
+    pending = Appointment.objects.filter(
+        employee_id=employee_id,
+        master_notified_at__isnull=True,
+        start_time__gte=timezone.now(),
+    )
+    # since_id нет только у задач, поставленных до появления аргумента
+    if since_id is not None:
+        pending = pending.filter(pk__gte=since_id)
+    pending = list(pending.exclude(status='CANCELLED').select_related('service', 'client').order_by('start_time'))
+    if not pending:
+        return 0
+
+    lines = [f"🔔 *Новые записи ({len(pending)})*", ""]
+    lines.extend(_format_booking_line(appointment) for appointment in pending)
+
+    if send_telegram_notification(master.telegram_chat_id, "\n".join(lines)):
+        Appointment.objects.filter(pk__in=[a.pk for a in pending]).update(master_notified_at=timezone.now())
+        return len(pending)
+    return 0
+
+
+def send_master_digests(now=None):
+    """
+    Отправляет ежедневную сводку расписания мастерам в режиме DAILY, у которых
+    наступило digest_time, а сводка на целевой день еще не отправлена.
+
+    Целевой день — сегодня + MASTER_DIGEST_DAYS_AHEAD (0 — сводка на сегодня, 1 — на завтра).
+    Мастерам без digest_time (сохранены до появления проверки в Employee.clean) сводка
+    уходит в MASTER_DIGEST_DEFAULT_TIME (по умолчанию 08:00).
+    Записи всех мастеров загружаются одним запросом и группируются в памяти.
+
+    Возвращает количество отправленных сводок.
+    """
+    now = timezone.localtime(now or timezone.now())
+    target_date = now.date() + timedelta(days=getattr(settings, 'MASTER_DIGEST_DAYS_AHEAD', 0))
+    default_time = time.fromisoformat(getattr(settings, 'MASTER_DIGEST_DEFAULT_TIME', '08:00'))
+    due = Q(digest_time__lte=now.time())
+    if default_time <= now.time():
+        due |= Q(digest_time__isnull=True)
+
+    masters = {
+        master.id: master
+        for master in Employee.objects.filter(
+            due,
+            notification_mode=Employee.NOTIFY_DAILY,
+            telegram_chat_id__isnull=False,
+        ).exclude(
+            last_digest_date__gte=target_date
+        ).exclude(telegram_chat_id='')
+    }
+    if not masters:
+        return 0
+
+    day_start = timezone.make_aware(datetime.combine(target_date, datetime.min.time()))
+    day_end = day_start + timedelta(days=1)
+
+    # Один запрос на всех мастеров, отсортированный для группировки
+    appointments = Appointment.objects.filter(
+        employee_id__in=masters.keys(),
+        start_time__gte=day_start,
+        start_time__lt=day_end,
+        status__in=['PENDING', 'CONFIRMED'],
+    ).select_related('service', 'client').order_by('employee_id', 'start_time')
+
+    schedule = {employee_id: [] for employee_id in masters}
+    for employee_id, items in groupby(appointments, key=lambda a: a.employee_id):
+        schedule[employee_id] = list(items)
+
+    sent_masters = []
+    notified_ids = []
+    for employee_id, items in schedule.items():
+        master = masters[employee_id]
+        lines = [f"🗓️ *Расписание на {target_date.strftime('%d.%m.%Y')}*", ""]
+        if items:
+            lines.extend(_format_booking_line(appointment) for appointment in items)
+            lines.append("")
+            lines.append(f"Всего записей: {len(items)}")
+        else:
+            lines.append("Записей нет.")
+
+        if send_telegram_notification(master.telegram_chat_id, "\n".join(lines)):
+            sent_masters.append(employee_id)
+            notified_ids.extend(appointment.pk for appointment in items)
+        else:
+            logger.error(f"Не удалось отправить сводку мастеру {master.name} (ID {employee_id}).")
+
+    if sent_masters:
+        Employee.objects.filter(pk__in=sent_masters).update(last_digest_date=target_date)
+    if notified_ids:
+        Appointment.objects.filter(pk__in=notified_ids, master_notified_at__isnull=True).update(
+            master_notified_at=timezone.now())
+
+    return len(sent_masters)
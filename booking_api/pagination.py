@@ -0,0 +1,137 @@
+# booking_api/pagination.py
+
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по паре (start_time, id).
+
+    Страница выбирается условием «после последней строки предыдущей страницы»
+    start_time <= t AND (start_time < t OR (start_time = t AND id < pk)), без OFFSET:
+    первая часть — диапазон по индексу appointment_keyset_idx, вторая отсекает уже
+    показанные строки с тем же start_time. Стоимость запроса не зависит от глубины страницы. Направление сортировки берется из order_by
+    queryset ('start_time' или '-start_time'), id добавляется для однозначности.
+
+    Ответ: {"next": <url|null>, "previous": <url|null>, "results": [...]}.
+    Размер страницы — ?page_size= (не больше APPOINTMENT_MAX_PAGE_SIZE).
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'APPOINTMENT_PAGE_SIZE', 50)
+        maximum = getattr(settings, 'APPOINTMENT_MAX_PAGE_SIZE', 200)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            return default
+        return max(1, min(size, maximum))
+
+    @staticmethod
+    def _is_descending(queryset):
+        ordering = queryset.query.order_by
+        return bool(ordering) and str(ordering[0]).startswith('-')
+
+    def encode_cursor(self, instance, reverse):
+        payload = {'t': instance.start_time.isoformat(), 'id': instance.pk, 'r': int(reverse)}
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+    def decode_cursor(self, request):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(raw.encode()).decode())
+            return datetime.fromisoformat(payload['t']), int(payload['id']), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            # Испорченный курсор — ошибка запроса (400), как и неверные фильтры списка
+            raise ValidationError({"error": self.invalid_cursor_message})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request)
+
+    def paginate_querysets(self, querysets, request):
+        """
+        Одна страница из нескольких querysets с одинаковым порядком (например, записи и их архив):
+        из каждого берется не больше page_size + 1 строк после курсора, затем строки сливаются
+        по (start_time, id). Направление — по первому queryset; id в querysets не пересекаются.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        descending = self._is_descending(querysets[0])
+        cursor = self.decode_cursor(request)
+        start_time, pk, reverse = cursor if cursor else (None, None, False)
+
+        # Назад по списку (previous) — та же выборка в обратном порядке
+        scan_descending = descending != reverse
+        if scan_descending:
+            ordering = ('-start_time', '-id')
+            position = Q(start_time__lte=start_time) & (Q(start_time__lt=start_time) | Q(id__lt=pk))
+        else:
+            ordering = ('start_time', 'id')
+            position = Q(start_time__gte=start_time) & (Q(start_time__gt=start_time) | Q(id__gt=pk))
+
+        # Одна лишняя строка показывает, есть ли следующая страница
+        rows = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*ordering)
+            if cursor:
+                queryset = queryset.filter(position)
+            rows += queryset[:self.page_size + 1]
+        if len(querysets) > 1:
+            rows.sort(key=lambda row: (row.start_time, row.pk), reverse=scan_descending)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    def _link(self, instance, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(instance, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,37 @@
+# booking_api/phones.py
+
+import re
+
+from django.conf import settings
+
+
+def normalize_phone_number(phone):
+    """
+    Приводит номер телефона к каноническому виду E.164 (+<код страны><номер>).
+
+    Понимает «+7 (900) 123-45-67», «8 900 123 45 67», «0049...», а также номер без кода
+    страны — тогда подставляется PHONE_DEFAULT_COUNTRY_CODE (по умолчанию 7).
+    Та же логика — в clean_phone_number бота (совпадение проверяет PhoneLookupTests).
+    Возвращает None, если номер не похож на телефон.
+    """
+    if not phone:
+        return None
+
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    country_code = str(getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', '7'))
+
+    if phone.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif country_code == '7' and len(digits) == 11 and digits[0] in '78':
+        # Российский формат: 8XXXXXXXXXX и 7XXXXXXXXXX
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = country_code + digits
+
+    # E.164: не больше 15 цифр, код страны не начинается с 0
+    if not 8 <= len(digits) <= 15 or digits[0] == '0':
+        return None
+    return '+' + digits
@@ -0,0 +1,371 @@
+# booking_api/reminders.py
+
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, DurationField, Exists, ExpressionWrapper, F, Max, OuterRef, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Appointment, ReminderDelivery, ReminderOffset, SweepWatermark
+from .telegram_utils import send_telegram_notification
+
+logger = logging.getLogger(__name__)
+
+CLIENT_REMINDER_WATERMARK_KEY = 'client_reminders'
+
+
+def get_default_reminder_offset():
+    """Смещение напоминания для организаций без собственных настроек (из settings)."""
+    return timedelta(hours=getattr(settings, 'CLIENT_REMINDER_OFFSET_HOURS', 24))
+
+
+def get_reminder_offsets(organization_id):
+    """Список смещений напоминаний организации (ReminderOffset) или смещение по умолчанию."""
+    offsets = list(
+        ReminderOffset.objects.filter(organization_id=organization_id).values_list('offset', flat=True)
+    )
+    return offsets or [get_default_reminder_offset()]
+
+
+def build_client_reminder_message(appointment):
+    """Формирует текст напоминания клиенту (Markdown)."""
+    start_time_local = appointment.start_time.astimezone(timezone.get_current_timezone())
+    return (
+        f"⏰ **Напоминание о записи!**\n\n"
+        f"Вы записаны на услугу **{appointment.service.name}** "
+        f"к мастеру **{appointment.employee.name}**.\n"
+        f"Время: **{start_time_local.strftime('%d.%m %H:%M')}**\n"
+        f"Ожидаем Вас!"
+    )
+
+
+def _deliver_reminders(batch):
+    """
+    Захватывает и отправляет пачку напоминаний. У каждого элемента batch должен быть
+    атрибут reminder_offset (смещение, по которому оно наступило).
+
+    Захват — bulk_create строк ReminderDelivery с уникальным токеном запуска:
+    строки, уже занятые другим воркером, отбрасываются уникальным ограничением.
+    Захват и снятие неудачных — O(1) на пачку; перед каждой отправкой захват подтверждается
+    (_confirm_claim), а сразу после нее отмечается sent_at — иначе захват, подтвержденный
+    в начале медленной пачки, истек бы по TTL до конца пачки и напоминание отправили бы снова.
+
+    Возвращает (количество отправленных, самое раннее время напоминания среди неудачных или None).
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+
+    deliverable = []
+    for appointment in batch:
+        # 🚨 Chat ID клиента должен быть привязан к записи
+        if appointment.client_chat_id:
+            deliverable.append(appointment)
+        else:
+            logger.warning(
+                f"Клиент для записи ID {appointment.id} не имеет Chat ID. Напоминание не отправлено.")
+    if not deliverable:
+        return 0, None
+
+    ReminderDelivery.objects.bulk_create(
+        [
+            ReminderDelivery(
+                appointment_id=appointment.id,
+                offset=appointment.reminder_offset,
+                start_time=appointment.start_time,
+                claim_token=token,
+                claimed_at=now,
+            )
+            for appointment in deliverable
+        ],
+        ignore_conflicts=True,
+    )
+    claimed = {
+        (appointment_id, offset, start_time): delivery_id
+        for delivery_id, appointment_id, offset, start_time in ReminderDelivery.objects.filter(
+            claim_token=token
+        ).values_list('id', 'appointment_id', 'offset', 'start_time')
+    }
+
+    sent = 0
+    failed_ids = []
+    earliest_failed = None
+
+    for appointment in deliverable:
+        delivery_id = claimed.get((appointment.id, appointment.reminder_offset, appointment.start_time))
+        if delivery_id is None or not _confirm_claim(delivery_id, token):
+            # Уже отправлено или отправляется другим воркером
+            continue
+
+        logger.info(f"Попытка отправить напоминание клиенту {appointment.client_chat_id} "
+                    f"для записи ID {appointment.id} (за {appointment.reminder_offset}).")
+
+        if send_telegram_notification(appointment.client_chat_id, build_client_reminder_message(appointment)):
+            ReminderDelivery.objects.filter(pk=delivery_id).update(sent_at=timezone.now())
+            sent += 1
+        else:
+            logger.error(f"Не удалось отправить напоминание для записи ID {appointment.id}.")
+            failed_ids.append(delivery_id)
+            reminder_time = appointment.start_time - appointment.reminder_offset
+            if earliest_failed is None or reminder_time < earliest_failed:
+                earliest_failed = reminder_time
+
+    if failed_ids:
+        # Снимаем захват, чтобы следующий запуск повторил попытку
+        ReminderDelivery.objects.filter(pk__in=failed_ids).delete()
+
+    return sent, earliest_failed
+
+
+def _confirm_claim(delivery_id, token):
+    """
+    Проверяет перед отправкой, что захват еще наш, и продлевает его (claimed_at = сейчас).
+    Если воркер работал дольше CLIENT_REMINDER_CLAIM_TTL_MINUTES и захват сняли
+    (и, возможно, взял другой воркер), строки с нашим токеном уже нет — отправлять нельзя.
+    """
+    return ReminderDelivery.objects.filter(
+        pk=delivery_id, claim_token=token, sent_at__isnull=True,
+    ).update(claimed_at=timezone.now()) == 1
+
+
+def _release_stale_claims(now):
+    """
+    Снимает захваты воркеров, которые упали между захватом и отправкой.
+    Живой воркер продлевает захват перед каждой отправкой (_confirm_claim), поэтому
+    истекает только захват, который давно никто не подтверждал.
+    """
+    ttl = timedelta(minutes=getattr(settings, 'CLIENT_REMINDER_CLAIM_TTL_MINUTES', 10))
+    ReminderDelivery.objects.filter(sent_at__isnull=True, claimed_at__lt=now - ttl).delete()
+
+
+def due_reminders(since, until, now):
+    """
+    Один индексируемый запрос по всем смещениям: пары (запись, смещение), у которых
+    момент напоминания start_time - offset попал в (since, until], запись еще не началась
+    и доставка еще не зафиксирована в журнале.
+
+    Организация без ReminderOffset получает смещение по умолчанию (LEFT JOIN + Coalesce).
+    """
+    default_offset = get_default_reminder_offset()
+    max_offset = max(
+        ReminderOffset.objects.aggregate(max_offset=Max('offset'))['max_offset'] or default_offset,
+        default_offset,
+    )
+
+    delivered = ReminderDelivery.objects.filter(
+        appointment=OuterRef('pk'),
+        offset=OuterRef('reminder_offset'),
+        start_time=OuterRef('start_time'),
+    )
+
+    return Appointment.objects.filter(
+        # Диапазон по индексу (status, start_time)
+        status='CONFIRMED',
+        start_time__gt=now,
+        start_time__lte=until + max_offset,
+    ).annotate(
+        reminder_offset=Coalesce(
+            F('organization__reminder_offsets__offset'),
+            Value(default_offset, output_field=DurationField()),
+            output_field=DurationField(),
+        ),
+    ).annotate(
+        remind_at=ExpressionWrapper(F('start_time') - F('reminder_offset'), output_field=DateTimeField()),
+    ).filter(
+        remind_at__gt=since,
+        remind_at__lte=until,
+    ).filter(
+        ~Exists(delivered)
+    ).select_related('employee', 'service').order_by('remind_at', 'pk')
+
+
+def sweep_client_reminders(now=None):
+    """
+    Сверочный обход: отправляет напоминания по всем записям и всем смещениям организации,
+    у которых момент напоминания попал между прошлым запуском и текущим моментом
+    за вычетом CLIENT_REMINDER_RECONCILE_GRACE_MINUTES.
+
+    Основную доставку выполняют задачи send_client_reminder, поставленные при бронировании;
+    обход подбирает только то, что они потеряли (рестарт брокера, запись из админки и т.п.).
+
+    Граница прошлого запуска хранится в SweepWatermark. Если отправка не удалась,
+    отметка не сдвигается дальше самого раннего неудачного напоминания,
+    и следующий запуск повторит попытку. Записи обрабатываются пачками через iterator().
+
+    Возвращает количество отправленных напоминаний.
+    """
+    now = now or timezone.now()
+    # Даем запланированным задачам время сработать, прежде чем подбирать их записи
+    grace = timedelta(minutes=getattr(settings, 'CLIENT_REMINDER_RECONCILE_GRACE_MINUTES', 15))
+    chunk_size = getattr(settings, 'CLIENT_REMINDER_CHUNK_SIZE', 500)
+    # Насколько далеко в прошлое допускается догонять пропущенные запуски
+    max_catchup = timedelta(hours=getattr(settings, 'CLIENT_REMINDER_MAX_CATCHUP_HOURS', 24))
+
+    horizon = now - grace
+
+    watermark, _ = SweepWatermark.objects.get_or_create(
+        key=CLIENT_REMINDER_WATERMARK_KEY,
+        defaults={'value': horizon - max_catchup},
+    )
+    since = max(watermark.value, now - max_catchup)
+    if since >= horizon:
+        return 0
+
+    logger.info(f"Запуск проверки напоминаний. Моменты напоминаний между {since} и {horizon}.")
+
+    _release_stale_claims(now)
+
+    sent_total = 0
+    earliest_failed = None
+    chunk = []
+
+    def flush(current_chunk):
+        nonlocal sent_total, earliest_failed
+        sent, failed_at = _deliver_reminders(current_chunk)
+        sent_total += sent
+        if failed_at is not None and (earliest_failed is None or failed_at < earliest_failed):
+            earliest_failed = failed_at
+
+    for appointment in due_reminders(since, horizon, now).iterator(chunk_size=chunk_size):
+        chunk.append(appointment)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    # Сдвигаем отметку: до horizon, либо до первого неудачного напоминания (для повтора)
+    new_value = horizon
+    if earliest_failed is not None:
+        new_value = max(since, earliest_failed - timedelta(microseconds=1))
+    SweepWatermark.objects.filter(pk=watermark.pk).update(value=new_value)
+
+    logger.info(f"Напоминаний отправлено: {sent_total}. Отметка обхода: {new_value}.")
+    return sent_total
+
+
+# -------------------------------------------------------------
+# Точечные напоминания: одна задача Celery на запись и смещение
+# -------------------------------------------------------------
+
+def client_reminder_task_id(appointment_id, offset, start_time):
+    """
+    Детерминированный ID задачи напоминания. Зависит от смещения и времени начала,
+    поэтому при переносе записи старые задачи можно отозвать, не храня их ID в БД.
+    """
+    return f"client-reminder-{appointment_id}-{int(offset.total_seconds())}-{int(start_time.timestamp())}"
+
+
+def schedule_client_reminder(appointment):
+    """
+    Ставит по задаче send_client_reminder на каждое смещение организации,
+    с ETA = start_time - offset. Если момент напоминания уже прошел,
+    а запись еще не началась, задача уходит сразу.
+    """
+    from .appointments.tasks import send_client_reminder
+
+    if appointment.status != 'CONFIRMED' or not appointment.client_chat_id:
+        return []
+
+    now = timezone.now()
+    if appointment.start_time <= now:
+        return []
+
+    task_ids = []
+    for offset in get_reminder_offsets(appointment.organization_id):
+        eta = appointment.start_time - offset
+        task_id = client_reminder_task_id(appointment.id, offset, appointment.start_time)
+        try:
+            send_client_reminder.apply_async(
+                args=[appointment.id, int(offset.total_seconds()), int(appointment.start_time.timestamp())],
+                eta=eta if eta > now else None,
+                task_id=task_id,
+            )
+            task_ids.append(task_id)
+            logger.info(f"Напоминание для записи ID {appointment.id} запланировано на {eta}.")
+        except Exception as e:
+            # Брокер недоступен: напоминание подберет сверочный обход
+            logger.error(f"Не удалось запланировать напоминание для записи ID {appointment.id}: {e}")
+    return task_ids
+
+
+class _RevokeBatch:
+    """Задачи напоминаний, которые отзываются одной командой после коммита транзакции."""
+
+    def __init__(self):
+        self.task_ids = []
+        # organization_id -> смещения: при массовом удалении не читаем их на каждую запись
+        self.offsets = {}
+
+    def __call__(self):
+        revoke_reminder_tasks(self.task_ids)
+
+
+_revoke_batches = threading.local()
+
+
+def revoke_reminder_tasks(task_ids):
+    """Отзывает задачи напоминаний (если они еще не выполнены) одной командой воркерам."""
+    from celery import current_app
+
+    if not task_ids:
+        return
+    try:
+        current_app.control.revoke(list(task_ids))
+    except Exception as e:
+        # Не критично: сама задача проверит актуальность записи перед отправкой
+        logger.warning(f"Не удалось отозвать задачи напоминаний ({len(task_ids)}): {e}")
+
+
+def revoke_client_reminder(appointment_id, organization_id, start_time):
+    """
+    Отзывает ранее запланированные задачи напоминаний записи после коммита транзакции:
+    вызов брокера не держит транзакцию, а отзывы всей транзакции (например, массового
+    удаления) уходят одной командой. Идентификаторы задач вычисляются сразу — смещения
+    организации могут удаляться в той же транзакции.
+    """
+    connection = transaction.get_connection()
+    batch = getattr(_revoke_batches, 'current', None)
+    # Пачка принимает отзывы, пока ждет коммита; после коммита или отката начинается новая.
+    # Отзывы из отмененной точки сохранения остаются в пачке — не страшно: напоминание
+    # восстановленной записи подберет сверочный обход.
+    pending = batch is not None and any(hook[1] is batch for hook in connection.run_on_commit)
+    if not pending:
+        batch = _revoke_batches.current = _RevokeBatch()
+
+    if organization_id not in batch.offsets:
+        batch.offsets[organization_id] = get_reminder_offsets(organization_id)
+    batch.task_ids.extend(
+        client_reminder_task_id(appointment_id, offset, start_time) for offset in batch.offsets[organization_id]
+    )
+    if not pending:
+        # Вне транзакции on_commit выполняет отзыв сразу
+        transaction.on_commit(batch)
+
+
+def send_scheduled_client_reminder(appointment_id, offset_seconds, expected_start_ts):
+    """
+    Выполняет запланированное напоминание. Игнорирует задачу, если запись отменена
+    или перенесена (start_time не совпадает с ожидаемым); повторную отправку
+    исключает журнал ReminderDelivery.
+
+    Возвращает True, если напоминание отправлено.
+    """
+    appointment = Appointment.objects.select_related('employee', 'service').filter(pk=appointment_id).first()
+    if appointment is None:
+        return False
+
+    if appointment.status != 'CONFIRMED' or int(appointment.start_time.timestamp()) != expected_start_ts:
+        logger.info(f"Задача напоминания для записи ID {appointment_id} устарела. Пропускаю.")
+        return False
+
+    if appointment.start_time <= timezone.now():
+        return False
+
+    appointment.reminder_offset = timedelta(seconds=offset_seconds)
+    sent, _ = _deliver_reminders([appointment])
+    return sent > 0
@@ -0,0 +1,96 @@
+# booking_api/renderers.py
+
+import csv
+import decimal
+import io
+import json
+
+from django.conf import settings
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен: без него используется стандартный json
+    orjson = None
+
+
+def _default(obj):
+    # Как у DRF JSONEncoder: Decimal -> float, ленивые строки (gettext_lazy) -> str
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, Promise):
+        return str(obj)
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def fast_dumps(data):
+    """Компактный JSON (bytes): через orjson, если он установлен, иначе через json."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер для горячих эндпоинтов чтения (слоты, каталог, список записей).
+    Без отступов и без проверки accepted_media_type indent — только компактный вывод.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return fast_dumps(data)
+
+
+def fast_read_path_enabled():
+    """Быстрый путь чтения включается настройкой BOOKING_FAST_READ_PATH (по умолчанию выключен)."""
+    return getattr(settings, 'BOOKING_FAST_READ_PATH', False)
+
+
+class FastReadPathMixin:
+    """
+    Миксин ViewSet/APIView: при BOOKING_FAST_READ_PATH ответы JSON рендерит FastJSONRenderer,
+    остальные рендереры (например, Browsable API) остаются доступны.
+    """
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if not fast_read_path_enabled():
+            return renderers
+        return [FastJSONRenderer()] + [renderer for renderer in renderers if renderer.format != 'json']
+
+
+class CompactJSONRenderer(FastJSONRenderer):
+    """
+    Рендерер для ?format=compact: тот же компактный JSON, формат запроса лишь сообщает
+    представлению, что данные нужно отдать в сжатом виде (см. booking_api.slot_formats).
+    """
+    format = 'compact'
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV (?format=csv) для выгрузок-отчетов: данные — список словарей с одинаковыми ключами,
+    порядок колонок — csv_columns представления (иначе ключи первой строки).
+    Ответ с ошибкой (словарь) выводится одной строкой.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = [data] if isinstance(data, dict) else list(data)
+        view = (renderer_context or {}).get('view')
+        columns = getattr(view, 'csv_columns', None) or (list(rows[0]) if rows else [])
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+        # BOM — чтобы Excel открыл кириллицу без выбора кодировки
+        return ('\ufeff' + buffer.getvalue()).encode(self.charset)
@@ -0,0 +1,155 @@
+# booking_api/schedules.py
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import EmployeeSchedule, ScheduleException, TimeBlocker
+
+# Отправляется один раз на пакет после коммита: employee_ids, date_from, date_to
+# (для шаблона недели — None: затронуты все будущие даты). Точка подписки для всего,
+# что выводится из расписаний (кэши доступности и т.п.), вместо сигнала на каждую строку.
+# Пакет, который ничего не изменил, сигнал не отправляет.
+schedules_changed = Signal()
+
+MINUTES_IN_DAY = 24 * 60
+
+
+def _check_minutes(start_minutes, end_minutes):
+    if start_minutes is None or end_minutes is None:
+        raise ValidationError("Укажите начало и конец (минуты от 00:00).")
+    if not 0 <= start_minutes < end_minutes <= MINUTES_IN_DAY:
+        raise ValidationError("Интервал должен быть внутри суток и начинаться раньше, чем заканчивается.")
+
+
+def _date_range(date_from, date_to, weekdays=None):
+    if date_from > date_to:
+        raise ValidationError("Начало периода позже конца.")
+    max_days = getattr(settings, 'SCHEDULE_BULK_MAX_DAYS', 366)
+    if (date_to - date_from).days >= max_days:
+        raise ValidationError(f"Период не может быть длиннее {max_days} дней.")
+    days = (date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1))
+    return [day for day in days if weekdays is None or day.weekday() in weekdays]
+
+
+def _notify_on_commit(employee_ids, date_from=None, date_to=None):
+    transaction.on_commit(lambda: schedules_changed.send(
+        sender=EmployeeSchedule, employee_ids=sorted(employee_ids), date_from=date_from, date_to=date_to,
+    ))
+
+
+def copy_week_template(source_employee, employee_ids, replace=True):
+    """
+    Копирует шаблон недели (EmployeeSchedule) мастера source_employee другим мастерам.
+    replace=True удаляет у них дни, которых нет в исходном шаблоне.
+    Возвращает (создано, обновлено, удалено).
+    """
+    template = {row.day_of_week: row for row in EmployeeSchedule.objects.filter(employee=source_employee)}
+    if not template:
+        raise ValidationError(f"У мастера {source_employee.name} нет шаблона расписания.")
+    employee_ids = set(employee_ids) - {source_employee.pk}
+
+    with transaction.atomic():
+        existing = {
+            (row.employee_id, row.day_of_week): row
+            for row in EmployeeSchedule.objects.select_for_update().filter(employee_id__in=employee_ids)
+        }
+        to_create, to_update = [], []
+        for employee_id in employee_ids:
+            for day_of_week, source in template.items():
+                row = existing.get((employee_id, day_of_week))
+                if row is None:
+                    to_create.append(EmployeeSchedule(
+                        employee_id=employee_id, day_of_week=day_of_week,
+                        start_minutes=source.start_minutes, end_minutes=source.end_minutes,
+                    ))
+                elif (row.start_minutes, row.end_minutes) != (source.start_minutes, source.end_minutes):
+                    row.start_minutes, row.end_minutes = source.start_minutes, source.end_minutes
+                    to_update.append(row)
+
+        deleted = 0
+        if replace:
+            deleted, _ = EmployeeSchedule.objects.filter(employee_id__in=employee_ids).exclude(
+                day_of_week__in=template.keys()).delete()
+        EmployeeSchedule.objects.bulk_create(to_create)
+        EmployeeSchedule.objects.bulk_update(to_update, ['start_minutes', 'end_minutes'])
+        if to_create or to_update or deleted:
+            _notify_on_commit(employee_ids)
+
+    return len(to_create), len(to_update), deleted
+
+
+def apply_schedule_exception(employee_ids, date_from, date_to, has_new_hours=False,
+                             new_start_minutes=None, new_end_minutes=None, weekdays=None):
+    """
+    Ставит исключение (выходной или новые часы) всем мастерам на каждую дату периода
+    (только weekdays, если заданы; Пн=0). Существующие исключения на эти даты перезаписываются.
+    Возвращает (создано, обновлено).
+    """
+    if has_new_hours:
+        _check_minutes(new_start_minutes, new_end_minutes)
+    else:
+        new_start_minutes = new_end_minutes = None
+    days = _date_range(date_from, date_to, weekdays)
+    employee_ids = set(employee_ids)
+
+    with transaction.atomic():
+        existing = {
+            (row.employee_id, row.date): row
+            for row in ScheduleException.objects.select_for_update().filter(
+                employee_id__in=employee_ids, date__range=(date_from, date_to))
+        }
+        to_create, to_update = [], []
+        for employee_id in employee_ids:
+            for day in days:
+                row = existing.get((employee_id, day))
+                if row is None:
+                    to_create.append(ScheduleException(
+                        employee_id=employee_id, date=day, has_new_hours=has_new_hours,
+                        new_start_minutes=new_start_minutes, new_end_minutes=new_end_minutes,
+                    ))
+                else:
+                    row.has_new_hours = has_new_hours
+                    row.new_start_minutes, row.new_end_minutes = new_start_minutes, new_end_minutes
+                    to_update.append(row)
+
+        ScheduleException.objects.bulk_create(to_create, batch_size=1000)
+        ScheduleException.objects.bulk_update(
+            to_update, ['has_new_hours', 'new_start_minutes', 'new_end_minutes'], batch_size=1000)
+        if to_create or to_update:
+            _notify_on_commit(employee_ids, date_from, date_to)
+
+    return len(to_create), len(to_update)
+
+
+def stamp_recurring_blocker(employee_ids, date_from, date_to, start_minutes, end_minutes,
+                            weekdays=None, reason=''):
+    """
+    Создает одинаковую блокировку (например, обед) всем мастерам на каждую дату периода
+    (только weekdays, если заданы). Уже существующие такие же блокировки не дублируются.
+    Возвращает число созданных блокировок.
+    """
+    _check_minutes(start_minutes, end_minutes)
+    days = _date_range(date_from, date_to, weekdays)
+    employee_ids = set(employee_ids)
+
+    with transaction.atomic():
+        existing = set(TimeBlocker.objects.filter(
+            employee_id__in=employee_ids, date__range=(date_from, date_to),
+            start_minutes=start_minutes, end_minutes=end_minutes,
+        ).values_list('employee_id', 'date'))
+        to_create = [
+            TimeBlocker(employee_id=employee_id, date=day, start_minutes=start_minutes,
+                        end_minutes=end_minutes, reason=reason)
+            for employee_id in employee_ids
+            for day in days
+            if (employee_id, day) not in existing
+        ]
+        TimeBlocker.objects.bulk_create(to_create, batch_size=1000)
+        if to_create:
+            _notify_on_commit(employee_ids, date_from, date_to)
+
+    return len(to_create)
@@ -128,10 +128,7 @@ class AppointmentSerializer(serializers.ModelSerializer):
         # 🚨 ИЗВЛЕКАЕМ CHAT ID ИЗ ВАЛИДИРОВАННЫХ ДАННЫХ
         client_chat_id = validated_data.pop('client_chat_id', None)
         try:
-            client, created = Client.objects.get_or_create(
-                phone_number=client_phone_number,
-                defaults={'name': client_name}
-            )
+            client, created = Client.get_or_create_by_phone(client_phone_number, client_name)
             validated_data['client'] = client
         except Exception as e:
             raise serializers.ValidationError({"client_error": f"Ошибка создания/поиска клиента: {e}"})
@@ -171,4 +168,83 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
             'service', 'service_name', 'client', 'client_name',
             'start_time', 'end_time', 'status', 'address',
             'actual_duration', 'actual_price','client_chat_id'
-        ]
\ No newline at end of file
+        ]
+
+# --- Быстрая сериализация для списка записей (без полей DRF на каждую строку) ---
+
+def _datetime_representation(value):
+    """Как DateTimeField DRF: в текущем часовом поясе, ISO 8601, UTC как 'Z'."""
+    if value is None:
+        return None
+    value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def appointment_detail_data(appointment):
+    """
+    Те же данные, что AppointmentDetailSerializer(appointment).data, собранные вручную.
+    Связи должны быть загружены select_related (см. AppointmentViewSet).
+    При изменении полей AppointmentDetailSerializer обновите и эту функцию.
+    """
+    employee = appointment.employee
+    return {
+        'id': appointment.id,
+        'organization': appointment.organization_id,
+        'organization_name': appointment.organization.name,
+        'employee': appointment.employee_id,
+        'employee_name': employee.name if employee is not None else None,
+        'service': appointment.service_id,
+        'service_name': appointment.service.name,
+        'client': appointment.client_id,
+        'client_name': appointment.client.name,
+        'start_time': _datetime_representation(appointment.start_time),
+        'end_time': _datetime_representation(appointment.end_time),
+        'status': appointment.status,
+        'address': appointment.address,
+        'actual_duration': appointment.actual_duration,
+        'actual_price': appointment.actual_price,
+        'client_chat_id': appointment.client_chat_id,
+    }
+
+
+# --- Массовое изменение расписаний (booking_api.schedules) ---
+class ScheduleBulkEmployeesSerializer(serializers.Serializer):
+    # Список ID, а не PrimaryKeyRelatedField(many=True): тот проверяет каждый ID отдельным запросом
+    employee_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+
+    def validate_employee_ids(self, value):
+        found = set(Employee.objects.filter(pk__in=value).values_list('pk', flat=True))
+        missing = sorted(set(value) - found)
+        if missing:
+            raise serializers.ValidationError(f"Мастера не найдены: {', '.join(map(str, missing))}.")
+        return sorted(found)
+
+
+class CopyWeekTemplateSerializer(ScheduleBulkEmployeesSerializer):
+    source_employee_id = serializers.PrimaryKeyRelatedField(
+        queryset=Employee.objects.all(), source='source_employee'
+    )
+    replace = serializers.BooleanField(default=True)
+
+
+class ScheduleRangeSerializer(ScheduleBulkEmployeesSerializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6), required=False, allow_empty=False
+    )
+
+
+class ScheduleExceptionBulkSerializer(ScheduleRangeSerializer):
+    has_new_hours = serializers.BooleanField(default=False)
+    new_start_minutes = serializers.IntegerField(required=False, allow_null=True)
+    new_end_minutes = serializers.IntegerField(required=False, allow_null=True)
+
+
+class TimeBlockerBulkSerializer(ScheduleRangeSerializer):
+    start_minutes = serializers.IntegerField()
+    end_minutes = serializers.IntegerField()
+    reason = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
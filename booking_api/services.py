@@ -76,12 +76,25 @@ class BookingService:
 
         return free_intervals
 
+    def get_start_of_day(self):
+        """Aware-время полуночи даты бронирования (от нее отсчитываются минуты слотов)."""
+        return timezone.make_aware(datetime.combine(self.booking_date, datetime.min.time()))
+
     def get_available_slots(self):
         """
         Основной метод. Генерирует конечный список доступных слотов.
 
         Возвращает: Список объектов datetime для доступного времени.
         """
+        start_of_day_aware = self.get_start_of_day()
+        return [start_of_day_aware + timedelta(minutes=minutes) for minutes in self.get_available_slot_minutes()]
+
+    def get_available_slot_minutes(self):
+        """
+        То же, что get_available_slots, но без создания datetime.
+
+        Возвращает: Список начал слотов в минутах от полуночи (для компактного формата ответа).
+        """
         base_intervals = self._get_base_working_intervals()
         booked_intervals = self._get_booked_intervals()
 
@@ -91,9 +104,7 @@ class BookingService:
 
         # *** ИСПРАВЛЕНИЕ 2: Использование aware-времени для сравнения ***
         # Получаем aware-время "полуночи" для текущей даты
-        start_of_day_aware = timezone.make_aware(
-            datetime.combine(self.booking_date, datetime.min.time())
-        )
+        start_of_day_aware = self.get_start_of_day()
 
         # Получаем aware-время "сейчас"
         current_time_aware = timezone.now()
@@ -154,8 +165,7 @@ class BookingService:
                 # поэтому дополнительная проверка "if slot_datetime > current_time_aware" больше не нужна,
                 # если мы правильно округляем.
 
-                slot_datetime = start_of_day_aware + timedelta(minutes=slot_start_minutes)
-                available_slots.append(slot_datetime)
+                available_slots.append(slot_start_minutes)
 
                 # 6. Временное логирование для отладки
                 if not available_slots:
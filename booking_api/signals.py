@@ -0,0 +1,129 @@
+# booking_api/signals.py
+
+import logging
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .archive import is_archiving
+from .catalog import invalidate_telegram_catalog
+from .models import Appointment, Employee, Organization, Service
+from .reminders import schedule_client_reminder, revoke_client_reminder
+from .stats import (
+    STATS_SOURCE_FIELDS, apply_stats_deltas, merge_employee_daily_stats, stats_contribution, stats_delta,
+)
+
+logger = logging.getLogger(__name__)
+
+# Поля записи, изменение которых требует перепланировать напоминание
+REMINDER_FIELDS = ('start_time', 'status', 'client_chat_id')
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_previous_appointment_state(sender, instance, raw=False, **kwargs):
+    """
+    Запоминает состояние записи до сохранения, чтобы обнаружить перенос или отмену,
+    и ее прежний вклад в дневную статистику.
+    """
+    instance._previous_state = None
+    instance._previous_stats = None
+    if raw or instance.pk is None:
+        return
+    previous = Appointment.objects.select_related('service').filter(pk=instance.pk).first()
+    if previous is None:
+        return
+    instance._previous_state = {field: getattr(previous, field) for field in REMINDER_FIELDS}
+    instance._previous_stats = stats_contribution(previous)
+
+
+@receiver(post_save, sender=Appointment)
+def reschedule_client_reminder(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Планирует напоминание при создании записи и перепланирует при переносе/отмене.
+    Отзыв старых задач и постановка новой выполняются только после коммита транзакции:
+    воркер должен увидеть запись, а откат не должен отзывать действующее напоминание.
+    """
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(REMINDER_FIELDS):
+        return
+
+    previous = getattr(instance, '_previous_state', None)
+    if not created:
+        if previous is None or all(previous[field] == getattr(instance, field) for field in REMINDER_FIELDS):
+            return
+        revoke_client_reminder(instance.pk, instance.organization_id, previous['start_time'])
+
+    transaction.on_commit(lambda: schedule_client_reminder(instance))
+
+
+@receiver(post_delete, sender=Appointment)
+def revoke_reminder_on_delete(sender, instance, **kwargs):
+    if is_archiving():
+        # В архив уходят только завершенные и отмененные записи — напоминаний у них нет
+        return
+    revoke_client_reminder(instance.pk, instance.organization_id, instance.start_time)
+
+
+# --- Дневная статистика (DailyStats): приращения в той же транзакции, что и запись ---
+
+@receiver(post_save, sender=Appointment)
+def update_daily_stats_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(STATS_SOURCE_FIELDS):
+        return
+    previous = None if created else getattr(instance, '_previous_stats', None)
+    apply_stats_deltas(stats_delta(previous, stats_contribution(instance)))
+
+
+@receiver(post_delete, sender=Appointment)
+def update_daily_stats_on_delete(sender, instance, **kwargs):
+    if is_archiving():
+        # Перенос в AppointmentArchive — запись остается в статистике
+        return
+    apply_stats_deltas(stats_delta(stats_contribution(instance), None))
+
+
+@receiver(pre_delete, sender=Employee)
+def merge_daily_stats_on_employee_delete(sender, instance, origin=None, **kwargs):
+    # Вместе с организацией ее статистика удаляется каскадом — сливать нечего
+    if isinstance(origin, Organization) or getattr(origin, 'model', None) is Organization:
+        return
+    merge_employee_daily_stats(instance.pk)
+
+
+# --- Кэш telegram_catalog: сбрасываем после коммита, чтобы не закэшировать старые данные ---
+
+def _invalidate_catalog_on_commit(*organization_ids):
+    transaction.on_commit(lambda: invalidate_telegram_catalog(*organization_ids))
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_catalog_on_service_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _invalidate_catalog_on_commit(instance.organization_id)
+
+
+@receiver(post_delete, sender=Employee)
+def invalidate_catalog_on_employee_delete(sender, instance, **kwargs):
+    # Связи услуга–мастер удаляются каскадом, без m2m_changed
+    _invalidate_catalog_on_commit(instance.organization_id)
+
+
+@receiver(m2m_changed, sender=Service.employees.through)
+def invalidate_catalog_on_service_employees_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # service.employees.add(...) / remove / clear
+        _invalidate_catalog_on_commit(instance.organization_id)
+        return
+    # employee.services.add(...): затронуты организации этих услуг (и самого мастера)
+    organization_ids = {instance.organization_id}
+    if pk_set:
+        organization_ids.update(Service.objects.filter(pk__in=pk_set).values_list('organization_id', flat=True))
+    _invalidate_catalog_on_commit(*organization_ids)
@@ -0,0 +1,65 @@
+# booking_api/slot_formats.py
+
+import calendar
+from datetime import timedelta
+
+from django.utils import timezone
+
+
+def utc_offset_string(value):
+    """Смещение aware-datetime от UTC в виде '+03:00'."""
+    offset = value.strftime('%z')
+    return f"{offset[:3]}:{offset[3:]}"
+
+
+def month_booking_days(month_start):
+    """Дни месяца, на которые еще можно записаться: с сегодняшнего (или 1-го) числа до конца месяца."""
+    _, last_day = calendar.monthrange(month_start.year, month_start.month)
+    first_day = max(month_start.replace(day=1), timezone.localdate())
+    return [first_day + timedelta(days=offset)
+            for offset in range((month_start.replace(day=last_day) - first_day).days + 1)]
+
+
+def run_length_encode(minutes, step):
+    """
+    Сжимает отсортированные начала слотов в серии [начало, количество]:
+    [540, 600, 660, 780] при step=60 → [[540, 3], [780, 1]].
+    """
+    runs = []
+    for value in minutes:
+        if runs and runs[-1][0] + runs[-1][1] * step == value:
+            runs[-1][1] += 1
+        else:
+            runs.append([value, 1])
+    return runs
+
+
+def compact_day_slots(booking_service):
+    """
+    Компактный ответ available_slots на день (?format=compact): дата, смещение UTC и длительность
+    передаются один раз, слоты — целыми минутами от локальной полуночи.
+    """
+    start_of_day = booking_service.get_start_of_day()
+    return {
+        "employee_name": booking_service.employee.name,
+        "date": booking_service.booking_date.isoformat(),
+        "utc_offset": utc_offset_string(start_of_day),
+        "duration": booking_service.slot_duration,
+        "slots": booking_service.get_available_slot_minutes(),
+    }
+
+
+def month_free_ranges(booking_services):
+    """
+    Ответ available_slots на месяц (?month=YYYY-MM): для каждого дня со свободным временем —
+    серии слотов [начало в минутах, количество] (run_length_encode). Дни без слотов не передаются.
+    """
+    days = {}
+    for booking_service in booking_services:
+        runs = run_length_encode(booking_service.get_available_slot_minutes(), booking_service.slot_duration)
+        if runs:
+            days[booking_service.booking_date.isoformat()] = runs
+    return {
+        "timezone": timezone.get_current_timezone_name(),
+        "days": days,
+    }
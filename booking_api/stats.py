@@ -0,0 +1,187 @@
+# booking_api/stats.py
+
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Appointment, AppointmentArchive, DailyStats
+
+logger = logging.getLogger(__name__)
+
+STATS_FIELDS = ('appointments_count', 'completed_count', 'cancelled_count', 'revenue', 'booked_minutes')
+
+# Поля записи, от которых зависит ее вклад в DailyStats
+STATS_SOURCE_FIELDS = ('organization', 'employee', 'service', 'start_time', 'status', 'custom_price', 'custom_duration')
+
+
+def stats_contribution(appointment):
+    """
+    Вклад записи в DailyStats: (ключ строки, {поле: значение}).
+    Ключ — (organization_id, employee_id, service_id, дата начала по местному времени).
+    """
+    key = (
+        appointment.organization_id,
+        appointment.employee_id,
+        appointment.service_id,
+        timezone.localtime(appointment.start_time).date(),
+    )
+    if appointment.status == 'CANCELLED':
+        return key, {'cancelled_count': 1}
+    return key, {
+        'appointments_count': 1,
+        'completed_count': int(appointment.status == 'COMPLETED'),
+        'revenue': appointment.actual_price,
+        'booked_minutes': appointment.actual_duration,
+    }
+
+
+def stats_delta(previous, current):
+    """
+    Приращения DailyStats при переходе записи из previous в current (вклады stats_contribution,
+    None — записи не было / больше нет). Возвращает {ключ: {поле: приращение}} без нулей.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for contribution, sign in ((previous, -1), (current, 1)):
+        if contribution is None:
+            continue
+        key, values = contribution
+        for field, value in values.items():
+            deltas[key][field] += sign * value
+    return {
+        key: {field: value for field, value in values.items() if value}
+        for key, values in deltas.items()
+        if any(values.values())
+    }
+
+
+def apply_stats_deltas(deltas):
+    """
+    Применяет приращения одним UPDATE ... SET field = field + delta на строку (F()),
+    без чтения текущих значений. Вызывается внутри транзакции сохранения записи:
+    при откате откатится и статистика.
+    """
+    for (organization_id, employee_id, service_id, day), values in deltas.items():
+        lookup = {
+            'organization_id': organization_id,
+            'employee_id': employee_id,
+            'service_id': service_id,
+            'date': day,
+        }
+        updates = {field: F(field) + value for field, value in values.items()}
+        if DailyStats.objects.filter(**lookup).update(**updates):
+            continue
+        if any(value < 0 for value in values.values()):
+            # Строки нет (еще не пересобрана или удаляется вместе с организацией): уменьшать нечего,
+            # а создать ее только с частью приращений — значит записать отрицательные итоги
+            logger.debug(f"DailyStats: нет строки {lookup} для уменьшения, пропускаю (нужен rebuild_daily_stats).")
+            continue
+        try:
+            with transaction.atomic():
+                DailyStats.objects.create(**lookup, **values)
+        except IntegrityError:
+            # Строку только что создал параллельный запрос
+            DailyStats.objects.filter(**lookup).update(**updates)
+
+
+def merge_employee_daily_stats(employee_id):
+    """
+    Переносит строки DailyStats мастера в строки без мастера (employee=NULL) перед его удалением:
+    иначе SET_NULL дал бы по строке «без мастера» на каждого удаленного мастера за тот же день.
+    """
+    rows = DailyStats.objects.filter(employee_id=employee_id)
+    deltas = defaultdict(lambda: defaultdict(int))
+    for row in rows.values('organization_id', 'service_id', 'date', *STATS_FIELDS):
+        values = deltas[(row['organization_id'], None, row['service_id'], row['date'])]
+        for field in STATS_FIELDS:
+            values[field] += row[field]
+    rows.delete()
+    apply_stats_deltas(deltas)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _aggregate_daily(appointments):
+    """Суммы по (организация, мастер, услуга, местная дата) одним запросом GROUP BY."""
+    active = ~Q(status='CANCELLED')
+    return appointments.annotate(
+        day=TruncDate('start_time', tzinfo=timezone.get_current_timezone())
+    ).values('organization_id', 'employee_id', 'service_id', 'day').annotate(
+        appointments_total=Count('id', filter=active),
+        completed_total=Count('id', filter=Q(status='COMPLETED')),
+        cancelled_total=Count('id', filter=Q(status='CANCELLED')),
+        revenue_total=Sum(Coalesce('custom_price', 'service__base_price'), filter=active),
+        minutes_total=Sum(
+            Coalesce('custom_duration', F('service__base_duration') + F('service__buffer_time')),
+            filter=active,
+        ),
+    ).order_by().iterator()
+
+
+def rebuild_daily_stats(organization_id=None, date_from=None, date_to=None, batch_size=1000):
+    """
+    Пересчитывает DailyStats из записей и их архива (за период и/или по организации) агрегирующим
+    запросом на таблицу и заменяет строки за этот период в одной транзакции. Возвращает число строк.
+    """
+    stats = DailyStats.objects.all()
+    if organization_id:
+        stats = stats.filter(organization_id=organization_id)
+    if date_from:
+        stats = stats.filter(date__gte=date_from)
+    if date_to:
+        stats = stats.filter(date__lte=date_to)
+
+    # Перенесенные в архив записи остаются в статистике — считаем обе таблицы
+    totals = defaultdict(lambda: dict.fromkeys(STATS_FIELDS, 0))
+    for model in (Appointment, AppointmentArchive):
+        appointments = model.objects.all()
+        if organization_id:
+            appointments = appointments.filter(organization_id=organization_id)
+        if date_from:
+            appointments = appointments.filter(start_time__gte=_day_start(date_from))
+        if date_to:
+            appointments = appointments.filter(start_time__lt=_day_start(date_to + timedelta(days=1)))
+        for row in _aggregate_daily(appointments):
+            values = totals[(row['organization_id'], row['employee_id'], row['service_id'], row['day'])]
+            values['appointments_count'] += row['appointments_total']
+            values['completed_count'] += row['completed_total']
+            values['cancelled_count'] += row['cancelled_total']
+            values['revenue'] += row['revenue_total'] or 0
+            values['booked_minutes'] += row['minutes_total'] or 0
+
+    objects = [
+        DailyStats(organization_id=organization, employee_id=employee, service_id=service, date=day, **values)
+        for (organization, employee, service, day), values in totals.items()
+    ]
+    with transaction.atomic():
+        stats.delete()
+        DailyStats.objects.bulk_create(objects, batch_size=batch_size)
+    return len(objects)
+
+
+def daily_stats_report(date_from, date_to=None, organization_id=None, employee_id=None, service_id=None):
+    """
+    Итоги по дням за период из DailyStats: число строк зависит от дней, мастеров и услуг,
+    а не от количества записей. Возвращает (список по датам, итог за период).
+    """
+    stats = DailyStats.objects.filter(date__gte=date_from)
+    if date_to:
+        stats = stats.filter(date__lte=date_to)
+    for field, value in (('organization_id', organization_id), ('employee_id', employee_id),
+                         ('service_id', service_id)):
+        if value:
+            stats = stats.filter(**{field: value})
+
+    sums = {f"{field}_sum": Sum(field) for field in STATS_FIELDS}
+    data = [
+        {'date': row['date'].strftime('%Y-%m-%d'), **{field: row[f"{field}_sum"] for field in STATS_FIELDS}}
+        for row in stats.values('date').annotate(**sums).order_by('date')
+    ]
+    totals = stats.aggregate(**sums)
+    return data, {field: totals[f"{field}_sum"] or 0 for field in STATS_FIELDS}
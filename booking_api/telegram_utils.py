@@ -28,7 +28,9 @@ def send_telegram_notification(chat_id: str, message: str) -> bool:
         logger.warning("Ошибка: Chat ID мастера не указан.")
         return False
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    # TELEGRAM_API_URL можно переопределить (например, фейковый Telegram в нагрузочном тесте)
+    api_url = getattr(settings, "TELEGRAM_API_URL", "https://api.telegram.org")
+    url = f"{api_url}/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
 
     payload = {
         'chat_id': chat_id,
@@ -0,0 +1,93 @@
+# booking_api/testing.py
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def capture_queries(func, *args, **kwargs):
+    """Выполняет func и возвращает (результат, список SQL-запросов)."""
+    with CaptureQueriesContext(connection) as context:
+        result = func(*args, **kwargs)
+    return result, [query['sql'] for query in context.captured_queries]
+
+
+def response_results(response):
+    data = response.json()
+    return data.get('results', data) if isinstance(data, dict) else data
+
+
+def assert_query_count_independent_of_size(label, fetch, sizes=(1, 5, 25)):
+    """
+    Общая часть проверок на N+1: fetch(size) выполняет запрос, который должен вернуть size строк,
+    и возвращает фактическое число строк. Падает с AssertionError, если строк не столько,
+    сколько ожидалось (проверка ничего бы не доказала), или если число SQL-запросов
+    при разных size различается. Возвращает {size: число запросов}.
+    """
+    counts = {}
+    queries_by_size = {}
+    for size in sizes:
+        rows, queries = capture_queries(fetch, size)
+        assert rows == size, (
+            f"{label}: для размера {size} получено {rows} строк — "
+            f"создайте не меньше {max(sizes)} строк для проверки"
+        )
+        counts[size] = len(queries)
+        queries_by_size[size] = queries
+
+    smallest, largest = min(sizes), max(sizes)
+    if counts[largest] != counts[smallest]:
+        details = "\n".join(f"  {sql}" for sql in queries_by_size[largest])
+        raise AssertionError(
+            f"{label}: число запросов растет с размером {counts} (N+1?).\n"
+            f"Запросы при размере {largest}:\n{details}"
+        )
+    return counts
+
+
+def assert_constant_query_count(client, url, params=None, page_sizes=(1, 5, 25), page_size_param='page_size'):
+    """
+    Проверка для тестов: число SQL-запросов списка не зависит от размера страницы.
+
+    Запрашивает url (тестовым client) с каждым page_size из page_sizes и падает
+    с AssertionError, если количество запросов различается — значит, сериализатор
+    догружает связи по строке (N+1). В базе должно быть не меньше max(page_sizes)
+    подходящих строк, иначе проверка ничего не доказывает и тоже падает.
+
+    Пример:
+        assert_constant_query_count(self.client, '/api/v1/appointments/', {'organization_id': org.id})
+    """
+    def fetch(size):
+        response = client.get(url, {**(params or {}), page_size_param: size})
+        assert response.status_code == 200, f"{url}: статус {response.status_code}"
+        return len(response_results(response))
+
+    return assert_query_count_independent_of_size(f"{url} ({page_size_param})", fetch, page_sizes)
+
+
+def assert_admin_changelist_constant_query_count(client, model, params=None, page_sizes=(1, 5, 25)):
+    """
+    То же для списка в админке: client должен быть авторизован как суперпользователь.
+    Размер страницы задается через list_per_page зарегистрированного ModelAdmin
+    (на время проверки), строки считаются по changelist.result_list.
+
+    Пример:
+        self.client.force_login(superuser)
+        assert_admin_changelist_constant_query_count(self.client, Appointment)
+    """
+    from django.contrib import admin
+    from django.urls import reverse
+
+    model_admin = admin.site._registry[model]
+    url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+
+    def fetch(size):
+        model_admin.list_per_page = size
+        response = client.get(url, params or {})
+        assert response.status_code == 200, f"{url}: статус {response.status_code}"
+        return len(response.context['cl'].result_list)
+
+    original_per_page = model_admin.list_per_page
+    try:
+        return assert_query_count_independent_of_size(f"{url} (list_per_page)", fetch, page_sizes)
+    finally:
+        model_admin.list_per_page = original_per_page
@@ -0,0 +1,681 @@
+# booking_api/tests.py
+
+import base64
+import importlib.util
+import json
+import logging
+import os
+from collections import Counter
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Appointment, AppointmentArchive, Client, DailyStats, Employee, EmployeeSchedule, Organization, ReminderDelivery,
+    ScheduleException, Service, TimeBlocker,
+)
+from . import reminders
+from .intervals import (
+    base_working_intervals, merge_intervals, overlap_minutes, subtract_blockers, total_minutes,
+)
+from .notifications import flush_pending_master_notifications
+from .phones import normalize_phone_number
+from .reminders import sweep_client_reminders
+from .schedules import schedules_changed
+from .stats import STATS_FIELDS, rebuild_daily_stats
+from .utilization import split_by_days, utilization_report
+from .testing import (
+    assert_admin_changelist_constant_query_count, assert_constant_query_count,
+    assert_query_count_independent_of_size, response_results,
+)
+
+SIZES = (1, 5, 25)
+
+
+def create_organization(name, employees=2, services=1):
+    """Организация с мастерами и услугами; каждую услугу оказывают все мастера организации."""
+    organization = Organization.objects.create(name=name, address=f"{name}, адрес")
+    staff = Employee.objects.bulk_create(
+        Employee(organization=organization, name=f"{name} мастер {index}") for index in range(employees)
+    )
+    catalog = Service.objects.bulk_create(
+        Service(organization=organization, name=f"{name} услуга {index}", category=f"Категория {index % 3}",
+                base_duration=30 + index, base_price=Decimal('1000.00') + index)
+        for index in range(services)
+    )
+    for service in catalog:
+        service.employees.set(staff)
+    return organization, staff, catalog
+
+
+def create_appointments(organization, staff, catalog, count):
+    """count записей у разных клиентов, мастеров и услуг (через save — с сигналами, как в API)."""
+    start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    appointments = []
+    for index in range(count):
+        client = Client.objects.create(name=f"Клиент {index}", phone_number=f"+7900{organization.pk:03d}{index:04d}")
+        service = catalog[index % len(catalog)]
+        start_time = start + timedelta(hours=index)
+        appointments.append(Appointment.objects.create(
+            organization=organization,
+            client=client,
+            employee=staff[index % len(staff)],
+            service=service,
+            start_time=start_time,
+            end_time=start_time + timedelta(minutes=service.total_duration),
+            status='CONFIRMED',
+            client_chat_id=str(1000 + index),
+        ))
+    return appointments
+
+
+class ListQueryCountTests(TestCase):
+    """Число запросов списков API не должно расти с количеством строк (N+1)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='staff', password='password')
+        cls.organization, cls.staff, cls.catalog = create_organization('Салон', employees=3, services=4)
+        create_appointments(cls.organization, cls.staff, cls.catalog, max(SIZES))
+
+        # Для списков без пагинации — по организации на каждый размер
+        cls.organizations_by_size = {
+            size: create_organization(f"Организация {size}", employees=size, services=size)[0]
+            for size in SIZES
+        }
+
+    def test_appointments_list(self):
+        self.client.force_login(self.user)
+        assert_constant_query_count(
+            self.client, reverse('appointment-list'), {'organization_id': self.organization.pk}, SIZES)
+
+    def test_appointments_list_with_archive(self):
+        self.client.force_login(self.user)
+        assert_constant_query_count(
+            self.client, reverse('appointment-list'),
+            {'organization_id': self.organization.pk, 'include_archived': 1}, SIZES)
+
+    def test_services_list(self):
+        def fetch(size):
+            response = self.client.get(
+                reverse('service-list'), {'organization_id': self.organizations_by_size[size].pk})
+            self.assertEqual(response.status_code, 200)
+            services = response_results(response)
+            # Вложенные мастера тоже должны загружаться без запроса на услугу
+            self.assertTrue(all(len(service['employees']) == size for service in services))
+            return len(services)
+
+        assert_query_count_independent_of_size('services', fetch, SIZES)
+
+    def test_employees_list(self):
+        def fetch(size):
+            organization = self.organizations_by_size[size]
+            response = self.client.get(reverse('employee-list'), {
+                'organization_id': organization.pk,
+                'service_id': Service.objects.filter(organization=organization).order_by('pk').first().pk,
+            })
+            self.assertEqual(response.status_code, 200)
+            return len(response_results(response))
+
+        assert_query_count_independent_of_size('employees', fetch, SIZES)
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсорная пагинация списка записей: обход вперед и назад без пропусков и повторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='staff', password='password')
+        cls.organization, staff, catalog = create_organization('Салон', employees=3)
+        client = Client.objects.create(name='Клиент', phone_number='+79000000001')
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        # Четыре момента начала, у каждого по записи к каждому мастеру: одинаковые start_time на стыках страниц
+        for hour in range(4):
+            for employee in staff:
+                Appointment.objects.create(
+                    organization=cls.organization, client=client, employee=employee, service=catalog[0],
+                    start_time=start + timedelta(hours=hour), end_time=start, status='CONFIRMED')
+        # Архив: страницы сливаются из двух таблиц. Половина строк — в те же моменты, что и записи
+        # (совпадения start_time между таблицами), половина — годом раньше
+        AppointmentArchive.objects.bulk_create(
+            AppointmentArchive(
+                id=10_000 + appointment.pk, organization=cls.organization, client=client,
+                employee=appointment.employee, service=appointment.service, status='COMPLETED',
+                start_time=start_time, end_time=start_time + timedelta(minutes=30),
+            )
+            for appointment in Appointment.objects.all()
+            for start_time in [appointment.start_time - timedelta(days=365) * (appointment.pk % 2)]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def walk(self, params, page_size):
+        """Все страницы по ссылкам next, затем обратно по previous: (страницы вперед, страницы назад)."""
+        url = reverse('appointment-list')
+        params = {'organization_id': self.organization.pk, 'page_size': page_size, **params}
+        forward, backward = [], []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            forward.append([item['id'] for item in response.json()['results']])
+            if not response.json()['next']:
+                break
+            response = self.client.get(response.json()['next'])
+        while response.json()['previous']:
+            response = self.client.get(response.json()['previous'])
+            self.assertEqual(response.status_code, 200)
+            backward.append([item['id'] for item in response.json()['results']])
+        return forward, backward
+
+    def assert_walk(self, params, expected):
+        for page_size in (1, 2, 5, len(expected), len(expected) + 1):
+            with self.subTest(page_size=page_size, **params):
+                forward, backward = self.walk(params, page_size)
+                self.assertEqual([pk for page in forward for pk in page], expected)
+                self.assertTrue(all(len(page) == page_size for page in forward[:-1]))
+                # Назад — те же страницы в обратном порядке (кроме последней, с которой начали)
+                self.assertEqual(backward, forward[-2::-1])
+
+    def test_cursor_round_trip_with_ties(self):
+        expected = list(Appointment.objects.filter(organization=self.organization)
+                        .order_by('-start_time', '-id').values_list('id', flat=True))
+        self.assertEqual(len(expected), 12)
+        self.assert_walk({}, expected)
+
+    def test_cursor_round_trip_with_archive(self):
+        rows = [(row.start_time, row.pk) for model in (Appointment, AppointmentArchive)
+                for row in model.objects.filter(organization=self.organization)]
+        expected = [pk for _, pk in sorted(rows, reverse=True)]
+        self.assert_walk({'include_archived': 1}, expected)
+
+    def test_invalid_cursor_or_filter_is_bad_request(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        url = reverse('appointment-list')
+        for params in ({'cursor': 'не-курсор'}, {'cursor': encode([])}, {'cursor': encode('x')},
+                       {'cursor': encode({'t': 'вчера', 'id': 1})}, {'cursor': encode({'t': '2025-01-01T10:00'})},
+                       {'employee_id': 'abc'}, {'status': 'UNKNOWN'}, {'date_from': '01.01.2025'}):
+            with self.subTest(**params):
+                response = self.client.get(url, {'organization_id': self.organization.pk, **params})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """Число запросов списков админки не зависит от list_per_page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = get_user_model().objects.create_superuser(
+            username='admin', email='admin@example.com', password='password')
+        organization, staff, catalog = create_organization('Салон', employees=max(SIZES), services=max(SIZES))
+        appointments = create_appointments(organization, staff, catalog, max(SIZES))
+        AppointmentArchive.objects.bulk_create(
+            AppointmentArchive(
+                id=10_000 + appointment.pk, organization=organization, client=appointment.client,
+                employee=appointment.employee, service=appointment.service, status='COMPLETED',
+                start_time=appointment.start_time - timedelta(days=365),
+                end_time=appointment.end_time - timedelta(days=365),
+            )
+            for appointment in appointments
+        )
+        for index in range(max(SIZES) - 1):
+            create_organization(f"Филиал {index}", employees=2, services=2)
+
+        day = timezone.localdate() + timedelta(days=7)
+        EmployeeSchedule.objects.bulk_create(
+            EmployeeSchedule(employee=employee, day_of_week=0, start_minutes=9 * 60, end_minutes=18 * 60)
+            for employee in staff
+        )
+        ScheduleException.objects.bulk_create(
+            ScheduleException(employee=employee, date=day) for employee in staff
+        )
+        TimeBlocker.objects.bulk_create(
+            TimeBlocker(employee=employee, date=day, start_minutes=13 * 60, end_minutes=14 * 60, reason='Обед')
+            for employee in staff
+        )
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+
+    def test_changelists(self):
+        for model in (Organization, Employee, Service, Client, Appointment, AppointmentArchive,
+                      EmployeeSchedule, ScheduleException, TimeBlocker):
+            with self.subTest(model=model.__name__):
+                assert_admin_changelist_constant_query_count(self.client, model, page_sizes=SIZES)
+
+
+@override_settings(CLIENT_REMINDER_OFFSET_HOURS=24, CLIENT_REMINDER_CLAIM_TTL_MINUTES=10,
+                   CLIENT_REMINDER_RECONCILE_GRACE_MINUTES=15)
+class ReminderDeliveryTests(TestCase):
+    """Каждое напоминание отправляется ровно один раз, даже при пересекающихся обходах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        organization, staff, catalog = create_organization('Салон')
+        cls.appointments = create_appointments(organization, staff, catalog, 3)
+        # Момент напоминания (за 24 часа) — 20 минут назад: раньше границы обхода (now - 15 минут)
+        start = timezone.now() + timedelta(hours=23, minutes=40)
+        for index, appointment in enumerate(cls.appointments):
+            appointment.start_time = start + timedelta(minutes=index)
+            appointment.end_time = appointment.start_time + timedelta(minutes=30)
+            appointment.save()
+
+    def sweep(self, now, on_send=None):
+        """Обход с подменой отправки в Telegram; возвращает Counter отправок по chat_id."""
+        sent = Counter()
+
+        def send(chat_id, message):
+            sent[chat_id] += 1
+            if on_send:
+                on_send(sent)
+            return True
+
+        with mock.patch('booking_api.reminders.send_telegram_notification', side_effect=send):
+            sweep_client_reminders(now=now)
+        return sent
+
+    def test_overlapping_sweeps_send_once(self):
+        now = timezone.now()
+        nested = []
+
+        def run_second_sweep(sent):
+            # Второй воркер запускает обход, пока первый еще отправляет свою пачку
+            if not nested:
+                nested.append(self.sweep(now))
+
+        sent = self.sweep(now, on_send=run_second_sweep)
+        self.assertEqual(sent + nested[0],
+                         Counter({appointment.client_chat_id: 1 for appointment in self.appointments}))
+        self.assertEqual(ReminderDelivery.objects.filter(sent_at__isnull=False).count(), len(self.appointments))
+
+    def test_stale_claims_of_slow_worker_are_not_resent(self):
+        now = timezone.now()
+        later = Counter()
+        confirm_claim = reminders._confirm_claim
+        confirmations = []
+
+        def slow_confirm(delivery_id, token):
+            # Первый воркер отправил одно напоминание и «завис» дольше TTL захвата перед следующим:
+            # другой воркер снимает его устаревшие захваты и отправляет оставшееся сам
+            confirmations.append(delivery_id)
+            if len(confirmations) == 2:
+                later_now = timezone.now() + timedelta(minutes=11)
+                with mock.patch('django.utils.timezone.now', return_value=later_now):
+                    later.update(self.sweep(later_now))
+            return confirm_claim(delivery_id, token)
+
+        with mock.patch('booking_api.reminders._confirm_claim', side_effect=slow_confirm):
+            sent = self.sweep(now)
+        self.assertEqual(sent + later, Counter({appointment.client_chat_id: 1 for appointment in self.appointments}))
+        # Уже отправленное первым воркером второй не повторил, а захваченное вторым первый не отправил
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(len(later), len(self.appointments) - 1)
+
+
+class MasterNotificationTests(TestCase):
+    """Отложенная сводка мастеру (DEBOUNCE) берет только записи своего окна."""
+
+    def test_flush_is_bounded_by_window(self):
+        organization, staff, catalog = create_organization('Салон', employees=1)
+        master = staff[0]
+        earlier, *window = create_appointments(organization, staff, catalog, 3)
+        Employee.objects.filter(pk=master.pk).update(telegram_chat_id='555')
+
+        with mock.patch('booking_api.notifications.send_telegram_notification', return_value=True) as send:
+            sent = flush_pending_master_notifications(master.pk, since_id=window[0].pk)
+
+        self.assertEqual(sent, len(window))
+        self.assertNotIn(earlier.client.phone_number, send.call_args.args[1])
+        self.assertEqual(set(Appointment.objects.filter(master_notified_at__isnull=False).values_list('pk', flat=True)),
+                         {appointment.pk for appointment in window})
+
+
+class ReminderRevokeTests(TestCase):
+    """Задачи напоминаний отзываются после коммита, одной командой на транзакцию."""
+
+    @classmethod
+    def setUpTestData(cls):
+        organization, staff, catalog = create_organization('Салон')
+        cls.appointments = create_appointments(organization, staff, catalog, 5)
+
+    def test_bulk_delete_revokes_once_after_commit(self):
+        with mock.patch('celery.current_app.control.revoke') as revoke:
+            with self.captureOnCommitCallbacks(execute=True):
+                Appointment.objects.filter(pk__in=[appointment.pk for appointment in self.appointments]).delete()
+                revoke.assert_not_called()
+
+        revoke.assert_called_once()
+        self.assertCountEqual(revoke.call_args.args[0], [
+            reminders.client_reminder_task_id(appointment.pk, reminders.get_default_reminder_offset(),
+                                              appointment.start_time)
+            for appointment in self.appointments
+        ])
+
+    def test_reschedule_does_not_revoke_before_commit(self):
+        appointment = self.appointments[0]
+        with mock.patch('celery.current_app.control.revoke') as revoke:
+            # Без коммита (как при откате) отзыва нет
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                appointment.start_time += timedelta(hours=1)
+                appointment.save()
+            revoke.assert_not_called()
+            # Первым зарегистрирован отзыв старой задачи, за ним — постановка новой
+            callbacks[0]()
+        revoke.assert_called_once()
+
+
+class DailyStatsTests(TestCase):
+    """Приращения DailyStats из сигналов совпадают с пересборкой rebuild_daily_stats."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization, cls.staff, cls.catalog = create_organization('Салон', employees=2, services=2)
+
+    @staticmethod
+    def stats_rows():
+        # Строки с нулевыми итогами пересборка не создает — сравниваем без них
+        return {
+            (row.pop('organization_id'), row.pop('employee_id'), row.pop('service_id'), row.pop('date')): row
+            for row in DailyStats.objects.values(
+                'organization_id', 'employee_id', 'service_id', 'date', *STATS_FIELDS)
+            if any(row[field] for field in STATS_FIELDS)
+        }
+
+    def assert_matches_rebuild(self, step):
+        incremental = self.stats_rows()
+        rebuild_daily_stats()
+        self.assertEqual(incremental, self.stats_rows(), step)
+
+    def test_lifecycle_matches_rebuild(self):
+        appointments = create_appointments(self.organization, self.staff, self.catalog, 3)
+        self.assert_matches_rebuild('create')
+
+        moved = appointments[0]
+        moved.start_time += timedelta(days=1)
+        moved.employee = self.staff[1]
+        moved.save()
+        self.assert_matches_rebuild('reschedule')
+
+        cancelled = appointments[1]
+        cancelled.status = 'CANCELLED'
+        cancelled.save()
+        self.assert_matches_rebuild('cancel')
+
+        completed = appointments[2]
+        completed.status = 'COMPLETED'
+        completed.custom_price = Decimal('1500.00')
+        completed.save()
+        self.assert_matches_rebuild('complete')
+
+        for appointment in appointments:
+            appointment.delete()
+        self.assert_matches_rebuild('delete')
+        self.assertFalse(self.stats_rows())
+
+    def test_decrement_without_row_creates_nothing(self):
+        appointment, = create_appointments(self.organization, self.staff, self.catalog, 1)
+        # Статистика еще не пересобрана (например, записи созданы до появления DailyStats)
+        DailyStats.objects.all().delete()
+
+        appointment.status = 'CANCELLED'
+        appointment.save()
+        self.assertFalse(DailyStats.objects.exists())
+
+        appointment.delete()
+        self.assertFalse(DailyStats.objects.exists())
+
+
+# (ввод, ожидаемый E.164) — общие случаи для API и бота
+PHONE_NORMALIZATION_CASES = [
+    ('+7 (900) 123-45-67', '+79001234567'),
+    ('8 900 123 45 67', '+79001234567'),
+    ('79001234567', '+79001234567'),
+    ('9001234567', '+79001234567'),
+    ('0049 30 1234567', '+49301234567'),
+    ('+49 30 1234567', '+49301234567'),
+    ('  +380 44 123 45 67 ', '+380441234567'),
+    ('12345', None),
+    ('+0 123 456 789', None),
+    ('+1234567890123456', None),
+]
+
+
+def load_bot_module():
+    """Модуль бота для сравнения с API (нужны python-telegram-bot и переменные окружения бота)."""
+    path = Path(__file__).resolve().parent.parent / 'telegram_bot' / 'telegram_bot.py'
+    spec = importlib.util.spec_from_file_location('telegram_bot_under_test', path)
+    module = importlib.util.module_from_spec(spec)
+    root_level = logging.getLogger().level
+    env = {'TELEGRAM_BOT_TOKEN': 'test', 'API_BASE_URL': 'http://testserver/api/v1/', 'PHONE_DEFAULT_COUNTRY_CODE': '7'}
+    try:
+        with mock.patch.dict(os.environ, env), mock.patch('dotenv.load_dotenv'):
+            spec.loader.exec_module(module)
+    finally:
+        # Бот при импорте включает DEBUG для всего логирования
+        logging.getLogger().setLevel(root_level)
+    return module
+
+
+class PhoneLookupTests(TestCase):
+    """Поиск записей по телефону («Мои записи»): только с авторизацией и с ограничением частоты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='bot', password='password')
+        organization, staff, catalog = create_organization('Салон')
+        cls.appointment, = create_appointments(organization, staff, catalog, 1)
+
+    def lookup(self, **headers):
+        return self.client.get(reverse('appointment-list'),
+                               {'phone_number': self.appointment.client.phone_number}, headers=headers)
+
+    def test_anonymous_lookup_is_rejected(self):
+        self.assertIn(self.lookup().status_code, (401, 403))
+
+    @override_settings(BOOKING_THROTTLE_RATES={'phone_lookup_chat': '2/min'})
+    def test_lookup_is_throttled_per_chat(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        response = self.lookup(**{'X-Telegram-Chat-Id': '42'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response_results(response)], [self.appointment.pk])
+        self.assertEqual(self.lookup(**{'X-Telegram-Chat-Id': '42'}).status_code, 200)
+        self.assertEqual(self.lookup(**{'X-Telegram-Chat-Id': '42'}).status_code, 429)
+        # Лимит — на чат, а не на токен бота
+        self.assertEqual(self.lookup(**{'X-Telegram-Chat-Id': '43'}).status_code, 200)
+
+    @override_settings(PHONE_DEFAULT_COUNTRY_CODE='7')
+    def test_api_and_bot_normalize_phones_alike(self):
+        try:
+            bot = load_bot_module()
+        except ImportError as e:
+            self.skipTest(f"Зависимости бота не установлены: {e}")
+
+        for raw, expected in PHONE_NORMALIZATION_CASES:
+            with self.subTest(phone=raw):
+                self.assertEqual(normalize_phone_number(raw), expected)
+                if expected is None:
+                    # Бот отдает нераспознанный номер очищенным — API его тоже не примет
+                    self.assertIsNone(normalize_phone_number(bot.clean_phone_number(raw)))
+                else:
+                    self.assertEqual(bot.clean_phone_number(raw), expected)
+
+
+class IntervalTests(SimpleTestCase):
+    """Чистые функции booking_api.intervals и разбиение записей по дням отчета загрузки."""
+
+    def test_merge_intervals(self):
+        self.assertEqual(
+            merge_intervals([(60, 120), (100, 180), (180, 200), (300, 300), (250, 240), (10, 20)]),
+            [(10, 20), (60, 200)])
+        self.assertEqual(merge_intervals([]), [])
+
+    def test_base_working_intervals(self):
+        schedule = EmployeeSchedule(day_of_week=0, start_minutes=9 * 60, end_minutes=18 * 60)
+        self.assertEqual(base_working_intervals(schedule, None), [(540, 1080)])
+        self.assertEqual(base_working_intervals(None, None), [])
+        # Исключение важнее шаблона: выходной или новые часы
+        self.assertEqual(base_working_intervals(schedule, ScheduleException(has_new_hours=False)), [])
+        self.assertEqual(base_working_intervals(schedule, ScheduleException(
+            has_new_hours=True, new_start_minutes=600, new_end_minutes=900)), [(600, 900)])
+
+    def test_subtract_blockers(self):
+        blockers = [TimeBlocker(start_minutes=start, end_minutes=end)
+                    for start, end in ((480, 560), (600, 660), (650, 700), (1000, 1200))]
+        self.assertEqual(subtract_blockers([(540, 1080)], blockers), [(560, 600), (700, 1000)])
+        self.assertEqual(subtract_blockers([(540, 720), (780, 1080)], blockers[1:2]),
+                         [(540, 600), (660, 720), (780, 1080)])
+        self.assertEqual(subtract_blockers([(540, 1080)], []), [(540, 1080)])
+
+    def test_overlap_and_total_minutes(self):
+        working = [(0, 100), (200, 300)]
+        self.assertEqual(overlap_minutes(working, [(50, 250)]), 100)
+        self.assertEqual(overlap_minutes(working, [(100, 200)]), 0)
+        self.assertEqual(overlap_minutes(working, []), 0)
+        self.assertEqual(overlap_minutes(working, [(0, 40), (60, 210), (290, 400)]), 40 + 40 + 10 + 10)
+        self.assertEqual(total_minutes(working + [(400, 390)]), 200)
+
+    def test_split_by_days_across_midnight(self):
+        day = timezone.localdate()
+        start = timezone.make_aware(datetime.combine(day, time(23, 0)))
+        end = start + timedelta(hours=2, minutes=30)
+        self.assertEqual(split_by_days(start, end, day, day + timedelta(days=1)),
+                         [(day, 23 * 60, 24 * 60), (day + timedelta(days=1), 0, 90)])
+        # Части вне периода отбрасываются
+        self.assertEqual(split_by_days(start, end, day + timedelta(days=1), day + timedelta(days=1)),
+                         [(day + timedelta(days=1), 0, 90)])
+        self.assertEqual(split_by_days(start, end, day, day), [(day, 23 * 60, 24 * 60)])
+
+
+class UtilizationReportTests(TestCase):
+    """Рабочие минуты отчета совпадают с Employee.get_working_intervals, занятые — в пределах работы."""
+
+    def test_report_matches_working_intervals(self):
+        organization, staff, catalog = create_organization('Салон', employees=1)
+        employee = staff[0]
+        EmployeeSchedule.objects.bulk_create(
+            EmployeeSchedule(employee=employee, day_of_week=weekday, start_minutes=9 * 60, end_minutes=18 * 60)
+            for weekday in range(7)
+        )
+        date_from = timezone.localdate() + timedelta(days=7)
+        days = [date_from + timedelta(days=offset) for offset in range(7)]
+        ScheduleException.objects.create(employee=employee, date=days[2], has_new_hours=False)
+        ScheduleException.objects.create(employee=employee, date=days[3], has_new_hours=True,
+                                         new_start_minutes=12 * 60, new_end_minutes=16 * 60)
+        ScheduleException.objects.create(employee=employee, date=days[5], has_new_hours=True,
+                                         new_start_minutes=0, new_end_minutes=2 * 60)
+        TimeBlocker.objects.create(employee=employee, date=days[0], start_minutes=13 * 60, end_minutes=14 * 60)
+
+        client = Client.objects.create(name='Клиент', phone_number='+79000000001')
+
+        def book(day, hour, minute, duration, status='CONFIRMED'):
+            start_time = timezone.make_aware(datetime.combine(day, time(hour, minute)))
+            # end_time пересчитывает Appointment.save по custom_duration
+            Appointment.objects.create(
+                organization=organization, client=client, employee=employee, service=catalog[0],
+                start_time=start_time, end_time=start_time, custom_duration=duration, status=status)
+
+        book(days[0], 10, 0, 60)
+        book(days[0], 12, 30, 60)  # вторая половина — на блокировке
+        book(days[1], 11, 0, 60, status='CANCELLED')
+        book(days[3], 17, 0, 30)  # вне новых часов исключения
+        book(days[4], 23, 0, 120)  # через полночь: час попадает в рабочие часы следующего дня
+
+        report, = utilization_report(organization.pk, days[0], days[-1])
+        expected_booked = {days[0]: 90, days[5]: 60}
+        for day, row in zip(days, report['days']):
+            with self.subTest(day=day):
+                self.assertEqual(row['period'], day.isoformat())
+                self.assertEqual(row['working_minutes'],
+                                 total_minutes(merge_intervals(employee.get_working_intervals(day))))
+                self.assertEqual(row['booked_minutes'], expected_booked.get(day, 0))
+        self.assertEqual(report['booked_minutes'], 150)
+
+
+class ScheduleBulkTests(TestCase):
+    """Массовые изменения расписаний: идемпотентность, дни недели, конфликт и сигнал после коммита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser(
+            username='admin', email='admin@example.com', password='password')
+        organization, cls.staff, catalog = create_organization('Салон', employees=3)
+        cls.employee_ids = sorted(employee.pk for employee in cls.staff)
+        # Понедельник через неделю: период из двух полных недель
+        today = timezone.localdate()
+        cls.date_from = today + timedelta(days=7 - today.weekday())
+        cls.date_to = cls.date_from + timedelta(days=13)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.received = []
+        schedules_changed.connect(self.receiver)
+        self.addCleanup(schedules_changed.disconnect, self.receiver)
+
+    def receiver(self, sender, **kwargs):
+        kwargs.pop('signal')
+        self.received.append(kwargs)
+
+    def post(self, action, **data):
+        payload = {'employee_ids': self.employee_ids, 'date_from': self.date_from.isoformat(),
+                   'date_to': self.date_to.isoformat(), **data}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse(f'schedule-bulk-{action}'), payload, content_type='application/json')
+
+    def test_stamping_blocker_twice_is_idempotent(self):
+        lunch = {'start_minutes': 13 * 60, 'end_minutes': 14 * 60, 'reason': 'Обед'}
+        response = self.post('blockers', **lunch)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'created': 14 * len(self.staff)})
+
+        response = self.post('blockers', **lunch)
+        self.assertEqual(response.json(), {'created': 0})
+        self.assertEqual(TimeBlocker.objects.count(), 14 * len(self.staff))
+        # Сигнал — один раз на пакет, и только если пакет что-то изменил
+        self.assertEqual(self.received, [
+            {'employee_ids': self.employee_ids, 'date_from': self.date_from, 'date_to': self.date_to},
+        ])
+
+    def test_weekday_filter(self):
+        response = self.post('exceptions', weekdays=[0, 5])
+        self.assertEqual(response.json(), {'created': 4 * len(self.staff), 'updated': 0})
+        dates = set(ScheduleException.objects.values_list('date', flat=True))
+        self.assertEqual({day.weekday() for day in dates}, {0, 5})
+        self.assertEqual(len(dates), 4)
+
+        response = self.post('exceptions', weekdays=[0], has_new_hours=True,
+                             new_start_minutes=10 * 60, new_end_minutes=15 * 60)
+        self.assertEqual(response.json(), {'created': 0, 'updated': 2 * len(self.staff)})
+        self.assertEqual(len(self.received), 2)
+
+    def test_copy_week_signal_covers_all_dates(self):
+        source, *targets = self.staff
+        EmployeeSchedule.objects.create(employee=source, day_of_week=0, start_minutes=9 * 60, end_minutes=18 * 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('schedule-bulk-copy-week'), {
+                'source_employee_id': source.pk, 'employee_ids': self.employee_ids,
+            }, content_type='application/json')
+        self.assertEqual(response.json(), {'created': len(targets), 'updated': 0, 'deleted': 0})
+        self.assertEqual(self.received, [
+            {'employee_ids': sorted(employee.pk for employee in targets), 'date_from': None, 'date_to': None},
+        ])
+
+    def test_concurrent_batch_conflict_returns_409(self):
+        with mock.patch('booking_api.schedules.ScheduleException.objects.bulk_create',
+                        side_effect=IntegrityError('UNIQUE constraint failed')):
+            response = self.post('exceptions')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('error', response.json())
+        self.assertFalse(ScheduleException.objects.exists())
+        self.assertEqual(self.received, [])
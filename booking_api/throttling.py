@@ -0,0 +1,117 @@
+# booking_api/throttling.py
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+# Лимиты в единицах стоимости за период: запрос на день слотов стоит 1,
+# на месяц — число дней (см. get_throttle_cost представлений)
+DEFAULT_THROTTLE_RATES = {
+    'slots_ip': '300/min',
+    'slots_chat': '120/min',
+    'booking_ip': '20/hour',
+    'booking_chat': '30/hour',
+    'catalog_ip': '120/min',
+    'catalog_chat': '60/min',
+    # Поиск записей по телефону («Мои записи»): клиенту хватает нескольких запросов
+    'phone_lookup_ip': '10/min',
+    'phone_lookup_chat': '10/min',
+}
+
+CHAT_ID_HEADER = 'X-Telegram-Chat-Id'
+
+
+def get_throttle_rates():
+    """DEFAULT_THROTTLE_RATES, переопределенные настройкой BOOKING_THROTTLE_RATES."""
+    return {**DEFAULT_THROTTLE_RATES, **getattr(settings, 'BOOKING_THROTTLE_RATES', {})}
+
+
+class CostRateThrottle(SimpleRateThrottle):
+    """
+    Ограничение частоты с учетом стоимости запроса. Область берется из cost_throttle_scope
+    представления (как throttle_scope у ScopedRateThrottle) с суффиксом scope_suffix:
+    'slots' → 'slots_ip'.
+
+    В истории кэша хранятся пары [время, стоимость]; запрос проходит, если сумма стоимостей
+    за период вместе с ним не превышает лимит. Стоимость возвращает view.get_throttle_cost(request)
+    (по умолчанию 1). Счетчики — в кэше BOOKING_THROTTLE_CACHE (по умолчанию 'default'),
+    при отказе DRF отвечает 429 с заголовком Retry-After.
+    """
+    scope_suffix = None
+
+    def __init__(self):
+        # Лимит зависит от представления, поэтому определяется в allow_request
+        self.cache = caches[getattr(settings, 'BOOKING_THROTTLE_CACHE', 'default')]
+
+    def get_rate(self):
+        return get_throttle_rates().get(self.scope)
+
+    def allow_request(self, request, view):
+        view_scope = getattr(view, 'cost_throttle_scope', None)
+        if not view_scope:
+            return True
+
+        self.scope = f"{view_scope}_{self.scope_suffix}"
+        self.rate = self.get_rate()
+        if not self.rate:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        get_cost = getattr(view, 'get_throttle_cost', None)
+        # Запрос дороже всего лимита проходит, когда окно пусто, — иначе он не прошел бы никогда
+        self.cost = min(max(1, get_cost(request) if get_cost else 1), self.num_requests)
+
+        self.now = self.timer()
+        self.history = [entry for entry in self.cache.get(self.key, []) if entry[0] > self.now - self.duration]
+        if sum(cost for _, cost in self.history) + self.cost > self.num_requests:
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def throttle_success(self):
+        self.history.insert(0, [self.now, self.cost])
+        self.cache.set(self.key, self.history, self.duration)
+        return True
+
+    def wait(self):
+        """Секунды, через которые из окна выйдет достаточно стоимости для этого запроса."""
+        excess = sum(cost for _, cost in self.history) + self.cost - self.num_requests
+        # history — от новых к старым: освобождаем место, начиная с самых старых записей
+        for timestamp, cost in reversed(self.history):
+            excess -= cost
+            if excess <= 0:
+                return max(0, timestamp + self.duration - self.now)
+        return self.duration
+
+
+class CostIPRateThrottle(CostRateThrottle):
+    """Лимит на IP для анонимных запросов (сайт, сторонние клиенты, скрейперы)."""
+    scope_suffix = 'ip'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class CostChatRateThrottle(CostRateThrottle):
+    """
+    Лимит на чат Telegram: бот ходит в API с одного адреса под своим токеном
+    и передает чат пользователя в заголовке X-Telegram-Chat-Id. Заголовок учитывается
+    только у авторизованных запросов — анонимный клиент не уйдет им от лимита на IP.
+    Авторизованный запрос без корректного заголовка ограничивается по пользователю.
+    """
+    scope_suffix = 'chat'
+
+    def get_cache_key(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return None
+        chat_id = request.headers.get(CHAT_ID_HEADER, '').strip()
+        ident = chat_id if chat_id.lstrip('-').isdigit() else f"user:{request.user.pk}"
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+PUBLIC_THROTTLE_CLASSES = [CostIPRateThrottle, CostChatRateThrottle]
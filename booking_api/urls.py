@@ -6,9 +6,11 @@ from .views import (
     ServiceViewSet,
     AppointmentViewSet,
     EmployeeViewSet,
+    ScheduleBulkViewSet,
     # НОВЫЕ ИМПОРТЫ для APIView и ViewSet actions
     AnalyticsViewSet,
-    TelegramAppointmentCreationView
+    TelegramAppointmentCreationView,
+    UtilizationReportView,
 )
 
 # Создаем роутер
@@ -23,6 +25,9 @@ router.register(r'appointments', AppointmentViewSet, basename='appointment')
 
 router.register(r'employees', EmployeeViewSet, basename='employee')
 
+# Массовые изменения расписаний: schedules/copy_week/, schedules/exceptions/, schedules/blockers/
+router.register(r'schedules', ScheduleBulkViewSet, basename='schedule-bulk')
+
 # Добавляем маршруты, сгенерированные роутером, в urlpatterns
 urlpatterns = [
     # 1. Все маршруты ViewSets (CRUD, available_slots, telegram_catalog)
@@ -35,4 +40,8 @@ urlpatterns = [
     # 3. Маршрут для Аналитики (если он используется)
     # Адрес: /api/v1/analytics/
     path('analytics/', AnalyticsViewSet.as_view(), name='analytics'),
+
+    # 4. Загрузка мастеров (JSON или ?format=csv)
+    # Адрес: /api/v1/analytics/utilization/
+    path('analytics/utilization/', UtilizationReportView.as_view(), name='analytics-utilization'),
 ]
\ No newline at end of file
@@ -0,0 +1,155 @@
+# booking_api/utilization.py
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .intervals import merge_intervals, overlap_minutes, total_minutes, working_intervals
+from .archive import archive_cutoff
+from .models import Appointment, AppointmentArchive, Employee, EmployeeSchedule, ScheduleException, TimeBlocker
+
+MINUTES_IN_DAY = 24 * 60
+
+UTILIZATION_COLUMNS = ('employee_id', 'employee_name', 'period', 'working_minutes', 'booked_minutes', 'occupancy')
+
+
+def _occupancy(working, booked):
+    return round(booked / working, 4) if working else None
+
+
+def _summary(period, working, booked):
+    return {'period': period, 'working_minutes': working, 'booked_minutes': booked,
+            'occupancy': _occupancy(working, booked)}
+
+
+def load_schedule_data(employee_ids, date_from, date_to):
+    """
+    Расписания мастеров за период тремя запросами: шаблоны {(мастер, день недели): EmployeeSchedule},
+    исключения {(мастер, дата): ScheduleException}, блокировки {(мастер, дата): [TimeBlocker, ...]}.
+    """
+    schedules = {
+        (schedule.employee_id, schedule.day_of_week): schedule
+        for schedule in EmployeeSchedule.objects.filter(employee_id__in=employee_ids)
+    }
+    exceptions = {
+        (exception.employee_id, exception.date): exception
+        for exception in ScheduleException.objects.filter(
+            employee_id__in=employee_ids, date__range=(date_from, date_to))
+    }
+    blockers = defaultdict(list)
+    for blocker in TimeBlocker.objects.filter(
+            employee_id__in=employee_ids, date__range=(date_from, date_to)).order_by('start_minutes'):
+        blockers[(blocker.employee_id, blocker.date)].append(blocker)
+    return schedules, exceptions, blockers
+
+
+def day_working_intervals(schedules, exceptions, blockers, employee_id, day):
+    """Рабочие интервалы мастера на день по данным load_schedule_data (как Employee.get_working_intervals)."""
+    exception = exceptions.get((employee_id, day))
+    schedule = None if exception is not None else schedules.get((employee_id, day.weekday()))
+    return working_intervals(schedule, exception, blockers.get((employee_id, day), ()))
+
+
+def split_by_days(start_time, end_time, date_from, date_to):
+    """
+    Разбивает интервал записи по местным дням периода: [(дата, start_minutes, end_minutes), ...]
+    (запись через полночь дает две части).
+    """
+    start_local = timezone.localtime(start_time)
+    end_local = timezone.localtime(end_time)
+    parts = []
+    day = start_local.date()
+    while day <= end_local.date() and day <= date_to:
+        day_start = timezone.make_aware(datetime.combine(day, time.min))
+        start_minutes = max(0, int((start_local - day_start).total_seconds() // 60))
+        end_minutes = min(MINUTES_IN_DAY, int((end_local - day_start).total_seconds() // 60))
+        if day >= date_from and end_minutes > start_minutes:
+            parts.append((day, start_minutes, end_minutes))
+        day += timedelta(days=1)
+    return parts
+
+
+def _load_booked_intervals(employee_ids, date_from, date_to):
+    """
+    Записи (кроме отмененных) за период: {(мастер, дата): [(start, end), ...]} в минутах.
+    Один запрос к Appointment; архив (AppointmentArchive) читается, только если период
+    начинается раньше границы архивации.
+    """
+    range_start = timezone.make_aware(datetime.combine(date_from, time.min))
+    range_end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    sources = [Appointment]
+    if range_start < archive_cutoff():
+        sources.append(AppointmentArchive)
+
+    booked = defaultdict(list)
+    for model in sources:
+        appointments = model.objects.filter(
+            employee_id__in=employee_ids,
+            start_time__lt=range_end,
+            end_time__gt=range_start,
+        ).exclude(status='CANCELLED').values_list('employee_id', 'start_time', 'end_time')
+        for employee_id, start_time, end_time in appointments.iterator():
+            for day, start_minutes, end_minutes in split_by_days(start_time, end_time, date_from, date_to):
+                booked[(employee_id, day)].append((start_minutes, end_minutes))
+    return booked
+
+
+def utilization_report(organization_id, date_from, date_to, employee_ids=None):
+    """
+    Загрузка мастеров за период: рабочие минуты (как Employee.get_working_intervals) против
+    занятых записями, по дням и по неделям (с понедельника).
+
+    Расписания, исключения, блокировки и записи загружаются пятью запросами на весь отчет
+    (и еще одним к архиву записей, если период старше границы архивации),
+    дальше — только арифметика интервалов в памяти (booking_api.intervals), без BookingService
+    на каждый день мастера. Занятые минуты считаются в пределах рабочего времени.
+    """
+    employees = Employee.objects.filter(organization_id=organization_id).order_by('name', 'pk')
+    if employee_ids:
+        employees = employees.filter(pk__in=employee_ids)
+    employees = list(employees.only('id', 'name'))
+    ids = [employee.pk for employee in employees]
+
+    schedules, exceptions, blockers = load_schedule_data(ids, date_from, date_to)
+    booked = _load_booked_intervals(ids, date_from, date_to)
+
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    report = []
+    for employee in employees:
+        day_rows = []
+        weeks = defaultdict(lambda: [0, 0])
+        for day in days:
+            key = (employee.pk, day)
+            working = merge_intervals(day_working_intervals(schedules, exceptions, blockers, employee.pk, day))
+            working_total = total_minutes(working)
+            booked_total = overlap_minutes(working, merge_intervals(booked.get(key, ()))) if working_total else 0
+
+            day_rows.append(_summary(day.isoformat(), working_total, booked_total))
+            week = weeks[(day - timedelta(days=day.weekday())).isoformat()]
+            week[0] += working_total
+            week[1] += booked_total
+
+        working_sum = sum(row['working_minutes'] for row in day_rows)
+        booked_sum = sum(row['booked_minutes'] for row in day_rows)
+        report.append({
+            'employee_id': employee.pk,
+            'employee_name': employee.name,
+            'working_minutes': working_sum,
+            'booked_minutes': booked_sum,
+            'occupancy': _occupancy(working_sum, booked_sum),
+            'days': day_rows,
+            'weeks': [_summary(week_start, working_total, booked_total)
+                      for week_start, (working_total, booked_total) in weeks.items()],
+        })
+    return report
+
+
+def utilization_rows(report, period='day'):
+    """Плоские строки для CSV: одна строка на мастера и день (или неделю, period='week')."""
+    rows = []
+    for employee in report:
+        for summary in employee['weeks' if period == 'week' else 'days']:
+            rows.append({'employee_id': employee['employee_id'], 'employee_name': employee['employee_name'],
+                         **summary})
+    return rows
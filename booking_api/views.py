@@ -1,6 +1,10 @@
-from django.db.models.functions import TruncDate
-from django.db.models import Count, Q
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.http import parse_etags
 from datetime import timedelta, datetime
 import json
 
@@ -8,13 +12,26 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 # Добавляем новые импорты для работы с Telegram API и сервисом
-from .models import Service, Appointment, Employee, Client, Organization
+from .models import Service, Appointment, AppointmentArchive, Employee, Client, Organization
+from .catalog import get_telegram_catalog_payload
+from .eager_loading import EagerLoadingMixin, apply_eager_loading
+from .renderers import CSVRenderer, CompactJSONRenderer, FastReadPathMixin, fast_read_path_enabled
+from .pagination import KeysetPagination
+from .phones import normalize_phone_number
+from .stats import daily_stats_report
+from .utilization import UTILIZATION_COLUMNS, utilization_report, utilization_rows
+from .schedules import apply_schedule_exception, copy_week_template, stamp_recurring_blocker
+from .slot_formats import compact_day_slots, month_booking_days, month_free_ranges
+from .throttling import PUBLIC_THROTTLE_CLASSES
 from .serializers import (
     ServiceSerializer, AppointmentSerializer,
-    AppointmentDetailSerializer, EmployeeSerializer,
+    AppointmentDetailSerializer, EmployeeSerializer, appointment_detail_data,
+    CopyWeekTemplateSerializer, ScheduleExceptionBulkSerializer, TimeBlockerBulkSerializer,
 )
 # ИМПОРТ НОВОГО СЕРВИСА
 from .services import BookingService
@@ -24,14 +41,14 @@ from .telegram_utils import send_telegram_notification
 
 
 # --- НОВОЕ ПРЕДСТАВЛЕНИЕ: Для получения списка мастеров, привязанных к услуге ---
-class EmployeeViewSet(viewsets.ReadOnlyModelViewSet):
+class EmployeeViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     # ... (Оставить код без изменений)
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
     permission_classes = [AllowAny]
 
     def get_queryset(self):
-        queryset = self.queryset
+        queryset = super().get_queryset()
 
         organization_id = self.request.query_params.get('organization_id')
         service_id = self.request.query_params.get('service_id')
@@ -58,67 +75,188 @@ class EmployeeViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 # --- ServiceViewSet (ОБНОВЛЕНО: Добавлен эндпоинт для Telegram) ---
-class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
+class ServiceViewSet(FastReadPathMixin, EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     """API для просмотра списка доступных Услуг/Работ."""
     queryset = Service.objects.filter(is_active=True)
     serializer_class = ServiceSerializer
+    cost_throttle_scope = 'catalog'  # используется только throttle-классами действия telegram_catalog
     permission_classes = [AllowAny]
 
     def get_queryset(self):
         # ... (Оставить основную логику фильтрации по organization_id)
         organization_id = self.request.query_params.get('organization_id')
         if organization_id:
-            return self.queryset.filter(organization_id=organization_id)
+            # employees сериализатора подгружаются одним prefetch (EagerLoadingMixin)
+            return super().get_queryset().filter(organization_id=organization_id)
         return self.queryset.none()
 
     # НОВЫЙ ЭНДПОИНТ: GET /api/v1/services/telegram_catalog/?org_id=1
-    @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path='telegram_catalog')
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path='telegram_catalog',
+            throttle_classes=PUBLIC_THROTTLE_CLASSES)
     def telegram_catalog(self, request):
         """
         Возвращает список активных услуг в формате, сгруппированном по категории,
         оптимизированном для Telegram-бота. Требуется org_id.
+
+        Ответ — готовый JSON из кэша (booking_api.catalog) с ETag: при совпадении
+        If-None-Match отдается 304 без тела.
         """
         organization_id = request.query_params.get('org_id')
         if not organization_id:
             return Response({"error": "Требуется org_id."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            organization_id = int(organization_id)
+        except ValueError:
+            return Response({"error": "org_id должен быть числом."}, status=status.HTTP_400_BAD_REQUEST)
 
-        active_services = self.get_queryset().filter(organization_id=organization_id).order_by('category', 'name')
+        body, etag = get_telegram_catalog_payload(organization_id)
 
-        categorized_data = {}
+        client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in client_etags or '*' in client_etags:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json; charset=utf-8')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+# --- Представление для работы с записями (с разделением разрешений) ---
+class AppointmentViewSet(FastReadPathMixin, EagerLoadingMixin, viewsets.ModelViewSet):
+    # Связи для AppointmentDetailSerializer (organization, employee, service, client)
+    # подключает EagerLoadingMixin по source-путям полей
+    queryset = Appointment.objects.all().order_by('-start_time')
+    # actual_price / actual_duration читают service, если нет кастомных значений
+    eager_loading = {'select_related': ['service']}
+    # Курсор по (start_time, id): страница за постоянное время на любой глубине
+    pagination_class = KeysetPagination
 
-        for service in active_services:
-            # Получаем ID мастеров, которые могут оказать эту услугу
-            employee_ids = list(service.employees.values_list('id', flat=True))
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        queryset = self.filter_list_queryset(queryset)
+
+        # GET /api/v1/appointments/?phone_number=... — предстоящие записи клиента («Мои записи»);
+        # список, как и все остальное, только для авторизованных (бот ходит под своим токеном)
+        phone_number = self.request.query_params.get('phone_number')
+        if phone_number is not None:
+            canonical = normalize_phone_number(phone_number)
+            if not canonical:
+                return queryset.none()
+            return queryset.filter(
+                client__phone_e164=canonical,  # индекс по phone_e164
+                start_time__gte=timezone.now(),
+            ).exclude(status='CANCELLED').order_by('start_time')
+        return queryset
 
-            service_data = {
-                'id': service.id,
-                'name': service.name,
-                'category': service.category or 'Без категории',
-                'price': float(service.base_price),
-                'duration_minutes': service.base_duration,
-                'total_time_minutes': service.total_duration,
-                'employee_ids': employee_ids,  # Список доступных мастеров
-            }
+    def include_archived(self):
+        """?include_archived=1 — добавить записи из AppointmentArchive (только для авторизованных)."""
+        value = self.request.query_params.get('include_archived', '')
+        return value.lower() in ('1', 'true', 'yes') and self.request.user.is_authenticated
 
-            category = service.category if service.category else 'Без категории'
-            if category not in categorized_data:
-                categorized_data[category] = []
-            categorized_data[category].append(service_data)
+    def get_archive_queryset(self):
+        """Архив с теми же фильтрами списка и загрузкой связей, что и основной queryset."""
+        queryset = AppointmentArchive.objects.all().order_by('-start_time')
+        queryset = apply_eager_loading(queryset, self.get_serializer_class(), self.eager_loading)
+        return self.filter_list_queryset(queryset)
 
-        return Response(categorized_data, status=status.HTTP_200_OK)
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            # Перенесенная в архив запись доступна только на чтение
+            if self.action != 'retrieve' or not self.include_archived():
+                raise
+        queryset = apply_eager_loading(AppointmentArchive.objects.all(), self.get_serializer_class(), self.eager_loading)
+        obj = get_object_or_404(queryset, pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    def list(self, request, *args, **kwargs):
+        archived = self.include_archived() and request.query_params.get('phone_number') is None
+        if not fast_read_path_enabled() and not archived:
+            return super().list(request, *args, **kwargs)
+
+        querysets = [self.filter_queryset(self.get_queryset())]
+        if archived:
+            querysets.append(self.get_archive_queryset())
+
+        if fast_read_path_enabled():
+            # Быстрый путь: строки собираются вручную, без полей сериализатора на каждую запись
+            serialize = lambda rows: [appointment_detail_data(appointment) for appointment in rows]
+        else:
+            serialize = lambda rows: self.get_serializer(rows, many=True).data
 
+        if self.paginator is None:
+            return Response([item for queryset in querysets for item in serialize(queryset)])
+        page = self.paginator.paginate_querysets(querysets, request)
+        return self.get_paginated_response(serialize(page))
 
-# --- Представление для работы с записями (с разделением разрешений) ---
-class AppointmentViewSet(viewsets.ModelViewSet):
-    queryset = Appointment.objects.all().order_by('-start_time')
+    def filter_list_queryset(self, queryset):
+        """
+        Фильтры списка: employee_id, organization_id, status (через запятую),
+        date_from / date_to (YYYY-MM-DD, включительно, по дате начала).
+        """
+        params = self.request.query_params
+
+        for param, field in (('employee_id', 'employee_id'), ('organization_id', 'organization_id')):
+            value = params.get(param)
+            if value:
+                try:
+                    queryset = queryset.filter(**{field: int(value)})
+                except ValueError:
+                    raise ValidationError({"error": f"Параметр {param} должен быть числом."})
+
+        statuses = [value for value in params.get('status', '').split(',') if value]
+        if statuses:
+            known = {choice for choice, _ in Appointment.STATUS_CHOICES}
+            unknown = set(statuses) - known
+            if unknown:
+                raise ValidationError({"error": f"Неизвестный статус: {', '.join(sorted(unknown))}."})
+            queryset = queryset.filter(status__in=statuses)
+
+        tz = timezone.get_current_timezone()
+        try:
+            if params.get('date_from'):
+                date_from = datetime.strptime(params['date_from'], '%Y-%m-%d')
+                queryset = queryset.filter(start_time__gte=timezone.make_aware(date_from, tz))
+            if params.get('date_to'):
+                date_to = datetime.strptime(params['date_to'], '%Y-%m-%d') + timedelta(days=1)
+                queryset = queryset.filter(start_time__lt=timezone.make_aware(date_to, tz))
+        except ValueError:
+            raise ValidationError({"error": "Неверный формат даты. Ожидается YYYY-MM-DD."})
+
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create':
             return AppointmentSerializer
         return AppointmentDetailSerializer
 
+    def get_throttles(self):
+        # Публичные и самые дорогие действия ограничиваются по стоимости (booking_api.throttling);
+        # поиск по телефону — отдельно, чтобы перебором номеров нельзя было выгрузить чужие записи
+        self.cost_throttle_scope = {'list_available_slots': 'slots', 'create': 'booking'}.get(self.action)
+        if self.action == 'list' and self.request.query_params.get('phone_number') is not None:
+            self.cost_throttle_scope = 'phone_lookup'
+        if self.cost_throttle_scope:
+            return [throttle() for throttle in PUBLIC_THROTTLE_CLASSES] + super().get_throttles()
+        return super().get_throttles()
+
+    def get_throttle_cost(self, request):
+        """Стоимость запроса для throttling: слоты на месяц стоят столько, сколько дней считается."""
+        month_str = request.query_params.get('month')
+        if self.action != 'list_available_slots' or not month_str or request.query_params.get('date'):
+            return 1
+        try:
+            month_start = datetime.strptime(month_str, '%Y-%m').date()
+        except ValueError:
+            return 1
+        return max(1, len(month_booking_days(month_start)))
+
     def get_permissions(self):
-        if self.action in ['create', 'list_available_slots', 'list']:
+        if self.action in ['create', 'list_available_slots']:
             self.permission_classes = [AllowAny]
         else:
             self.permission_classes = [IsAuthenticated]
@@ -133,35 +271,57 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
     # ОБНОВЛЕННЫЙ ЭНДПОИНТ: GET /api/v1/appointments/available_slots/
-    @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path='available_slots')
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path='available_slots',
+            renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, CompactJSONRenderer])
     def list_available_slots(self, request):
         """
         Возвращает доступное время для бронирования с учетом плавающих расписаний,
         блокировок и записей, используя BookingService.
+
+        ?date=YYYY-MM-DD — слоты на день: ISO-строки, а с ?format=compact — минуты от полуночи
+        с датой, смещением UTC и длительностью один раз на ответ.
+        ?month=YYYY-MM — свободное время на месяц (с сегодняшнего дня) сериями [начало, количество].
         """
         employee_id = request.query_params.get('employee_id')
         service_id = request.query_params.get('service_id')
         date_str = request.query_params.get('date')
+        month_str = request.query_params.get('month')
 
-        if not all([employee_id, service_id, date_str]):
+        if not all([employee_id, service_id]) or not (date_str or month_str):
             return Response(
-                {"error": "Требуются параметры: employee_id, service_id, date."},
+                {"error": "Требуются параметры: employee_id, service_id, date (или month)."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         try:
             employee = Employee.objects.get(pk=employee_id)
             service = Service.objects.get(pk=service_id)
-            booking_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            if date_str:
+                booking_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            else:
+                month_start = datetime.strptime(month_str, '%Y-%m').date()
         except (Employee.DoesNotExist, Service.DoesNotExist) as e:
             return Response({"error": f"Объект не найден: {e}"}, status=status.HTTP_404_NOT_FOUND)
         except ValueError:
-            return Response({"error": "Неверный формат даты. Ожидается YYYY-MM-DD."},
+            return Response({"error": "Неверный формат даты. Ожидается YYYY-MM-DD (month: YYYY-MM)."},
                             status=status.HTTP_400_BAD_REQUEST)
 
         # *** Использование BookingService для расчета ***
         try:
+            if not date_str:
+                days = month_booking_days(month_start)
+                data = month_free_ranges(BookingService(employee, service, day) for day in days)
+                data.update({
+                    "employee_name": employee.name,
+                    "month": month_start.strftime('%Y-%m'),
+                    "duration": service.total_duration,
+                })
+                return Response(data, status=status.HTTP_200_OK)
+
             booking_service = BookingService(employee, service, booking_date)
+            if request.accepted_renderer.format == 'compact':
+                return Response(compact_day_slots(booking_service), status=status.HTTP_200_OK)
+
             available_slots = booking_service.get_available_slots()
 
             # Форматирование объектов datetime в строки ISO для ответа
@@ -183,6 +343,8 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 # --- ПРЕДСТАВЛЕНИЕ ДЛЯ TELEGRAM (Создание Записи) ---
 class TelegramAppointmentCreationView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = PUBLIC_THROTTLE_CLASSES
+    cost_throttle_scope = 'booking'
 
     def post(self, request, *args, **kwargs):
         data = request.data
@@ -195,10 +357,7 @@ class TelegramAppointmentCreationView(APIView):
 
         try:
             # 1. Находим или создаем Клиента
-            client, created = Client.objects.get_or_create(
-                phone_number=data['client_phone'],
-                defaults={'name': data['client_name']}
-            )
+            client, created = Client.get_or_create_by_phone(data['client_phone'], data['client_name'])
             if not created and client.name != data['client_name']:
                 client.name = data['client_name']
                 client.save()
@@ -271,32 +430,145 @@ class TelegramAppointmentCreationView(APIView):
 
 # --- Представление для Аналитики и Отчетов (Требуется авторизация) ---
 class AnalyticsViewSet(APIView):
-    # ... (Код без изменений)
+    """
+    Аналитика по дням из DailyStats (booking_api.stats): ?date_from, ?date_to (YYYY-MM-DD,
+    включительно; по умолчанию — последние 7 дней и все будущие записи), фильтры
+    organization_id, employee_id, service_id. Время ответа не зависит от числа записей.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
         days_to_look_back = 7
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days_to_look_back)
-
-        report_data = Appointment.objects.filter(
-            start_time__gte=start_date,
-            status__in=['PENDING', 'CONFIRMED']
-        ).annotate(
-            date=TruncDate('start_time')
-        ).values('date').annotate(
-            count=Count('id')
-        ).order_by('date')
-
-        formatted_data = [
-            {
-                "date": item['date'].strftime('%Y-%m-%d'),
-                "appointments_count": item['count']
-            }
-            for item in report_data
-        ]
+        params = request.query_params
+
+        try:
+            date_from = (datetime.strptime(params['date_from'], '%Y-%m-%d').date() if params.get('date_from')
+                         else timezone.localdate() - timedelta(days=days_to_look_back))
+            date_to = datetime.strptime(params['date_to'], '%Y-%m-%d').date() if params.get('date_to') else None
+        except ValueError:
+            return Response({"error": "Неверный формат даты. Ожидается YYYY-MM-DD."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if date_to and date_from > date_to:
+            return Response({"error": "date_from позже date_to."}, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {}
+        for param in ('organization_id', 'employee_id', 'service_id'):
+            value = params.get(param)
+            if value:
+                try:
+                    filters[param] = int(value)
+                except ValueError:
+                    return Response({"error": f"Параметр {param} должен быть числом."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+
+        formatted_data, totals = daily_stats_report(date_from, date_to, **filters)
+
+        if params.get('date_from') or date_to:
+            report_period = f"{date_from.isoformat()} — {date_to.isoformat() if date_to else '...'}"
+        else:
+            report_period = f"Последние {days_to_look_back} дней"
+
+        return Response({
+            "report_period": report_period,
+            "date_from": date_from.isoformat(),
+            "date_to": date_to.isoformat() if date_to else None,
+            "data": formatted_data,
+            "totals": totals,
+        })
+
+
+class UtilizationReportView(APIView):
+    """
+    Загрузка мастеров (booking_api.utilization): рабочие минуты против занятых, по дням и неделям.
+    ?organization_id (обязателен), ?date_from / ?date_to (YYYY-MM-DD, по умолчанию текущая неделя),
+    ?employee_id (через запятую). ?format=csv — выгрузка строк (?period=day|week).
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer]
+    csv_columns = UTILIZATION_COLUMNS
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            organization_id = int(params['organization_id'])
+            employee_ids = [int(value) for value in params.get('employee_id', '').split(',') if value]
+        except KeyError:
+            return Response({"error": "Требуется organization_id."}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"error": "organization_id и employee_id должны быть числами."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        week_start = timezone.localdate() - timedelta(days=timezone.localdate().weekday())
+        try:
+            date_from = (datetime.strptime(params['date_from'], '%Y-%m-%d').date() if params.get('date_from')
+                         else week_start)
+            date_to = (datetime.strptime(params['date_to'], '%Y-%m-%d').date() if params.get('date_to')
+                       else date_from + timedelta(days=6))
+        except ValueError:
+            return Response({"error": "Неверный формат даты. Ожидается YYYY-MM-DD."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        max_days = getattr(settings, 'UTILIZATION_MAX_DAYS', 366)
+        if date_from > date_to or (date_to - date_from).days >= max_days:
+            return Response({"error": f"Период должен быть от 1 до {max_days} дней."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        report = utilization_report(organization_id, date_from, date_to, employee_ids)
+
+        if request.accepted_renderer.format == 'csv':
+            period = 'week' if params.get('period') == 'week' else 'day'
+            filename = f"utilization_{organization_id}_{date_from.isoformat()}_{date_to.isoformat()}_{period}.csv"
+            return Response(utilization_rows(report, period),
+                            headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
         return Response({
-            "report_period": f"Последние {days_to_look_back} дней",
-            "data": formatted_data
-        })
\ No newline at end of file
+            "date_from": date_from.isoformat(),
+            "date_to": date_to.isoformat(),
+            "employees": report,
+        })
+
+
+class ScheduleBulkViewSet(viewsets.ViewSet):
+    """
+    Массовые изменения расписаний для администраторов (booking_api.schedules):
+    POST schedules/copy_week/, schedules/exceptions/, schedules/blockers/.
+    Каждый запрос — одна транзакция с bulk_create / bulk_update.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def _run(self, serializer_class, operation):
+        serializer = serializer_class(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            return Response(operation(**serializer.validated_data), status=status.HTTP_200_OK)
+        except DjangoValidationError as e:
+            raise ValidationError({"error": e.messages})
+        except IntegrityError:
+            # Параллельный пакет успел создать те же строки (уникальность по мастеру и дате/дню недели)
+            return Response(
+                {"error": "Расписание этих мастеров одновременно изменяется другим запросом. Повторите попытку."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+    @action(detail=False, methods=['post'])
+    def copy_week(self, request):
+        """{"source_employee_id": 1, "employee_ids": [2, 3], "replace": true}"""
+        def operation(source_employee, employee_ids, replace):
+            created, updated, deleted = copy_week_template(source_employee, employee_ids, replace)
+            return {"created": created, "updated": updated, "deleted": deleted}
+        return self._run(CopyWeekTemplateSerializer, operation)
+
+    @action(detail=False, methods=['post'])
+    def exceptions(self, request):
+        """{"employee_ids": [...], "date_from": "...", "date_to": "...", "has_new_hours": false, ...}"""
+        def operation(**data):
+            created, updated = apply_schedule_exception(**data)
+            return {"created": created, "updated": updated}
+        return self._run(ScheduleExceptionBulkSerializer, operation)
+
+    @action(detail=False, methods=['post'])
+    def blockers(self, request):
+        """{"employee_ids": [...], "date_from": "...", "date_to": "...", "start_minutes": 780, "end_minutes": 840}"""
+        def operation(**data):
+            return {"created": stamp_recurring_blocker(**data)}
+        return self._run(TimeBlockerBulkSerializer, operation)
@@ -0,0 +1,96 @@
+# booking_api/week_grid.py
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .intervals import merge_intervals, overlap_minutes, total_minutes
+from .models import Appointment
+from .utilization import day_working_intervals, load_schedule_data, split_by_days
+
+# Видимая часть суток по умолчанию; расширяется, если работа или записи выходят за нее
+DEFAULT_GRID_START = 8 * 60
+DEFAULT_GRID_END = 20 * 60
+
+
+def _format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _segment(kind, start, end, label=''):
+    return {'kind': kind, 'start': start, 'end': end, 'label': label,
+            'time': f"{_format_minutes(start)}–{_format_minutes(end)}"}
+
+
+def build_week_grid(employees, week_start):
+    """
+    Неделя (с понедельника week_start) для мастеров employees: по каждому дню рабочее время,
+    блокировки и записи отрезками в минутах. Данные загружаются по одному запросу на модель
+    (шаблоны, исключения, блокировки, записи), клетки собираются в памяти.
+    """
+    days = [week_start + timedelta(days=offset) for offset in range(7)]
+    week_end = days[-1]
+    ids = [employee.pk for employee in employees]
+
+    schedules, exceptions, blockers = load_schedule_data(ids, week_start, week_end)
+    bookings = defaultdict(list)
+    appointments = Appointment.objects.filter(
+        employee_id__in=ids,
+        start_time__lt=timezone.make_aware(datetime.combine(week_end + timedelta(days=1), time.min)),
+        end_time__gt=timezone.make_aware(datetime.combine(week_start, time.min)),
+    ).exclude(status='CANCELLED').select_related('client', 'service').order_by('start_time')
+    for appointment in appointments:
+        label = f"{appointment.client.name} — {appointment.service.name}"
+        for day, start, end in split_by_days(appointment.start_time, appointment.end_time, week_start, week_end):
+            segment = _segment('booking', start, end, label)
+            segment.update(status=appointment.status, appointment_id=appointment.pk)
+            bookings[(appointment.employee_id, day)].append(segment)
+
+    grid_start, grid_end = DEFAULT_GRID_START, DEFAULT_GRID_END
+    rows = []
+    for employee in employees:
+        cells = []
+        working_sum = booked_sum = 0
+        for day in days:
+            key = (employee.pk, day)
+            exception = exceptions.get(key)
+            working = merge_intervals(day_working_intervals(schedules, exceptions, blockers, employee.pk, day))
+            day_bookings = bookings.get(key, [])
+            segments = [_segment('work', start, end) for start, end in working]
+            segments += [_segment('block', blocker.start_minutes, blocker.end_minutes, blocker.reason)
+                         for blocker in blockers.get(key, ())]
+            segments += day_bookings
+
+            working_sum += total_minutes(working)
+            booked_sum += overlap_minutes(working, merge_intervals((s['start'], s['end']) for s in day_bookings))
+            for segment in segments:
+                grid_start = min(grid_start, segment['start'])
+                grid_end = max(grid_end, segment['end'])
+            cells.append({
+                'date': day,
+                'day_off': exception is not None and not exception.has_new_hours,
+                'segments': segments,
+            })
+        rows.append({'employee': employee, 'cells': cells,
+                     'working_minutes': working_sum, 'booked_minutes': booked_sum})
+
+    # Позиции отрезков в процентах высоты дня — шаблону остается только расставить блоки
+    grid_start = grid_start // 60 * 60
+    grid_end = min(24 * 60, -(-grid_end // 60) * 60)
+    span = grid_end - grid_start
+    for row in rows:
+        for cell in row['cells']:
+            for segment in cell['segments']:
+                segment['top'] = round((segment['start'] - grid_start) * 100 / span, 2)
+                segment['height'] = round((segment['end'] - segment['start']) * 100 / span, 2)
+
+    return {
+        'days': days,
+        'rows': rows,
+        'hours': [
+            {'label': _format_minutes(minutes), 'top': round((minutes - grid_start) * 100 / span, 2)}
+            for minutes in range(grid_start, grid_end, 60)
+        ],
+        'today': timezone.localdate(),
+    }
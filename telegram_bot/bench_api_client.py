@@ -0,0 +1,171 @@
+"""
+Бенчмарк конкурентности API-слоя бота против локального фейкового бэкенда.
+
+Сценарий: N пользователей одновременно открывают календарь на следующий месяц
+(fetch_available_days). Сравниваются:
+  * «до»  — синхронные последовательные запросы на каждый день прямо в event loop (как было с requests),
+  * «после» — общий httpx.AsyncClient и один запрос доступности на месяц (?month=YYYY-MM).
+
+Запуск (сеть не нужна, бэкенд поднимается на 127.0.0.1):
+    python telegram_bot/bench_api_client.py --users 20 --latency-ms 30
+"""
+
+import argparse
+import asyncio
+import calendar
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from datetime import date
+
+
+class FakeBackend:
+    """Минимальный HTTP/1.1 сервер (keep-alive) с искусственной задержкой ответа."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.requests_served = 0
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length:
+                    await reader.readexactly(length)
+
+                await asyncio.sleep(self.latency)
+                body = self._route(request_line.split(' ')[1])
+                self.requests_served += 1
+
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: %d\r\n\r\n' % len(body) + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _route(target: str) -> bytes:
+        if '/token' in target:
+            return b'{"access": "bench-access", "refresh": "bench-refresh"}'
+        if 'month=' in target:
+            return json.dumps({"days": {"2030-01-01": [[600, 1]]}}).encode()
+        return json.dumps([{"time": "2030-01-01T10:00:00+00:00"}]).encode()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(title, wall, latencies, requests):
+    print(f"{title}:")
+    print(f"  время: {wall:.2f} с, запросов: {requests}, {requests / wall:.1f} запр/с")
+    print(f"  ожидание пользователя: p50={statistics.median(latencies):.2f} с, "
+          f"p95={percentile(latencies, 95):.2f} с, max={max(latencies):.2f} с")
+
+
+async def run_before(bot, users, year, month):
+    """Старое поведение: каждый запрос блокирует event loop, пользователи идут по очереди."""
+    import httpx
+
+    _, last_day = calendar.monthrange(year, month)
+    latencies = []
+    started = time.perf_counter()
+
+    async def user():
+        # Все пользователи нажали кнопку одновременно, поэтому ожидание считаем от общего старта
+        with httpx.Client() as client:
+            for day in range(1, last_day + 1):
+                client.get(bot.SLOTS_URL, params={'date': date(year, month, day).isoformat()},
+                           headers={'Authorization': 'Bearer bench-access'})
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(user() for _ in range(users)))
+    return time.perf_counter() - started, latencies
+
+
+async def run_after(bot, users, year, month):
+    """Новое поведение: общий AsyncClient, месяц запрашивается одним запросом."""
+    await bot.obtain_initial_tokens()
+    latencies = []
+    started = time.perf_counter()
+
+    async def user(index):
+        t0 = time.perf_counter()
+        await bot.fetch_available_days(str(index), year, month, '1')
+        latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+    wall = time.perf_counter() - started
+    await bot.close_http_client()
+    return wall, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help="Число одновременных пользователей")
+    parser.add_argument('--latency-ms', type=float, default=30, help="Задержка ответа фейкового API, мс")
+    parser.add_argument('--skip-before', action='store_true', help="Не запускать медленный сценарий «до»")
+    args = parser.parse_args()
+
+    backend = FakeBackend(args.latency_ms / 1000)
+    backend.start()
+
+    base = f"http://127.0.0.1:{backend.port}/api/v1/"
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:bench')
+    os.environ.update({
+        'API_BASE_URL': base,
+        'BOT_USERNAME': 'bench',
+        'BOT_PASSWORD': 'bench',
+        'TOKEN_OBTAIN_URL': f"{base}token/",
+        'TOKEN_REFRESH_URL': f"{base}token/refresh/",
+    })
+
+    import telegram_bot as bot
+    logging.getLogger().setLevel(logging.WARNING)
+
+    today = date.today()
+    year, month = (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+    print(f"Пользователей: {args.users}, задержка API: {args.latency_ms:.0f} мс, месяц: {year}-{month:02d}\n")
+
+    if not args.skip_before:
+        served = backend.requests_served
+        wall, latencies = asyncio.run(run_before(bot, args.users, year, month))
+        report("До (синхронно в event loop)", wall, latencies, backend.requests_served - served)
+
+    served = backend.requests_served
+    wall, latencies = asyncio.run(run_after(bot, args.users, year, month))
+    report("После (httpx.AsyncClient)", wall, latencies, backend.requests_served - served)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,508 @@
+"""
+Нагрузочный тест полного сценария записи: бот + API.
+
+Каждый виртуальный пользователь проходит путь /start → «Записаться» → услуга → мастер
+(календарь) → день → слот → имя → телефон (и создание записи), как настоящий клиент:
+обработчикам бота передаются синтетические Update, а кнопки на следующем шаге берутся
+из клавиатуры, которую бот только что «отправил».
+
+Все работает офлайн:
+  * API — локальный `manage.py testserver` с генерируемой фикстурой (организация, услуги,
+    мастера, расписания, пользователь для JWT) и отдельной тестовой базой;
+  * Telegram — фейковый Bot API на 127.0.0.1 (туда же уходят уведомления мастерам от Django).
+
+Отчет: пропускная способность и p50/p95/p99 по каждому шагу.
+
+Запуск:
+    python telegram_bot/loadtest_booking.py --users 50 --concurrency 20
+    python telegram_bot/loadtest_booking.py --api-base-url http://127.0.0.1:8000/api/v1/ \\
+        --username bot --password secret      # против уже запущенного сервера
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPS = ['start', 'booking', 'service', 'master', 'day', 'slot', 'name', 'phone']
+
+LOADTEST_USERNAME = 'loadtest-bot'
+LOADTEST_PASSWORD = 'loadtest-password'
+
+SETTINGS_TEMPLATE = '''\
+# Сгенерировано loadtest_booking.py
+from master_time_project.settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'loadtest_urls'
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+TIME_ZONE = 'UTC'
+
+TELEGRAM_BOT_TOKEN = {token!r}
+TELEGRAM_API_URL = {telegram_url!r}
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+CACHES = {{'default': {{'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}}}
+
+# Без брокера: задачи Celery выполняются сразу в процессе сервера
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_BROKER_URL = 'memory://'
+
+if DATABASES['default']['ENGINE'].endswith('sqlite3'):  # noqa: F405
+    # Файловая тестовая база: in-memory SQLite плохо переносит параллельные запросы
+    DATABASES['default']['TEST'] = {{'NAME': {test_db!r}}}  # noqa: F405
+'''
+
+URLS_TEMPLATE = '''\
+# Сгенерировано loadtest_booking.py
+from django.urls import include, path
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+import master_time_project.celery  # noqa: F401  (приложение Celery с настройками CELERY_*)
+
+urlpatterns = [
+    path('api/v1/', include('booking_api.urls')),
+    path('api/token/', TokenObtainPairView.as_view()),
+    path('api/token/refresh/', TokenRefreshView.as_view()),
+]
+'''
+
+
+# -----------------------------------------------------------
+# Фейковый Telegram Bot API
+# -----------------------------------------------------------
+
+class FakeTelegram:
+    """
+    Отвечает на методы Bot API так, как это нужно PTB, и запоминает последнее сообщение
+    (текст и inline-клавиатуру) каждого чата — по ним виртуальный пользователь выбирает кнопку.
+    """
+
+    def __init__(self):
+        self.port: Optional[int] = None
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.last_text: Dict[int, str] = {}
+        self.last_buttons: Dict[int, List[str]] = {}
+        self._message_id = 0
+        self._runner = None
+
+    async def start(self) -> None:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        self.port = free_port()
+        await web.TCPSite(self._runner, '127.0.0.1', self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        method = request.match_info['method']
+        self.calls[method] += 1
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == 'getMe':
+            result: Any = {'id': 1, 'is_bot': True, 'first_name': 'loadtest', 'username': 'loadtest_bot'}
+        elif method in ('sendMessage', 'editMessageText'):
+            result = self._remember(params)
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def _remember(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params.get('chat_id') or 0)
+        text = params.get('text', '')
+        self.last_text[chat_id] = text
+
+        markup = params.get('reply_markup')
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        if markup and 'inline_keyboard' in markup:
+            self.last_buttons[chat_id] = [
+                button['callback_data'] for row in markup['inline_keyboard'] for button in row
+                if button.get('callback_data')
+            ]
+
+        self._message_id += 1
+        return {
+            'message_id': int(params.get('message_id') or self._message_id),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': text,
+        }
+
+
+# -----------------------------------------------------------
+# Локальный Django testserver
+# -----------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_password_hash(password: str, iterations: int = 1000) -> str:
+    """Хэш в формате Django pbkdf2_sha256 (фикстуре нужен готовый хэш пароля)."""
+    salt = secrets.token_hex(8)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations)
+    return f"pbkdf2_sha256${iterations}${salt}${base64.b64encode(digest).decode()}"
+
+
+def build_fixture(services: int, employees: int) -> List[Dict[str, Any]]:
+    """Организация 1 (ORGANIZATION_ID бота), услуги, мастера с ежедневным графиком 08:00–22:00."""
+    fixture: List[Dict[str, Any]] = [
+        {'model': 'auth.user', 'pk': 1, 'fields': {
+            'username': LOADTEST_USERNAME, 'password': make_password_hash(LOADTEST_PASSWORD),
+            'is_active': True, 'is_staff': False, 'is_superuser': False,
+            'date_joined': '2024-01-01T00:00:00Z',
+        }},
+        {'model': 'booking_api.organization', 'pk': 1, 'fields': {
+            'name': 'Loadtest', 'segment_name': 'Салон', 'address': 'localhost',
+        }},
+    ]
+    for employee_id in range(1, employees + 1):
+        fixture.append({'model': 'booking_api.employee', 'pk': employee_id, 'fields': {
+            'organization': 1, 'name': f'Мастер {employee_id}',
+            'telegram_chat_id': str(900000 + employee_id),
+        }})
+        for day_of_week in range(7):
+            fixture.append({'model': 'booking_api.employeeschedule', 'fields': {
+                'employee': employee_id, 'day_of_week': day_of_week,
+                'start_minutes': 8 * 60, 'end_minutes': 22 * 60,
+            }})
+    for service_id in range(1, services + 1):
+        fixture.append({'model': 'booking_api.service', 'pk': service_id, 'fields': {
+            'organization': 1, 'name': f'Услуга {service_id}', 'category': 'Нагрузочный тест',
+            'base_duration': 30, 'base_price': '1000.00', 'buffer_time': 0, 'is_active': True,
+            'employees': list(range(1, employees + 1)),
+        }})
+    return fixture
+
+
+def start_django(workdir: str, telegram_url: str, token: str, services: int, employees: int):
+    """Поднимает `manage.py testserver` с фикстурой и настройками нагрузочного теста."""
+    with open(os.path.join(workdir, 'loadtest_settings.py'), 'w') as f:
+        f.write(SETTINGS_TEMPLATE.format(
+            token=token, telegram_url=telegram_url, test_db=os.path.join(workdir, 'loadtest.sqlite3')))
+    with open(os.path.join(workdir, 'loadtest_urls.py'), 'w') as f:
+        f.write(URLS_TEMPLATE)
+    fixture_path = os.path.join(workdir, 'loadtest_fixture.json')
+    with open(fixture_path, 'w') as f:
+        json.dump(build_fixture(services, employees), f, ensure_ascii=False)
+
+    port = free_port()
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [workdir, REPO_ROOT, env.get('PYTHONPATH')]))
+    env['DJANGO_SETTINGS_MODULE'] = 'loadtest_settings'
+    log = open(os.path.join(workdir, 'django.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, 'manage.py'), 'testserver', fixture_path,
+         '--addrport', f'127.0.0.1:{port}', '--noinput'],
+        cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, f"http://127.0.0.1:{port}", os.path.join(workdir, 'django.log')
+
+
+async def wait_for_http(url: str, process: Optional[subprocess.Popen], timeout: float = 90) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Django завершился с кодом {process.returncode}")
+            try:
+                await client.get(url, timeout=2)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+    raise RuntimeError(f"Сервер {url} не ответил за {timeout:.0f} с")
+
+
+# -----------------------------------------------------------
+# Виртуальные пользователи
+# -----------------------------------------------------------
+
+class JourneyFailed(Exception):
+    pass
+
+
+class VirtualUser:
+    """Один клиент: шлет Update в Application и выбирает кнопки из ответов фейкового Telegram."""
+
+    def __init__(self, application, telegram: FakeTelegram, user_id: int, rng: random.Random,
+                 think_time: float, timings: Dict[str, List[float]], errors: Dict[str, int]):
+        self.application = application
+        self.telegram = telegram
+        self.user_id = user_id
+        self.rng = rng
+        self.think_time = think_time
+        self.timings = timings
+        self.errors = errors
+        self._update_id = user_id * 100
+        self._message_id = 0
+
+    # --- Синтетические обновления ---
+    def _user(self) -> Dict[str, Any]:
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f'User{self.user_id}'}
+
+    def _message(self, **fields) -> Dict[str, Any]:
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': self.user_id, 'type': 'private'},
+            'from': self._user(),
+            **fields,
+        }
+
+    def _update(self, **fields):
+        from telegram import Update
+
+        self._update_id += 1
+        return Update.de_json({'update_id': self._update_id, **fields}, self.application.bot)
+
+    def command(self, text: str):
+        return self._update(message=self._message(
+            text=text, entities=[{'type': 'bot_command', 'offset': 0, 'length': len(text)}]))
+
+    def text(self, text: str):
+        return self._update(message=self._message(text=text))
+
+    def contact(self, phone: str):
+        return self._update(message=self._message(
+            contact={'phone_number': phone, 'first_name': f'User{self.user_id}', 'user_id': self.user_id}))
+
+    def press(self, data: str):
+        return self._update(callback_query={
+            'id': f'{self.user_id}-{self._update_id}',
+            'from': self._user(),
+            'chat_instance': str(self.user_id),
+            'data': data,
+            'message': self._message(text='...'),
+        })
+
+    # --- Шаги сценария ---
+    async def step(self, name: str, update) -> None:
+        if self.think_time:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think_time))
+        self.telegram.last_buttons.pop(self.user_id, None)
+        started = time.perf_counter()
+        processor = self.application.update_processor
+        # Так же, как это делает Application при получении обновления
+        await processor.process_update(update, self.application.process_update(update))
+        self.timings[name].append(time.perf_counter() - started)
+
+    def choose(self, step: str, prefix: str) -> str:
+        buttons = [data for data in self.telegram.last_buttons.get(self.user_id, []) if data.startswith(prefix)]
+        if not buttons:
+            self.errors[step] += 1
+            raise JourneyFailed(f"{step}: нет кнопок {prefix}* ({self.telegram.last_text.get(self.user_id, '')[:80]!r})")
+        return self.rng.choice(buttons)
+
+    async def run(self) -> bool:
+        await self.step('start', self.command('/start'))
+        await self.step('booking', self.press('start_booking'))
+        await self.step('service', self.press(self.choose('booking', 'service_')))
+        await self.step('master', self.press(self.choose('service', 'employee_')))
+        await self.step('day', self.press(self.choose('master', 'CALEND_DAY_')))
+        await self.step('slot', self.press(self.choose('day', 'SLOT_')))
+        await self.step('name', self.text(f'Клиент {self.user_id}'))
+        await self.step('phone', self.contact(f'+7900{self.user_id:07d}'))
+
+        if 'успешно создана' not in self.telegram.last_text.get(self.user_id, ''):
+            self.errors['phone'] += 1
+            raise JourneyFailed(f"phone: запись не создана ({self.telegram.last_text.get(self.user_id, '')[:80]!r})")
+        return True
+
+
+# -----------------------------------------------------------
+# Отчет
+# -----------------------------------------------------------
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_report(timings, errors, wall, journeys, completed, telegram: FakeTelegram) -> Dict[str, Any]:
+    steps = {}
+    for name in STEPS:
+        values = timings.get(name) or []
+        steps[name] = {
+            'count': len(values),
+            'errors': errors.get(name, 0),
+            'p50_ms': round(statistics.median(values) * 1000, 1) if values else None,
+            'p95_ms': round(percentile(values, 95) * 1000, 1) if values else None,
+            'p99_ms': round(percentile(values, 99) * 1000, 1) if values else None,
+            'max_ms': round(max(values) * 1000, 1) if values else None,
+        }
+    updates = sum(len(values) for values in timings.values())
+    return {
+        'wall_seconds': round(wall, 2),
+        'journeys': journeys,
+        'completed': completed,
+        'journeys_per_second': round(completed / wall, 2) if wall else 0,
+        'updates_per_second': round(updates / wall, 2) if wall else 0,
+        'telegram_calls': dict(telegram.calls),
+        'steps': steps,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Сценариев: {report['journeys']}, записей создано: {report['completed']}, "
+          f"время: {report['wall_seconds']} с")
+    print(f"Пропускная способность: {report['journeys_per_second']} записей/с, "
+          f"{report['updates_per_second']} обновлений/с\n")
+    print(f"{'шаг':<10}{'кол-во':>8}{'ошибок':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for name, row in report['steps'].items():
+        cells = [row[key] if row[key] is not None else '-' for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms')]
+        print(f"{name:<10}{row['count']:>8}{row['errors']:>8}" + ''.join(f"{cell:>10}" for cell in cells))
+    print(f"\nВызовы Telegram API: {report['telegram_calls']}")
+
+
+# -----------------------------------------------------------
+# Запуск
+# -----------------------------------------------------------
+
+async def run(args) -> Dict[str, Any]:
+    telegram = FakeTelegram()
+    await telegram.start()
+    telegram_url = f"http://127.0.0.1:{telegram.port}"
+    token = '0:loadtest'
+
+    process = None
+    if args.api_base_url:
+        api_base = args.api_base_url.rstrip('/') + '/'
+        server = api_base.split('/api/')[0]
+        username, password = args.username, args.password
+    else:
+        workdir = tempfile.mkdtemp(prefix='loadtest-')
+        process, server, log_path = start_django(workdir, telegram_url, token, args.services, args.employees)
+        api_base = f"{server}/api/v1/"
+        username, password = LOADTEST_USERNAME, LOADTEST_PASSWORD
+        print(f"Django testserver: {server} (лог: {log_path})")
+
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': token,
+        'API_BASE_URL': api_base,
+        'BOT_USERNAME': username or '',
+        'BOT_PASSWORD': password or '',
+        'TOKEN_OBTAIN_URL': args.token_url or f"{server}/api/token/",
+        'TOKEN_REFRESH_URL': args.token_refresh_url or f"{server}/api/token/refresh/",
+        'BOT_METRICS_LOG_INTERVAL': '0',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import telegram_bot as bot
+    from telegram.ext import Application
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    application = None
+    try:
+        await wait_for_http(api_base, process)
+
+        application = (
+            Application.builder()
+            .token(token)
+            .base_url(f"{telegram_url}/bot")
+            .concurrent_updates(bot.PerChatUpdateProcessor(args.concurrency))
+            .build()
+        )
+        bot.register_handlers(application)
+        await application.initialize()
+        await bot.post_init(application)
+
+        timings: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, int] = defaultdict(int)
+        limiter = asyncio.Semaphore(args.concurrency)
+        completed = 0
+
+        async def journey(index: int) -> None:
+            nonlocal completed
+            user = VirtualUser(application, telegram, 10_000 + index, random.Random(args.seed + index),
+                               args.think_ms / 1000, timings, errors)
+            async with limiter:
+                try:
+                    await user.run()
+                    completed += 1
+                except JourneyFailed as e:
+                    logging.getLogger('loadtest').warning(f"Пользователь {user.user_id}: {e}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(journey(index) for index in range(args.users)))
+        wall = time.perf_counter() - started
+        return build_report(timings, errors, wall, args.users, completed, telegram)
+    finally:
+        if application is not None:
+            await bot.post_shutdown(application)
+            await application.shutdown()
+        await telegram.stop()
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50, help="Число сценариев записи")
+    parser.add_argument('--concurrency', type=int, default=20,
+                        help="Одновременно активных пользователей (и BOT_CONCURRENT_UPDATES)")
+    parser.add_argument('--think-ms', type=float, default=0, help="Средняя пауза пользователя между шагами, мс")
+    parser.add_argument('--services', type=int, default=3, help="Услуг в фикстуре")
+    parser.add_argument('--employees', type=int, default=5, help="Мастеров в фикстуре")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--api-base-url', help="Использовать уже запущенный API вместо testserver")
+    parser.add_argument('--username', help="Пользователь API (с --api-base-url)")
+    parser.add_argument('--password', help="Пароль пользователя API (с --api-base-url)")
+    parser.add_argument('--token-url', help="Адрес получения JWT (по умолчанию <сервер>/api/token/)")
+    parser.add_argument('--token-refresh-url', help="Адрес обновления JWT (по умолчанию <сервер>/api/token/refresh/)")
+    parser.add_argument('--json', dest='json_path', help="Сохранить отчет в JSON (для CI)")
+    parser.add_argument('--fail-under', type=float, default=0,
+                        help="Код выхода 1, если доля успешных записей (%%) ниже порога")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    report['generated_at'] = datetime.now(timezone.utc).isoformat()
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    success_rate = 100 * report['completed'] / report['journeys'] if report['journeys'] else 0
+    if success_rate < args.fail_under:
+        print(f"\nУспешных записей {success_rate:.1f}% < {args.fail_under}%")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,27 @@
 import os
-import requests
+import asyncio
+import httpx
 import datetime
 import logging
+import time
+import json
+import base64
+import hmac
+import signal
+import sqlite3
+import contextvars
+from collections import OrderedDict, deque
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 import telegram
 from telegram.ext import (
-    Application, CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler, filters
+    Application, BasePersistence, BaseUpdateProcessor, CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler,
+    PersistenceInput, filters
 )
 from dotenv import load_dotenv
-from datetime import date, timedelta  # 👈 Оставляем timedelta
+from datetime import date
 import calendar
 import re
-from typing import List, Dict, Any, Union  # 👈 Добавлен импорт для type hinting
+from typing import List, Dict, Any, Optional  # 👈 Добавлен импорт для type hinting
 
 # --- 0. Настройка логирования ---
 logging.basicConfig(
@@ -38,9 +48,24 @@ SERVICES_URL = f"{API_BASE_URL}services/"
 EMPLOYEES_URL = f"{API_BASE_URL}employees/"
 SLOTS_URL = f"{API_BASE_URL}appointments/available_slots/"
 APPOINTMENTS_URL = f"{API_BASE_URL}appointments/"
+APPOINTMENTS_PAGE_SIZE = int(os.getenv("APPOINTMENTS_PAGE_SIZE", "20"))  # записей в «Мои записи»
 
 ORGANIZATION_ID = 1
 
+# --- Режим запуска и общее состояние ---
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес, который регистрируется в Telegram
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "1") == "1"
+BOT_STATE_DB = os.getenv("BOT_STATE_DB")  # путь к SQLite для context.user_data (общий для воркеров)
+BOT_PERSISTENCE_INTERVAL = float(os.getenv("BOT_PERSISTENCE_INTERVAL", "1"))
+BOT_PERSISTENCE_BATCH_DELAY = float(os.getenv("BOT_PERSISTENCE_BATCH_DELAY", "0.2"))
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "8"))  # одновременно обрабатываемых обновлений
+BOT_METRICS_LOG_INTERVAL = int(os.getenv("BOT_METRICS_LOG_INTERVAL", "300"))  # 0 — не писать метрики в лог
+
 # --- Переменные для динамического хранения токенов ---
 GLOBAL_TOKENS = {
     'access': None,
@@ -48,9 +73,43 @@ GLOBAL_TOKENS = {
 }
 
 
+# --- Общий асинхронный HTTP-клиент к API ---
+# Все обработчики работают в одном event loop, поэтому синхронный requests
+# блокировал бота целиком на время каждого запроса. Один AsyncClient на процесс
+# переиспользует соединения (keep-alive) и ограничивает их число.
+API_TIMEOUT = httpx.Timeout(float(os.getenv("API_TIMEOUT", "10")), connect=float(os.getenv("API_CONNECT_TIMEOUT", "5")))
+API_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("API_MAX_CONNECTIONS", "50")),
+    max_keepalive_connections=int(os.getenv("API_MAX_KEEPALIVE", "20")),
+)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Чат, от имени которого выполняется запрос к API: API ограничивает частоту по чату
+# (заголовок X-Telegram-Chat-Id), а не по общему адресу бота. Задается в timed_handler;
+# фоновые задачи (прогрев календаря) наследуют значение при создании.
+current_chat_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar('current_chat_id', default=None)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий AsyncClient (создается лениво внутри работающего event loop)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=API_TIMEOUT, limits=API_LIMITS)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Закрывает общий AsyncClient (при остановке бота)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
 # --- 2. Вспомогательные функции для токенов и API ---
 
-def obtain_initial_tokens() -> bool:
+async def obtain_initial_tokens() -> bool:
     """Получает Access и Refresh токены при запуске."""
     global GLOBAL_TOKENS
 
@@ -61,19 +120,19 @@ def obtain_initial_tokens() -> bool:
     logger.info("⏳ Получаю начальные Access и Refresh токены...")
     payload = {"username": BOT_USERNAME, "password": BOT_PASSWORD}
     try:
-        response = requests.post(TOKEN_OBTAIN_URL, json=payload)
+        response = await get_http_client().post(TOKEN_OBTAIN_URL, json=payload)
         response.raise_for_status()
         tokens = response.json()
         GLOBAL_TOKENS['access'] = tokens.get('access')
         GLOBAL_TOKENS['refresh'] = tokens.get('refresh')
         logger.info("✅ Токены успешно получены.")
         return True
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.fatal(f"ФАТАЛЬНАЯ ОШИБКА ПОЛУЧЕНИЯ ТОКЕНА: {e}")
         return False
 
 
-def refresh_access_token() -> bool:
+async def refresh_access_token() -> bool:
     """Обновляет Access Token, используя Refresh Token."""
     global GLOBAL_TOKENS
     if not GLOBAL_TOKENS['refresh']:
@@ -81,7 +140,7 @@ def refresh_access_token() -> bool:
         return False
     logger.info("⏳ Пытаюсь обновить Access Token...")
     try:
-        response = requests.post(TOKEN_REFRESH_URL, json={'refresh': GLOBAL_TOKENS['refresh']})
+        response = await get_http_client().post(TOKEN_REFRESH_URL, json={'refresh': GLOBAL_TOKENS['refresh']})
         response.raise_for_status()
         new_tokens = response.json()
         GLOBAL_TOKENS['access'] = new_tokens.get('access')
@@ -89,127 +148,404 @@ def refresh_access_token() -> bool:
             GLOBAL_TOKENS['refresh'] = new_tokens['refresh']
         logger.info("✅ Access Token успешно обновлен.")
         return True
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.fatal(f"ФАТАЛЬНАЯ ОШИБКА ОБНОВЛЕНИЯ ТОКЕНА: {e}")
         return False
 
 
-def make_api_request(method: str, url: str, **kwargs) -> Union[requests.Response, None]:
-    """Универсальный обработчик запросов с логикой обновления токена."""
-    global GLOBAL_TOKENS
+# --- Проактивное обновление токена (single-flight) ---
+# Токен обновляется в фоне заранее, до истечения exp, поэтому пользовательские запросы
+# не платят лишним круговым запросом за 401. Конкурентные обновления объединяются
+# под одним asyncio.Lock: кто пришел вторым, видит уже новый токен и не обновляет повторно.
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "60"))        # секунд до exp
+TOKEN_REFRESH_FALLBACK_INTERVAL = int(os.getenv("TOKEN_REFRESH_FALLBACK_INTERVAL", "240"))  # если exp неизвестен
+
+_token_lock: Optional[asyncio.Lock] = None
+_token_refresher_task: Optional[asyncio.Task] = None
+
+
+def decode_token_exp(token: Optional[str]) -> Optional[float]:
+    """Читает exp (unix time) из payload JWT без проверки подписи. None, если разобрать не удалось."""
+    if not token:
+        return None
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+        return float(exp) if exp is not None else None
+    except (IndexError, ValueError, TypeError):
+        return None
+
+
+def access_token_expires_soon(margin: float = 0) -> bool:
+    """True, если Access Token отсутствует или истекает не позже чем через margin секунд."""
+    if not GLOBAL_TOKENS['access']:
+        return True
+    exp = decode_token_exp(GLOBAL_TOKENS['access'])
+    return exp is not None and exp - time.time() <= margin
+
+
+async def refresh_tokens_single_flight(stale_token: Optional[str] = None) -> bool:
+    """
+    Обновляет Access Token не более одного раза для группы конкурентных вызовов.
+    stale_token — токен, с которым вызывающий получил отказ (или который считает устаревшим):
+    если после ожидания блокировки токен уже другой, обновление сделал кто-то еще.
+    При неудаче refresh (например, истек Refresh Token) выполняется повторный вход.
+    """
+    global _token_lock
+    if _token_lock is None:
+        _token_lock = asyncio.Lock()
+
+    async with _token_lock:
+        if GLOBAL_TOKENS['access'] and GLOBAL_TOKENS['access'] != stale_token:
+            return True
+        if GLOBAL_TOKENS['refresh'] and await refresh_access_token():
+            return True
+        return await obtain_initial_tokens()
+
+
+async def _token_refresher_loop() -> None:
+    """Фоновая задача: обновляет токен за TOKEN_REFRESH_MARGIN секунд до истечения."""
+    while True:
+        exp = decode_token_exp(GLOBAL_TOKENS['access'])
+        if exp is None:
+            delay = TOKEN_REFRESH_FALLBACK_INTERVAL
+        else:
+            delay = max(exp - time.time() - TOKEN_REFRESH_MARGIN, 5)
+        await asyncio.sleep(delay)
+        try:
+            await refresh_tokens_single_flight(stale_token=GLOBAL_TOKENS['access'])
+        except Exception as e:
+            logger.error(f"Фоновое обновление токена не удалось: {e}")
+
+
+def start_token_refresher() -> None:
+    global _token_refresher_task
+    if _token_refresher_task is None or _token_refresher_task.done():
+        _token_refresher_task = asyncio.get_running_loop().create_task(_token_refresher_loop())
+
+
+async def stop_token_refresher() -> None:
+    global _token_refresher_task
+    if _token_refresher_task is not None:
+        _token_refresher_task.cancel()
+        try:
+            await _token_refresher_task
+        except asyncio.CancelledError:
+            pass
+    _token_refresher_task = None
+
+
+async def make_api_request(method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+    """
+    Универсальный обработчик запросов с логикой обновления токена.
+    Дополнительные kwargs передаются в httpx (params, json, timeout — таймаут на запрос).
+    Сетевые ошибки пробрасываются как httpx.HTTPError.
+    """
     logger.debug(f"API Запрос: {method} {url}, Параметры: {kwargs.get('params', 'Нет')}")
 
-    def execute_request(current_access_token: str):
-        headers = kwargs.pop('headers', {})
+    base_headers = kwargs.pop('headers', {})
+    client = get_http_client()
+
+    async def execute_request(current_access_token: str) -> httpx.Response:
+        headers = dict(base_headers)
+        chat_id = current_chat_id.get()
+        if chat_id is not None:
+            headers.setdefault('X-Telegram-Chat-Id', str(chat_id))
         if current_access_token:
             headers['Authorization'] = f"Bearer {current_access_token}"
-        return requests.request(method, url, headers=headers, **kwargs)
+        return await client.request(method, url, headers=headers, **kwargs)
 
+    # Обычно токен уже обновлен фоновой задачей; здесь — страховка, если она не успела
     current_access = GLOBAL_TOKENS['access']
-    if not current_access:
-        if not obtain_initial_tokens() and not refresh_access_token():
+    if access_token_expires_soon():
+        if not await refresh_tokens_single_flight(stale_token=current_access):
             logger.error("Отсутствует Access Token и не удалось его получить/обновить.")
             return None
         current_access = GLOBAL_TOKENS['access']
 
-    response = execute_request(current_access)
+    response = await execute_request(current_access)
 
     if response.status_code == 401:
         logger.warning("⚠️ Получен 401 Unauthorized. Пытаюсь обновить токен...")
-        if refresh_access_token():
+        if await refresh_tokens_single_flight(stale_token=current_access):
             logger.info("🔄 Повторяю запрос с новым Access Token...")
-            response = execute_request(GLOBAL_TOKENS['access'])
+            response = await execute_request(GLOBAL_TOKENS['access'])
         else:
             logger.error("Не удалось обновить токен, запрос не выполнен.")
             return None
 
+    if response.status_code == 429:
+        logger.warning(f"⏳ API ограничил частоту запросов ({url}), повтор через "
+                       f"{response.headers.get('Retry-After', '?')} с.")
+
     logger.debug(f"API Ответ: Статус {response.status_code}")
     return response
 
 
 # -----------------------------------------------------------
-# 🌟 ИСПРАВЛЕННАЯ ФУНКЦИЯ: fetch_available_days
+# 💾 КЭШ ОТВЕТОВ API (TTL + LRU)
 # -----------------------------------------------------------
 
-def fetch_available_days(employee_id: str, year: int, month: int, service_id: str) -> set[str]:
+# Время жизни записей кэша по видам данных (секунды)
+CACHE_TTL = {
+    'catalog': int(os.getenv("CACHE_TTL_CATALOG", "600")),            # услуги организации
+    'employees': int(os.getenv("CACHE_TTL_EMPLOYEES", "300")),        # мастера услуги
+    'availability': int(os.getenv("CACHE_TTL_AVAILABILITY", "60")),   # доступность месяца и слоты дня
+}
+API_CACHE_MAXSIZE = int(os.getenv("API_CACHE_MAXSIZE", "2048"))
+
+
+class TTLCache:
     """
-    Запрашивает у API доступность, делая отдельный запрос для каждого дня месяца,
-    начиная с сегодняшнего дня.
+    Кэш в памяти процесса: у каждой записи свой срок жизни, при переполнении
+    вытесняется давно не использованная (LRU). Ключ — кортеж (вид, адрес, параметры).
     """
-    first_day_of_month = date(year, month, 1)
-    _, last_day_num = calendar.monthrange(year, month)
-    last_day_of_month = date(year, month, last_day_num)
-    today = date.today()
 
-    available_days = set()
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[tuple, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> tuple[bool, Any]:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return False, None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, item[1]
+
+    def set(self, key: tuple, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, *kinds: str) -> None:
+        """Удаляет записи указанных видов (или все, если виды не заданы)."""
+        if not kinds:
+            self._data.clear()
+            return
+        for key in [key for key in self._data if key[0] in kinds]:
+            del self._data[key]
 
-    # Начинаем цикл с сегодняшнего дня, если месяц - текущий, иначе - с 1-го числа
-    if first_day_of_month.month == today.month and first_day_of_month.year == today.year:
-        current_day = today
-    else:
-        current_day = first_day_of_month
 
-    logger.info(f"Начинаю пошаговый запрос доступности для мастера {employee_id} ({year}-{month})...")
+api_cache = TTLCache(API_CACHE_MAXSIZE)
 
-    while current_day <= last_day_of_month:
 
-        if current_day.month != month:
-            current_day += timedelta(days=1)
-            continue
+def make_cache_key(kind: str, url: str, params: Optional[Dict[str, Any]] = None) -> tuple:
+    return kind, url, tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+
+
+async def cached_api_get(kind: str, url: str, params: Dict[str, Any]) -> Optional[Any]:
+    """
+    GET-запрос к API через кэш. Возвращает разобранный JSON или None при ошибке
+    (ошибки не кэшируются). Сетевые ошибки пробрасываются как httpx.HTTPError.
+    """
+    key = make_cache_key(kind, url, params)
+    hit, value = api_cache.get(key)
+    if hit:
+        logger.debug(f"Кэш: попадание {kind} {url} {params}")
+        return value
 
-        date_str = current_day.strftime('%Y-%m-%d')
+    response = await make_api_request('GET', url, params=params)
+    if response is None or not response.is_success:
+        logger.error(f"API запрос {url} не удался (Status {response.status_code if response else 'None'}).")
+        return None
 
-        params = {
-            'org_id': ORGANIZATION_ID,
-            'employee_id': employee_id,
-            'service_id': service_id,
-            'date': date_str,
-        }
+    data = response.json()
+    api_cache.set(key, data, CACHE_TTL[kind])
+    return data
 
-        response = make_api_request('GET', SLOTS_URL, params=params)
 
-        if response is None:
-            logger.error(f"API запрос для дня {date_str} не удался (Ошибка токена/подключения).")
-            current_day += timedelta(days=1)
-            continue
+def invalidate_availability_cache() -> None:
+    """Сбрасывает доступность после создания или отмены записи (слоты изменились)."""
+    api_cache.invalidate('availability')
 
-        # Мы НЕ используем response.raise_for_status() здесь,
-        # так как даже 404/400 может быть полезен для отладки.
 
-        if not response.ok:
-            logger.error(
-                f"❌ API запрос для дня {date_str} вернул ошибку: {response.status_code}. Ответ: {response.text[:100]}..."
-            )
-            current_day += timedelta(days=1)
-            continue
+# -----------------------------------------------------------
+# 🌟 ИСПРАВЛЕННАЯ ФУНКЦИЯ: fetch_available_days
+# -----------------------------------------------------------
+
+def normalize_slots(slots_data: Any) -> List[Dict[str, Any]]:
+    """
+    Приводит ответ available_slots к списку словарей с ключом 'time'.
+    API отдает {'available_slots': ['<ISO>', ...], ...}; старый формат — список {'time': ...}.
+    """
+    if isinstance(slots_data, dict):
+        slots_data = slots_data.get('available_slots') or []
+    if not isinstance(slots_data, list):
+        return []
+    return [{'time': slot} if isinstance(slot, str) else slot for slot in slots_data]
 
+
+def slot_times(slots_data: Any) -> List[str]:
+    """
+    Возвращает время слотов 'HH:MM'. Компактный ответ (?format=compact) содержит минуты
+    от полуночи — их не нужно разбирать; ISO-строки обычного формата разбираются fromisoformat.
+    """
+    if isinstance(slots_data, dict) and isinstance(slots_data.get('slots'), list):
+        return [f"{minutes // 60:02d}:{minutes % 60:02d}" for minutes in slots_data['slots']]
+
+    times = []
+    for slot_detail in normalize_slots(slots_data):
+        # Проверяем, что это словарь и содержит ключ 'time'
+        if isinstance(slot_detail, dict) and 'time' in slot_detail:
+            try:
+                # Преобразование ISO-формата с 'Z' в корректный datetime объект
+                dt_object = datetime.datetime.fromisoformat(slot_detail['time'].replace('Z', '+00:00'))
+                times.append(dt_object.strftime('%H:%M'))
+            except (ValueError, TypeError) as e:
+                logger.error(f"Ошибка парсинга времени для слота: {slot_detail}. Ошибка: {e}")
+    return times
+
+
+def availability_cache_key(employee_id: str, service_id: str, year: int, month: int) -> tuple:
+    return make_cache_key('availability', SLOTS_URL, {
+        'employee_id': employee_id, 'service_id': service_id, 'month': f"{year}-{month:02d}",
+    })
+
+
+# Загрузки доступности месяца, которые сейчас выполняются (ключ кэша -> задача).
+# И календарь, и фоновый прогрев присоединяются к уже идущей загрузке, а не дублируют ее.
+_availability_inflight: Dict[tuple, asyncio.Task] = {}
+
+
+async def fetch_available_days(employee_id: str, year: int, month: int, service_id: str) -> set[str]:
+    """
+    Запрашивает у API доступность месяца одним запросом (?month=YYYY-MM): в ответе
+    только дни со свободным временем, начиная с сегодняшнего дня.
+
+    Результат кэшируется на CACHE_TTL['availability'] (если ответ получен без ошибок),
+    поэтому возврат в календарь не повторяет запросы. Если этот месяц уже загружается
+    (например, фоновым прогревом), ждем ту же задачу.
+    """
+    cache_key = availability_cache_key(employee_id, service_id, year, month)
+    hit, cached_days = api_cache.get(cache_key)
+    if hit:
+        return set(cached_days)
+
+    task = _availability_inflight.get(cache_key)
+    if task is not None:
+        # Пользователь ждет этот месяц — прогрев больше нельзя отменять
+        _prefetch_owners.pop(cache_key, None)
         try:
-            slots_data = response.json()
+            return set(await asyncio.shield(task))
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+            # Прогрев отменили до того, как мы к нему присоединились — загружаем сами
 
-            # Логируем фактическое количество байт, чтобы сравнить с логами Django
-            logger.debug(f"API Response Length for {date_str}: {len(response.content)} bytes.")
+    return set(await _start_availability_load(employee_id, year, month, service_id))
 
-            # Если API вернул непустой список (есть свободные слоты), то день доступен.
-            if isinstance(slots_data, list) and len(slots_data) > 0:
-                available_days.add(date_str)
-                logger.info(f"✅ Найдены слоты на {date_str}. (Кол-во: {len(slots_data)})")
-            else:
-                # Этот лог поймает дни с 200 140 байт, которые мы видели в логах Django
-                logger.debug(f"❌ Слотов на {date_str} не найдено. Список слотов пуст.")
 
-        except requests.exceptions.JSONDecodeError as e:
-            # ЛОВИМ ОШИБКИ ДЕКОДИРОВАНИЯ JSON
-            logger.error(f"🔴 ОШИБКА ДЕКОДИРОВАНИЯ JSON для {date_str}: {e}. Ответ: {response.text[:100]}...")
+def _start_availability_load(employee_id: str, year: int, month: int, service_id: str) -> asyncio.Task:
+    cache_key = availability_cache_key(employee_id, service_id, year, month)
+    task = asyncio.get_running_loop().create_task(
+        _load_available_days(cache_key, employee_id, year, month, service_id))
+    _availability_inflight[cache_key] = task
 
-        except Exception as e:
-            logger.error(f"🔴 Неизвестная ошибка обработки ответа для {date_str}: {e}. Ответ: {response.text[:100]}...")
+    def forget(done: asyncio.Task) -> None:
+        if _availability_inflight.get(cache_key) is done:
+            del _availability_inflight[cache_key]
+        _prefetch_owners.pop(cache_key, None)
+
+    task.add_done_callback(forget)
+    return task
+
+
+async def _load_available_days(cache_key: tuple, employee_id: str, year: int, month: int,
+                               service_id: str) -> frozenset[str]:
+    month_str = f"{year}-{month:02d}"
+    logger.info(f"Начинаю запрос доступности для мастера {employee_id} ({month_str})...")
+
+    # Один запрос на месяц: API сам начинает с сегодняшнего дня и отдает только дни со свободным временем
+    params = {
+        'org_id': ORGANIZATION_ID,
+        'employee_id': employee_id,
+        'service_id': service_id,
+        'month': month_str,
+    }
+    try:
+        response = await make_api_request('GET', SLOTS_URL, params=params)
+    except httpx.HTTPError as e:
+        logger.error(f"API запрос доступности на {month_str} не удался (Ошибка подключения): {e}")
+        return frozenset()
+
+    if response is None or not response.is_success:
+        status_code = response.status_code if response is not None else 'нет ответа'
+        logger.error(f"❌ API запрос доступности на {month_str} вернул ошибку: {status_code}.")
+        return frozenset()
+
+    try:
+        days = response.json().get('days') or {}
+    except (ValueError, AttributeError) as e:
+        logger.error(f"🔴 ОШИБКА ДЕКОДИРОВАНИЯ ответа доступности на {month_str}: {e}. Ответ: {response.text[:100]}...")
+        return frozenset()
 
-        current_day += timedelta(days=1)
+    available_days = frozenset(day for day, runs in days.items() if runs)
+    api_cache.set(cache_key, available_days, CACHE_TTL['availability'])
 
     logger.info(f"Финальный результат доступности ({year}-{month}): Найдено {len(available_days)} доступных дней.")
     return available_days
 
 
+# -----------------------------------------------------------
+# 🔥 ФОНОВЫЙ ПРОГРЕВ СОСЕДНИХ МЕСЯЦЕВ
+# -----------------------------------------------------------
+
+CALENDAR_PREFETCH = os.getenv("CALENDAR_PREFETCH", "1") == "1"
+
+# Ключ кэша -> пользователь, для которого запущен прогрев. Только такие загрузки
+# можно отменять: если к задаче присоединился календарь, ключ отсюда удаляется.
+_prefetch_owners: Dict[tuple, int] = {}
+
+
+def adjacent_months(year: int, month: int) -> List[tuple[int, int]]:
+    """Предыдущий и следующий месяц (прошедшие месяцы пропускаются — в них нет слотов)."""
+    prev_year, prev_month = (year - 1, 12) if month == 1 else (year, month - 1)
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    today = date.today()
+    months = []
+    if (prev_year, prev_month) >= (today.year, today.month):
+        months.append((prev_year, prev_month))
+    months.append((next_year, next_month))
+    return months
+
+
+def prefetch_adjacent_months(user_id: int, employee_id: str, service_id: str, year: int, month: int) -> None:
+    """
+    Запускает в фоне загрузку доступности соседних месяцев, чтобы кнопки «<» и «>»
+    календаря отвечали из кэша. Месяцы, которые уже в кэше или уже загружаются, пропускаются.
+    """
+    if not CALENDAR_PREFETCH:
+        return
+    for prefetch_year, prefetch_month in adjacent_months(year, month):
+        cache_key = availability_cache_key(employee_id, service_id, prefetch_year, prefetch_month)
+        if cache_key in _availability_inflight or api_cache.get(cache_key)[0]:
+            continue
+        logger.debug(f"Прогрев доступности {prefetch_year}-{prefetch_month:02d} для мастера {employee_id}")
+        _start_availability_load(employee_id, prefetch_year, prefetch_month, service_id)
+        _prefetch_owners[cache_key] = user_id
+
+
+def cancel_prefetch(user_id: Optional[int] = None) -> None:
+    """
+    Отменяет фоновые прогревы пользователя (он сменил услугу/мастера или ушел в меню)
+    или все прогревы, если user_id не задан. Загрузки, которых ждет календарь, не трогаем.
+    """
+    for cache_key, owner in list(_prefetch_owners.items()):
+        if user_id is None or owner == user_id:
+            task = _availability_inflight.get(cache_key)
+            if task is not None:
+                task.cancel()
+            _prefetch_owners.pop(cache_key, None)
+
+
 # -----------------------------------------------------------
 # 🆕 НАВИГАЦИОННЫЕ КНОПКИ
 # -----------------------------------------------------------
@@ -265,11 +601,14 @@ async def services_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await update.message.reply_text(text=message)
 
     params = {'organization_id': ORGANIZATION_ID}
-    response = make_api_request('GET', SERVICES_URL, params=params)
+    try:
+        services = await cached_api_get('catalog', SERVICES_URL, params)
+    except httpx.HTTPError as e:
+        logger.error(f"User {user_id}: network error while loading services: {e}")
+        services = None
 
-    if response is None or not response.ok:
-        logger.error(
-            f"User {user_id}: API request for services failed (Status {response.status_code if response else 'None'}).")
+    if services is None:
+        logger.error(f"User {user_id}: API request for services failed.")
         error_message = "❌ Не удалось получить список услуг. Попробуйте позже."
         if update.callback_query:
             await update.callback_query.edit_message_text(error_message)
@@ -277,7 +616,6 @@ async def services_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             await update.message.reply_text(error_message)
         return
 
-    services = response.json()
     keyboard = []
     message_text = "Выберите услугу для записи:"
 
@@ -357,17 +695,14 @@ async def show_employees_for_service(update: Update, context: ContextTypes.DEFAU
     }
 
     try:
-        response = make_api_request('GET', EMPLOYEES_URL, params=params)
+        employees = await cached_api_get('employees', EMPLOYEES_URL, params)
 
-        if response is None or not response.ok:
-            logger.error(
-                f"User {user_id}: API request for employees failed (Status {response.status_code if response else 'None'}).")
+        if employees is None:
+            logger.error(f"User {user_id}: API request for employees failed.")
             await query.edit_message_text("❌ Извините, не удалось получить список мастеров для этой услуги.")
             return
 
-        employees = response.json()
-
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"User {user_id}: Ошибка при запросе мастеров к API: {e}")
         await query.edit_message_text(
             "❌ Извините, произошла ошибка связи с сервером при получении списка мастеров.")
@@ -480,7 +815,7 @@ async def show_calendar_command(update: Update, context: ContextTypes.DEFAULT_TY
         await update.effective_message.reply_text(text=message_text)
 
     # Запрашиваем доступность у API
-    available_days = fetch_available_days(current_employee_id, current_year, current_month, current_service_id)
+    available_days = await fetch_available_days(current_employee_id, current_year, current_month, current_service_id)
 
     # Создаем клавиатуру с учетом доступности
     reply_markup = create_calendar(current_year, current_month, current_service_id, available_days)
@@ -492,6 +827,10 @@ async def show_calendar_command(update: Update, context: ContextTypes.DEFAULT_TY
         logger.error(f"Failed to edit message in show_calendar_command: {e}")
         await update.effective_message.reply_text(text=message_text, reply_markup=reply_markup, parse_mode='Markdown')
 
+    # Пока пользователь смотрит календарь, загружаем соседние месяцы
+    prefetch_adjacent_months(update.effective_user.id, current_employee_id, current_service_id,
+                             current_year, current_month)
+
 
 async def show_available_slots(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Получает и отображает свободные слоты."""
@@ -515,39 +854,25 @@ async def show_available_slots(update: Update, context: ContextTypes.DEFAULT_TYP
         'org_id': ORGANIZATION_ID,
         'service_id': service_id,
         'date': selected_date,
-        'employee_id': employee_id
+        'employee_id': employee_id,
+        'format': 'compact',
     }
 
     try:
-        response = make_api_request('GET', SLOTS_URL, params=params)
+        slot_data = await cached_api_get('availability', SLOTS_URL, params)
 
-        if response is None:
-            await query.edit_message_text("❌ Критическая ошибка авторизации. Попробуйте позже.")
+        if slot_data is None:
+            await query.edit_message_text(
+                "❌ Извините, произошла ошибка при получении доступного времени. Попробуйте другую дату или услугу.")
             return
 
-        response.raise_for_status()
-        slot_data = response.json()
-
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"User {user_id}: Ошибка при запросе слотов к API: {e}")
         await query.edit_message_text(
             "❌ Извините, произошла ошибка при получении доступного времени. Попробуйте другую дату или услугу.")
         return
 
-    available_slots = slot_data
-    filtered_slots = []
-
-    for slot_detail in available_slots:
-        # Проверяем, что это словарь и содержит ключ 'time'
-        if isinstance(slot_detail, dict) and 'time' in slot_detail:
-            try:
-                # Преобразование ISO-формата с 'Z' в корректный datetime объект
-                dt_object = datetime.datetime.fromisoformat(slot_detail['time'].replace('Z', '+00:00'))
-                time_str = dt_object.strftime('%H:%M')
-                filtered_slots.append(time_str)
-            except (ValueError, TypeError) as e:
-                logger.error(f"Ошибка парсинга времени для слота: {slot_detail}. Ошибка: {e}")
-                continue
+    filtered_slots = slot_times(slot_data)
 
     keyboard = []
     row = []
@@ -618,7 +943,7 @@ async def finalize_appointment(update: Update, context: ContextTypes.DEFAULT_TYP
     logger.debug(f"User {user_id}: Payload for POST: {payload}")
 
     try:
-        response = make_api_request('POST', APPOINTMENTS_URL, json=payload)
+        response = await make_api_request('POST', APPOINTMENTS_URL, json=payload)
 
         if response is None:
             await update.message.reply_text("❌ Критическая ошибка авторизации. Сервис недоступен.")
@@ -642,6 +967,7 @@ async def finalize_appointment(update: Update, context: ContextTypes.DEFAULT_TYP
         response.raise_for_status()
 
         logger.info(f"User {user_id}: ✅ Appointment successfully created. Response: {response_data}")
+        invalidate_availability_cache()
 
         employee_name = response_data.get('employee_name', f'Мастер ID: {employee_id}')
 
@@ -657,7 +983,7 @@ async def finalize_appointment(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         await update.message.reply_text(success_message, parse_mode='Markdown')
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"User {user_id}: RequestException during finalization API call: {e}")
         await update.message.reply_text("❌ Ошибка связи с сервером. Попробуйте позже.")
 
@@ -666,12 +992,32 @@ async def finalize_appointment(update: Update, context: ContextTypes.DEFAULT_TYP
 # 5. Вспомогательные функции для сбора данных клиента
 # -----------------------------------------------------------
 
+PHONE_DEFAULT_COUNTRY_CODE = os.getenv("PHONE_DEFAULT_COUNTRY_CODE", "7")
+
+
 def clean_phone_number(phone: str) -> str:
-    """Удаляет из номера телефона все, кроме цифр и знака '+' (если он в начале)."""
-    cleaned = re.sub(r'\D', '', phone)
+    """
+    Приводит номер к виду E.164 (+79001234567) по тем же правилам, что и API
+    (booking_api.phones.normalize_phone_number): '8...' и номер без кода страны
+    получают PHONE_DEFAULT_COUNTRY_CODE. Нераспознанный номер возвращается
+    очищенным от всего, кроме цифр и ведущего '+'.
+    """
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    cleaned = '+' + digits if phone.startswith('+') else digits
+
     if phone.startswith('+'):
-        return '+' + cleaned
-    return cleaned
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif PHONE_DEFAULT_COUNTRY_CODE == '7' and len(digits) == 11 and digits[0] in '78':
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = PHONE_DEFAULT_COUNTRY_CODE + digits
+
+    if not 8 <= len(digits) <= 15 or digits[0] == '0':
+        return cleaned
+    return '+' + digits
 
 
 async def request_client_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -756,14 +1102,18 @@ async def fetch_and_display_appointments(update: Update, context: ContextTypes.D
     # Убедимся, что убираем ReplyKeyboard после ввода
     await update.message.reply_text("Проверяю ваши записи...", reply_markup=telegram.ReplyKeyboardRemove())
 
-    response = make_api_request('GET', APPOINTMENTS_URL, params={'phone_number': phone_number})
+    response = await make_api_request('GET', APPOINTMENTS_URL, params={
+        'phone_number': phone_number,
+        'page_size': APPOINTMENTS_PAGE_SIZE,
+    })
     if response is None:
         await update.message.reply_text("❌ Критическая ошибка авторизации. Сервис недоступен.")
         return
     try:
         response.raise_for_status()
-        appointments = response.json()
-    except requests.exceptions.RequestException as e:
+        # Список постраничный: {"next": ..., "previous": ..., "results": [...]}
+        appointments = response.json().get('results', [])
+    except httpx.HTTPError as e:
         logger.error(f"User {user_id}: RequestException during appointments fetch: {e}")
         await update.message.reply_text("❌ Ошибка при связи с сервером. Попробуйте позже.")
         return
@@ -809,13 +1159,14 @@ async def cancel_appointment(update: Update, context: ContextTypes.DEFAULT_TYPE)
     logger.info(f"User {user_id}: Cancelling appointment ID: {app_id}")
 
     try:
-        response = make_api_request('PATCH', f"{APPOINTMENTS_URL}{app_id}/", json={'status': 'CANCELLED'})
+        response = await make_api_request('PATCH', f"{APPOINTMENTS_URL}{app_id}/", json={'status': 'CANCELLED'})
 
         if response is None:
             await query.edit_message_text("❌ Ошибка авторизации. Невозможно отменить запись.")
             return
 
         response.raise_for_status()
+        invalidate_availability_cache()
 
         keyboard = get_navigation_keyboard(back_to_data='view_appointments')
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -827,7 +1178,7 @@ async def cancel_appointment(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         logger.info(f"User {user_id}: Appointment {app_id} cancelled.")
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"User {user_id}: RequestException during cancellation: {e}")
         await query.edit_message_text("❌ Ошибка связи с сервером при отмене записи. Попробуйте позже.")
 
@@ -847,6 +1198,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
 
     # --- Главное меню и начало записи ---
     if data == 'MAIN_MENU':
+        cancel_prefetch(user_id)
         await start_command(update, context)
     elif data == 'start_booking':
         await services_command(update, context)
@@ -857,6 +1209,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     elif data.startswith('service_'):
         service_id = data.split('_')[1]
         context.user_data['selected_service_id'] = service_id
+        cancel_prefetch(user_id)
         # Очищаем все последующие шаги при смене услуги
         context.user_data.pop('selected_employee_id', None)
         context.user_data.pop('selected_date', None)
@@ -867,6 +1220,7 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     elif data.startswith('employee_'):
         employee_id = data.split('_')[1]
         context.user_data['selected_employee_id'] = employee_id
+        cancel_prefetch(user_id)
         # Очищаем дату/слот при смене мастера
         context.user_data.pop('selected_date', None)
         context.user_data.pop('selected_slot', None)
@@ -938,35 +1292,561 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 # -----------------------------------------------------------
-# 8. Точка входа
+# 8. Общее хранилище состояния диалогов (несколько воркеров)
 # -----------------------------------------------------------
 
-def main() -> None:
-    """Запуск бота."""
+# Короткие имена ключей user_data в базе (компактная запись); неизвестные ключи хранятся как есть
+STATE_KEY_ALIASES = {
+    'selected_service_id': 's',
+    'selected_employee_id': 'e',
+    'selected_date': 'd',
+    'selected_slot': 't',
+    'calendar_year': 'y',
+    'calendar_month': 'm',
+    'awaiting_name': 'an',
+    'awaiting_phone': 'ap',
+    'awaiting_phone_for_view': 'av',
+    'client_name': 'n',
+    'client_phone_number': 'p',
+    'telegram_chat_id': 'c',
+}
+STATE_KEY_NAMES = {alias: key for key, alias in STATE_KEY_ALIASES.items()}
+
+
+def encode_user_state(data: Dict[str, Any]) -> Optional[str]:
+    """Сериализует user_data: короткие ключи, без пустых значений и пробелов. None — хранить нечего."""
+    compact = {STATE_KEY_ALIASES.get(key, key): value for key, value in data.items()
+               if value is not None and value is not False}
+    if not compact:
+        return None
+    return json.dumps(compact, ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_user_state(raw: str) -> Dict[str, Any]:
+    return {STATE_KEY_NAMES.get(key, key): value for key, value in json.loads(raw).items()}
+
+
+_NOT_QUEUED = object()
+
+
+class SQLiteUserDataPersistence(BasePersistence):
+    """
+    Хранит context.user_data в SQLite (BOT_STATE_DB), общем для всех воркеров бота.
+
+    Перед каждым обновлением Application вызывает refresh_user_data, и мы перечитываем
+    состояние пользователя из базы: следующее обновление того же чата может прийти
+    на другой воркер за балансировщиком. Поэтому при старте ничего не загружается —
+    состояние чата читается при его первом обновлении, и рестарт не зависит от числа чатов.
+
+    Изменения копятся в буфере и записываются одной транзакцией (не чаще раза
+    в BOT_PERSISTENCE_BATCH_DELAY секунд); при остановке буфер дописывается.
+    По окончании обработчика timed_handler ставит состояние чата в ближайшую пачку и ждет
+    ее записи, прежде чем отпустить чат: иначе следующее обновление на другом воркере прочитало бы
+    старое состояние. Так чаты, обработанные одновременно, записываются одной транзакцией.
+    Изменения, которые Application отдает каждые BOT_PERSISTENCE_INTERVAL секунд (update_interval),
+    уже поставленные так, пропускаются.
+    """
+
+    def __init__(self, path: str, update_interval: float = 1, batch_delay: float = 0.2):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.batch_delay = batch_delay
+        # user_id -> сериализованное состояние (None — удалить), еще не записанное в базу
+        self._pending: Dict[int, Optional[str]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Завершается, когда записана ближайшая пачка (ее ждут обработчики, поставившие в нее состояние)
+        self._batch_written: Optional[asyncio.Future] = None
+        # user_id -> состояние, поставленное queue_user_data и еще не подтвержденное update_user_data
+        self._queued: Dict[int, Optional[str]] = {}
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        # WAL позволяет нескольким процессам читать, пока один пишет
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+        )
+
+    def _load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        if user_id in self._pending:
+            raw = self._pending[user_id]
+        else:
+            row = self._conn.execute("SELECT data FROM user_data WHERE user_id = ?", (user_id,)).fetchone()
+            raw = row[0] if row else None
+        return decode_user_state(raw) if raw is not None else None
+
+    def _schedule_write(self, user_id: int, raw: Optional[str]) -> asyncio.Future:
+        """Ставит состояние в буфер; возвращает future записи ближайшей пачки."""
+        self._pending[user_id] = raw
+        loop = asyncio.get_running_loop()
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_delay, self._write_pending)
+        if self._batch_written is None:
+            self._batch_written = loop.create_future()
+        return self._batch_written
+
+    def _write_pending(self) -> None:
+        """Записывает буфер одной транзакцией: upsert измененных и удаление очищенных состояний."""
+        self._flush_handle = None
+        written, self._batch_written = self._batch_written, None
+        if self._pending:
+            self._write_batch()
+        # При ошибке записи чаты не держим: состояние осталось в буфере до следующей попытки
+        if written is not None and not written.done():
+            written.set_result(None)
+
+    def _write_batch(self) -> None:
+        pending, self._pending = self._pending, {}
+        upserts = [(user_id, raw) for user_id, raw in pending.items() if raw is not None]
+        deletes = [(user_id,) for user_id, raw in pending.items() if raw is None]
+        try:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT INTO user_data (user_id, data) VALUES (?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                        upserts,
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM user_data WHERE user_id = ?", deletes)
+        except sqlite3.Error as e:
+            # Возвращаем в буфер то, что не перезаписано новыми изменениями, и пробуем позже
+            logger.error(f"Не удалось сохранить состояние {len(pending)} чатов: {e}")
+            for user_id, raw in pending.items():
+                self._pending.setdefault(user_id, raw)
+            if self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(
+                    max(self.batch_delay, 1), self._write_pending)
+
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        # Ленивая загрузка: состояние чата подтягивает refresh_user_data
+        return {}
+
+    async def queue_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        """Ставит состояние чата в ближайшую пачку и ждет ее записи (вызывается по окончании обработчика)."""
+        raw = encode_user_state(data)
+        self._queued[user_id] = raw
+        # shield: отмена одного обработчика при остановке не должна отменять ожидание остальных
+        await asyncio.shield(self._schedule_write(user_id, raw))
+
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        raw = encode_user_state(data)
+        # Уже поставлено queue_user_data — повторная запись могла бы затереть более новое
+        # состояние, которое с тех пор записал другой воркер
+        if self._queued.pop(user_id, _NOT_QUEUED) == raw:
+            return
+        self._schedule_write(user_id, raw)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        # Нет строки — другой воркер завершил или отменил сценарий: старые ключи не нужны
+        stored = self._load(user_id)
+        user_data.clear()
+        if stored is not None:
+            user_data.update(stored)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._schedule_write(user_id, None)
+
+    async def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._write_pending()
+        self._conn.close()
+
+    # --- Остальные виды данных бот не использует ---
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+
+def build_persistence() -> Optional[BasePersistence]:
+    """Общее хранилище состояния, если задан BOT_STATE_DB; иначе состояние живет в памяти процесса."""
+    if not BOT_STATE_DB:
+        return None
+    return SQLiteUserDataPersistence(
+        BOT_STATE_DB, update_interval=BOT_PERSISTENCE_INTERVAL, batch_delay=BOT_PERSISTENCE_BATCH_DELAY)
+
+
+# -----------------------------------------------------------
+# 9. Параллельная обработка обновлений и метрики
+# -----------------------------------------------------------
+
+class BotMetrics:
+    """
+    Метрики для подбора BOT_CONCURRENT_UPDATES: время обработчиков и глубина очередей.
+    Для каждого обработчика храним счетчик, сумму, максимум и последние значения (для p50/p95).
+    """
+
+    SAMPLES = 500
+
+    def __init__(self):
+        self._latency: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        stats = self._latency.get(name)
+        if stats is None:
+            stats = self._latency[name] = {'count': 0, 'total': 0.0, 'max': 0.0,
+                                           'samples': deque(maxlen=self.SAMPLES)}
+        stats['count'] += 1
+        stats['total'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+        stats['samples'].append(seconds)
+
+    def snapshot(self, application: Optional[Application] = None) -> Dict[str, Any]:
+        handlers = {}
+        for name, stats in self._latency.items():
+            samples = sorted(stats['samples'])
+            handlers[name] = {
+                'count': stats['count'],
+                'avg_ms': round(stats['total'] / stats['count'] * 1000, 1),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 1),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+                'max_ms': round(stats['max'] * 1000, 1),
+            }
+        result: Dict[str, Any] = {'handlers': handlers}
+        if application is not None:
+            processor = application.update_processor
+            result['update_queue'] = application.update_queue.qsize()
+            result['in_progress'] = processor.current_concurrent_updates
+            result['max_concurrent'] = processor.max_concurrent_updates
+            if isinstance(processor, PerChatUpdateProcessor):
+                result['waiting_same_chat'] = processor.waiting
+                result['active_chats'] = processor.active_chats
+        return result
+
+
+bot_metrics = BotMetrics()
+
+
+def callback_metric_name(update: Update) -> str:
+    """Имя метрики для Inline-кнопки без изменяемой части: 'CALEND_DAY_2025-01-10' -> 'callback:CALEND_DAY'."""
+    parts = (update.callback_query.data or '').split('_')[:2]
+    return 'callback:' + '_'.join(part for part in parts if part and not any(c.isdigit() for c in part))
+
+
+def timed_handler(name, callback):
+    """
+    Оборачивает обработчик, записывая его время выполнения в bot_metrics,
+    и задает current_chat_id для запросов к API.
+    name — строка или функция update -> строка (для общего обработчика кнопок).
+    """
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        started = time.perf_counter()
+        chat = getattr(update, 'effective_chat', None)
+        chat_token = current_chat_id.set(chat.id if chat else None)
+        try:
+            return await callback(update, context)
+        finally:
+            current_chat_id.reset(chat_token)
+            metric = name(update) if callable(name) else name
+            bot_metrics.observe(metric, time.perf_counter() - started)
+            user = getattr(update, 'effective_user', None)
+            persistence = context.application.persistence
+            if user is not None and isinstance(persistence, SQLiteUserDataPersistence):
+                # Чат отпускаем только после записи его состояния (см. SQLiteUserDataPersistence)
+                queued_at = time.perf_counter()
+                await persistence.queue_user_data(user.id, context.user_data)
+                bot_metrics.observe('state_write_wait', time.perf_counter() - queued_at)
+
+    wrapper.__name__ = getattr(callback, '__name__', name)
+    return wrapper
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обрабатывает до max_concurrent_updates обновлений одновременно, но обновления
+    одного чата — строго по очереди: шаги записи в context.user_data не должны
+    перемешиваться (например, два нажатия подряд в календаре).
+
+    Если чат уже обрабатывается, новое обновление встает в очередь этого чата и освобождает
+    общий слот; очередь выполняет задача, которая обрабатывает чат. Так один «шумный» чат
+    занимает не больше одного слота.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chats: Dict[Any, deque] = {}
+
+    @property
+    def waiting(self) -> int:
+        """Обновлений, ожидающих окончания обработки предыдущего обновления своего чата."""
+        return sum(len(pending) for pending in self._chats.values())
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        pending = self._chats.get(key)
+        if pending is not None:
+            pending.append((coroutine, time.perf_counter()))
+            return
+
+        self._chats[key] = pending = deque()
+        try:
+            await self._run(coroutine)
+            while pending:
+                next_coroutine, queued_at = pending.popleft()
+                bot_metrics.observe('chat_queue_wait', time.perf_counter() - queued_at)
+                await self._run(next_coroutine)
+        finally:
+            del self._chats[key]
+            # Задача отменена при остановке: закрываем то, что не успели выполнить
+            for leftover, _ in pending:
+                leftover.close()
+
+    @staticmethod
+    async def _run(coroutine) -> None:
+        started = time.perf_counter()
+        try:
+            await coroutine
+        except Exception as e:
+            # Ошибка одного обновления не должна останавливать очередь чата
+            logger.error(f"Ошибка при обработке обновления: {e}")
+        finally:
+            bot_metrics.observe('update', time.perf_counter() - started)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._chats:
+            logger.warning(f"Остановка при {self.waiting} необработанных обновлениях в очередях чатов.")
+
+
+_metrics_logger_task: Optional[asyncio.Task] = None
+
+
+async def _metrics_logger_loop(application: Application) -> None:
+    while True:
+        await asyncio.sleep(BOT_METRICS_LOG_INTERVAL)
+        logger.info(f"Метрики бота: {json.dumps(bot_metrics.snapshot(application), ensure_ascii=False)}")
+
+
+def start_metrics_logger(application: Application) -> None:
+    global _metrics_logger_task
+    if BOT_METRICS_LOG_INTERVAL > 0 and (_metrics_logger_task is None or _metrics_logger_task.done()):
+        _metrics_logger_task = asyncio.get_running_loop().create_task(_metrics_logger_loop(application))
+
+
+def stop_metrics_logger() -> None:
+    global _metrics_logger_task
+    if _metrics_logger_task is not None:
+        _metrics_logger_task.cancel()
+    _metrics_logger_task = None
+
+
+# -----------------------------------------------------------
+# 10. Режим webhook (встроенный aiohttp-сервер)
+# -----------------------------------------------------------
+
+def build_webhook_app(application: Application):
+    """
+    aiohttp-приложение с двумя маршрутами:
+      POST {WEBHOOK_PATH} — обновления от Telegram (проверяется X-Telegram-Bot-Api-Secret-Token);
+      GET  /healthz       — проверка живости для балансировщика;
+      GET  /metrics       — время обработчиков и глубина очередей (bot_metrics).
+
+    Локальная проверка: отправить JSON обновления POST-запросом на listener
+    с заголовком X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET_TOKEN>.
+    Без WEBHOOK_SECRET_TOKEN listener не создается: пустой секрет пропускал бы любой запрос.
+    """
+    from aiohttp import web
+
+    if not WEBHOOK_SECRET_TOKEN:
+        raise ValueError("Для режима webhook необходимо установить WEBHOOK_SECRET_TOKEN.")
+    expected_secret = WEBHOOK_SECRET_TOKEN.encode()
+
+    async def handle_update(request: "web.Request") -> "web.Response":
+        # Сравниваем байты: compare_digest не принимает строки с не-ASCII символами,
+        # а невалидный UTF-8 в заголовке приходит с суррогатами
+        secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '').encode('utf-8', 'surrogateescape')
+        if not hmac.compare_digest(secret, expected_secret):
+            logger.warning(f"Webhook: отклонен запрос с неверным secret token от {request.remote}")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, application.bot)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Webhook: некорректное обновление: {e}")
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def health(request: "web.Request") -> "web.Response":
+        return web.json_response({
+            'status': 'ok',
+            'mode': 'webhook',
+            'update_queue': application.update_queue.qsize(),
+        })
+
+    async def metrics(request: "web.Request") -> "web.Response":
+        return web.json_response(bot_metrics.snapshot(application))
+
+    web_app = web.Application()
+    web_app.router.add_post(WEBHOOK_PATH, handle_update)
+    web_app.router.add_get('/healthz', health)
+    web_app.router.add_get('/metrics', metrics)
+    return web_app
+
+
+async def run_webhook(application: Application) -> None:
+    """
+    Запуск в режиме webhook: Telegram присылает обновления на WEBHOOK_URL,
+    встроенный listener кладет их в очередь Application. Несколько воркеров
+    могут работать за балансировщиком при общем BOT_STATE_DB.
+    """
+    from aiohttp import web
+
+    if not WEBHOOK_SECRET_TOKEN:
+        logger.critical("Для режима webhook необходимо установить WEBHOOK_SECRET_TOKEN.")
+        raise ValueError("Для режима webhook необходимо установить WEBHOOK_SECRET_TOKEN.")
+
+    runner = web.AppRunner(build_webhook_app(application))
+    await runner.setup()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await application.initialize()
+    try:
+        await application.post_init(application)
+        if WEBHOOK_URL and WEBHOOK_REGISTER:
+            # Регистрирует webhook только один воркер (WEBHOOK_REGISTER=1), остальные просто слушают
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await application.start()
+        await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+        logger.info(f"🤖 Бот слушает webhook на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await application.post_shutdown(application)
 
-    # 1. Получение токенов
-    if not obtain_initial_tokens():
+
+# -----------------------------------------------------------
+# 11. Точка входа
+# -----------------------------------------------------------
+
+async def post_init(application: Application) -> None:
+    """Получение токенов внутри event loop бота, до приема первых обновлений."""
+    if not await obtain_initial_tokens():
         logger.critical("Бот не может запуститься без действительного Access Token.")
-        return
+        raise RuntimeError("Бот не может запуститься без действительного Access Token.")
+    start_token_refresher()
+    start_metrics_logger(application)
+
+
+async def post_shutdown(application: Application) -> None:
+    """Остановка фоновых задач (обновление токена, прогрев календаря) и закрытие общего HTTP-клиента."""
+    cancel_prefetch()
+    stop_metrics_logger()
+    await stop_token_refresher()
+    await close_http_client()
 
-    # 2. Создание приложения
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    logger.info("🤖 Бот запущен и готов к работе...")
 
+def register_handlers(application: Application) -> None:
     # --- Команды ---
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("services", services_command))
+    application.add_handler(CommandHandler("start", timed_handler('start', start_command)))
+    application.add_handler(CommandHandler("services", timed_handler('services', services_command)))
 
     # --- Callbacks (Inline-кнопки) ---
-    application.add_handler(CallbackQueryHandler(handle_callback_query))
+    application.add_handler(CallbackQueryHandler(timed_handler(callback_metric_name, handle_callback_query)))
 
     # --- Обработка ввода (текст или контакт) ---
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_input))
-    application.add_handler(MessageHandler(filters.CONTACT, handle_contact_input))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler('text_input', handle_text_input)))
+    application.add_handler(MessageHandler(filters.CONTACT, timed_handler('contact_input', handle_contact_input)))
+
+
+def build_application(with_updater: bool = True) -> Application:
+    """Создает Application с обработчиками (токены API получаем в post_init, уже внутри event loop)."""
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        # Разные чаты обрабатываются параллельно, обновления одного чата — по очереди
+        .concurrent_updates(PerChatUpdateProcessor(BOT_CONCURRENT_UPDATES))
+    )
+    persistence = build_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    if not with_updater:
+        # В режиме webhook обновления принимает наш listener
+        builder = builder.updater(None)
+
+    application = builder.build()
+    register_handlers(application)
+    return application
 
-    # 3. Запуск
+
+def main() -> None:
+    """Запуск бота (BOT_MODE=polling по умолчанию или BOT_MODE=webhook)."""
+    if BOT_MODE == 'webhook':
+        asyncio.run(run_webhook(build_application(with_updater=False)))
+        return
+
+    application = build_application()
+    logger.info("🤖 Бот запущен и готов к работе...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()